@@ -1,24 +1,55 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
 from cofibot_llama import CofiBotLlama
+from ollama_connection import OllamaError
+from conversation_store import ConversationStore
+from metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, MetricsRegistry
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Optional
+import json
+import os
+import uuid
 
 # Modèles Pydantic
 class ChatMessage(BaseModel):
     message: str
+    # Identifiant de conversation ; absent = nouvelle session, renvoyée dans la réponse
+    session_id: Optional[str] = Field(None, min_length=1, max_length=128)
 
 class ChatResponse(BaseModel):
     response: str
     model: str
     timestamp: str
     success: bool
+    session_id: str
+    cached: bool = False  # Réponse servie par le cache de générations
+
+# Journal durable des conversations (chaîne vide pour le désactiver)
+CONVERSATION_DB = os.getenv("COFIBOT_CONVERSATION_DB", "data/conversations.db")
+conversation_store = ConversationStore(CONVERSATION_DB) if CONVERSATION_DB else None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup
+    if conversation_store is not None:
+        conversation_store.start()
+    # Disponibilité d'Ollama sondée en arrière-plan, plus à chaque message
+    cofibot.start_probe()
+    yield
+    # Shutdown : écrire les derniers échanges en file
+    await cofibot.aclose()
+    if conversation_store is not None:
+        conversation_store.close()
 
 # Initialiser FastAPI
 app = FastAPI(
     title="CofiBot LLM Local API",
     description="API CofiBot avec Llama 3.2 3B local",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # CORS
@@ -30,13 +61,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métriques Prometheus (/metrics) : requêtes HTTP et durée de chaque étape de /chat
+metrics = MetricsRegistry()
+metrics.describe("http_requests_total", "counter", "Requêtes HTTP par route, méthode et statut")
+metrics.describe("http_request_duration_seconds", "histogram", "Durée des requêtes HTTP par route")
+metrics.describe("stage_duration_seconds", "histogram",
+                 "Durée des étapes de /chat (cache, availability, prompt, queue, generation, prefill, cleanup, history)")
+metrics.describe("chat_total", "counter", "Appels de /chat par résultat")
+metrics.describe("chat_stream_total", "counter", "Appels de /chat/stream par résultat")
+metrics.describe("ttft_seconds", "histogram", "Délai avant le premier token (/chat/stream)")
+metrics.describe("prefill_seconds", "histogram", "Préremplissage du prompt mesuré par Ollama (/chat/stream)")
+metrics.describe("tokens_per_second", "histogram", "Débit de génération (/chat/stream)",
+                 buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200))
+app.add_middleware(MetricsMiddleware, registry=metrics)
+
 # Initialiser CofiBot
-cofibot = CofiBotLlama()
+cofibot = CofiBotLlama(store=conversation_store)
 
 @app.get("/")
 async def root():
     """Point d'entrée de l'API"""
-    available, message = cofibot.is_available()
+    available, message = await cofibot.ais_available()
     
     return {
         "message": "🤖 CofiBot LLM Local API",
@@ -46,21 +91,24 @@ async def root():
         "details": message,
         "endpoints": {
             "chat": "/chat",
+            "stream": "/chat/stream",
             "health": "/health",
-            "stats": "/stats"
+            "stats": "/stats",
+            "metrics": "/metrics"
         }
     }
 
 @app.get("/health")
 async def health_check():
     """Vérification de l'état"""
-    available, message = cofibot.is_available()
+    available, message = await cofibot.ais_available()
     
     return {
         "status": "healthy" if available else "unhealthy",
         "model": cofibot.model,
         "available": available,
         "message": message,
+        "generations": cofibot.generation_stats(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -70,7 +118,13 @@ async def chat_endpoint(message: ChatMessage):
     if not message.message.strip():
         raise HTTPException(status_code=400, detail="Message vide")
     
-    result = cofibot.chat(message.message)
+    session_id = message.session_id or uuid.uuid4().hex
+    timings = {}
+    # Client asynchrone : /health et /stats restent servis pendant la génération
+    result = await cofibot.achat(message.message, timings, session_id=session_id)
+    for stage, seconds in timings.items():
+        metrics.observe("stage_duration_seconds", seconds, stage=stage)
+    metrics.inc("chat_total", outcome="success" if result["success"] else "error")
     
     if not result["success"]:
         raise HTTPException(status_code=503, detail=result["error"])
@@ -79,25 +133,115 @@ async def chat_endpoint(message: ChatMessage):
         response=result["response"],
         model=result["model"],
         timestamp=result["timestamp"],
-        success=True
+        success=True,
+        session_id=session_id,
+        cached=result["cached"]
     )
 
+def sse_event(event: str, data) -> str:
+    """Un événement Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(message: ChatMessage):
+    """Réponse relayée token par token en Server-Sent Events
+
+    Événements : "token" ({"text"}) au fil de la génération, puis "done"
+    (modèle, horodatage, ttft_s, prefill_s, tokens_per_s...) ou "error".
+    """
+    if not message.message.strip():
+        raise HTTPException(status_code=400, detail="Message vide")
+    
+    # Indisponibilité signalée par un vrai code HTTP, avant d'ouvrir le flux
+    available, error = await cofibot.ais_available()
+    if not available:
+        metrics.inc("chat_stream_total", outcome="error")
+        raise HTTPException(status_code=503, detail=error)
+    
+    session_id = message.session_id or uuid.uuid4().hex
+    
+    async def events():
+        stats = {}
+        try:
+            async for chunk in cofibot.astream(message.message, stats, session_id=session_id):
+                yield sse_event("token", {"text": chunk})
+        except OllamaError as e:
+            metrics.inc("chat_stream_total", outcome="error")
+            yield sse_event("error", {"error": str(e)})
+            return
+        
+        metrics.inc("chat_stream_total", outcome="success")
+        # Réponses du cache exclues : elles fausseraient le TTFT du modèle
+        if "ttft_s" in stats and not stats["cached"]:
+            metrics.observe("ttft_seconds", stats["ttft_s"])
+        if "prefill_s" in stats:
+            metrics.observe("prefill_seconds", stats["prefill_s"])
+        if "tokens_per_s" in stats:
+            metrics.observe("tokens_per_second", stats["tokens_per_s"])
+        yield sse_event("done", {"model": cofibot.model, "timestamp": datetime.now().isoformat(),
+                                 "session_id": session_id, **stats})
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def streaming_stats():
+    """TTFT, préremplissage et débit moyens des réponses en streaming"""
+    _, ttft_sum, count = metrics.histogram("ttft_seconds").snapshot()
+    _, prefill_sum, prefill_count = metrics.histogram("prefill_seconds").snapshot()
+    _, rate_sum, rate_count = metrics.histogram("tokens_per_second").snapshot()
+    return {
+        "streams": count,
+        "avg_ttft_ms": round(ttft_sum / count * 1000, 1) if count else None,
+        "avg_prefill_ms": round(prefill_sum / prefill_count * 1000, 1) if prefill_count else None,
+        "avg_tokens_per_s": round(rate_sum / rate_count, 1) if rate_count else None
+    }
+
 @app.get("/stats")
 async def get_stats():
     """Statistiques de l'API"""
     stats = cofibot.get_stats()
-    available, message = cofibot.is_available()
+    available, message = await cofibot.ais_available()
     
     return {
         **stats,
         "api_status": "ready" if available else "error",
-        "api_message": message
+        "api_message": message,
+        "streaming": streaming_stats()
     }
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Métriques au format texte Prometheus"""
+    gauges = [
+        ("model_info", 1, {"model": cofibot.model}),
+        ("sessions", len(cofibot.memory), {}),
+        ("session_memory_bytes", cofibot.memory.bytes, {}),
+        ("sessions_evicted_total", cofibot.memory.evicted, {}),
+        ("sessions_expired_total", cofibot.memory.expired, {}),
+        ("generations_in_flight", cofibot.in_flight, {}),
+        ("generations_waiting", cofibot.waiting, {}),
+    ]
+    if cofibot.cache is not None:
+        cache_stats = cofibot.cache.stats()
+        gauges += [
+            ("llm_cache_hits_total", cache_stats["hits"], {}),
+            ("llm_cache_near_hits_total", cache_stats["near_hits"], {}),
+            ("llm_cache_misses_total", cache_stats["misses"], {}),
+            ("llm_cache_size", cache_stats["size"], {}),
+            ("llm_cache_saved_seconds_total", cache_stats["saved_generation_s"], {}),
+        ]
+    if conversation_store is not None:
+        store_stats = conversation_store.stats()
+        gauges += [
+            ("conversation_store_pending", store_stats["pending"], {}),
+            ("conversation_store_dropped", store_stats["dropped"], {}),
+        ]
+    return Response(metrics.render(gauges), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.post("/clear")
-async def clear_history():
-    """Effacer l'historique"""
-    cofibot.clear_history()
+async def clear_history(session_id: str = Query(..., min_length=1, max_length=128)):
+    """Effacer l'historique d'une session (obligatoire : jamais celui des autres utilisateurs)"""
+    cofibot.clear_history(session_id)
     return {"message": "Historique effacé avec succès"}
 
 if __name__ == "__main__":
@@ -0,0 +1,293 @@
+"""
+Benchmark de charge de /chatbot.
+
+L'application est appelée en mémoire (transport ASGI, sans réseau) avec les
+patterns de nlp/intents.json comme corpus, légèrement modifiés pour ne pas
+être servis par le chemin exact_match (--exact pour les garder tels quels).
+Pour chaque mode d'exécution de
+l'inférence (inline = dans la boucle asyncio, comme avant) et chaque niveau
+de concurrence, on mesure le débit, les latences p50/p95/p99 et le taux
+d'erreur de /chatbot, ainsi que la latence de /health pendant la charge
+(retard de la boucle asyncio compris).
+
+Le service tourne dans une copie temporaire de cofibot_backend/nlp : les
+bases SQLite (journal des conversations, intentions) et le signal de
+modèle n'écrivent jamais dans le dépôt.
+
+Les résultats peuvent être comparés à une référence enregistrée
+(bench_baseline.json, une référence par nombre de CPU : on ne compare que
+des mesures faites sur autant de cœurs) : un débit en baisse ou une latence
+en hausse au-delà de la tolérance est signalé comme régression (code de
+sortie 1).
+
+Usage :
+    python bench_chatbot.py --concurrency 1 16 64 --requests 2000
+    python bench_chatbot.py --save-baseline          # enregistre la référence
+    python bench_chatbot.py --compare                # compare à la référence
+"""
+
+import argparse
+import asyncio
+import atexit
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(ROOT_DIR, "cofibot_backend")
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, ROOT_DIR)
+# main.py ouvre ses bases dès l'import : le faire depuis une copie jetable de nlp/
+WORK_DIR = tempfile.mkdtemp(prefix="cofibot-bench-")
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+shutil.copytree(os.path.join(BACKEND_DIR, "nlp"), os.path.join(WORK_DIR, "nlp"),
+                ignore=shutil.ignore_patterns("__pycache__"))
+os.chdir(WORK_DIR)
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, "bench_baseline.json")
+
+import httpx
+import main
+
+def percentile(values, p):
+    """Percentile par rang le plus proche"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def summarize(latencies):
+    """Résumé en millisecondes"""
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0
+    }
+
+# Ajoutées aux patterns : le message n'est plus identique à un pattern et passe par le modèle
+MESSAGE_SUFFIXES = ("s'il te plaît", "stp", "merci d'avance")
+
+def load_messages(exact=False):
+    """Corpus de messages tiré des patterns de nlp/intents.json
+
+    Sans `exact`, chaque pattern est suivi d'une formule de politesse :
+    sinon tous les messages seraient servis par la table exact_match, sans
+    jamais atteindre le cache, le pool d'inférence ni le modèle.
+    """
+    with open("nlp/intents.json", "r", encoding="utf-8") as f:
+        patterns = [pattern for intent in json.load(f)["intents"] for pattern in intent["patterns"]]
+    if exact:
+        return patterns
+    return [f"{pattern} {MESSAGE_SUFFIXES[i % len(MESSAGE_SUFFIXES)]}" for i, pattern in enumerate(patterns)]
+
+async def run_load(messages, concurrency, total_requests):
+    """Envoie total_requests messages avec concurrency clients simultanés"""
+    transport = httpx.ASGITransport(app=main.app)
+    chat_latencies = []
+    health_latencies = []
+    errors = Counter()
+    sent = 0
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://cofibot") as client:
+
+        async def chat_worker():
+            nonlocal sent
+            while sent < total_requests:
+                message = messages[sent % len(messages)]
+                sent += 1
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/chatbot", json={"message": message})
+                    status = response.status_code
+                except Exception as e:
+                    status = type(e).__name__
+                chat_latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors[str(status)] += 1
+
+        async def health_prober():
+            # Latence mesurée depuis l'instant où la sonde aurait dû partir :
+            # inclut le temps pendant lequel la boucle asyncio était bloquée
+            while not done.is_set():
+                scheduled = time.perf_counter() + 0.005
+                await asyncio.sleep(0.005)
+                await client.get("/health")
+                health_latencies.append(time.perf_counter() - scheduled)
+
+        prober = asyncio.create_task(health_prober())
+        start = time.perf_counter()
+        await asyncio.gather(*(chat_worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await prober
+
+    return {
+        "throughput_rps": round(len(chat_latencies) / elapsed, 1),
+        "error_rate": round(sum(errors.values()) / max(1, len(chat_latencies)), 4),
+        "errors": dict(errors),
+        "chatbot": summarize(chat_latencies),
+        "health": summarize(health_latencies)
+    }
+
+def run_benchmark(executors, concurrency_levels, total_requests, workers, warmup=100, cache=False,
+                  repeat=3, exact=False):
+    """Mesure chaque mode d'exécution de l'inférence à chaque niveau de concurrence
+
+    Chaque configuration est jouée `repeat` fois ; on garde la série de
+    débit médian pour lisser le bruit de la machine.
+    """
+    if not main.load_model():
+        raise SystemExit("❌ Modèle non chargé")
+    if not cache:
+        # Cache désactivé : chaque requête paie l'inférence
+        main.prediction_cache.capacity = 0
+    messages = load_messages(exact)
+    exact_share = sum(main.runtime.exact_match(message) is not None for message in messages) / len(messages)
+    if not exact and exact_share:
+        raise SystemExit(f"❌ {exact_share:.0%} du corpus servi par exact_match : mesure non représentative")
+
+    results = {}
+    for executor in executors:
+        results[executor] = {}
+        for concurrency in concurrency_levels:
+            main.inference_pool.shutdown()
+            main.inference_pool = main.InferencePool(executor, workers, queue_size=max(concurrency, 1))
+            main.inference_pool.refresh(main.runtime)
+            if warmup:
+                # Démarrage des threads/processus et premiers appels hors mesure
+                asyncio.run(run_load(messages, concurrency, warmup))
+            runs = sorted(
+                (asyncio.run(run_load(messages, concurrency, total_requests)) for _ in range(max(1, repeat))),
+                key=lambda run: run["throughput_rps"]
+            )
+            median_run = runs[len(runs) // 2]
+            median_run["runs_throughput_rps"] = [run["throughput_rps"] for run in runs]
+            results[executor][str(concurrency)] = median_run
+            main.inference_pool.shutdown()
+    return results
+
+def relative_change(current, reference):
+    """Écart relatif (0.1 = +10 %), None si la référence est nulle"""
+    if not reference:
+        return None
+    return round((current - reference) / reference, 4)
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Compare chaque mesure à la référence et liste les régressions
+
+    Régression : débit en baisse de plus de `tolerance`, p95 en hausse de
+    plus de `tolerance`, p99 (plus bruité) de plus de 2 × `tolerance`, ou
+    taux d'erreur en hausse de plus d'un point.
+    """
+    comparison = {}
+    regressions = []
+    for executor, levels in results.items():
+        for concurrency, current in levels.items():
+            reference = baseline.get("results", {}).get(executor, {}).get(concurrency)
+            if reference is None:
+                continue
+            deltas = {
+                "throughput_rps": relative_change(current["throughput_rps"], reference["throughput_rps"]),
+                "p50_ms": relative_change(current["chatbot"]["p50_ms"], reference["chatbot"]["p50_ms"]),
+                "p95_ms": relative_change(current["chatbot"]["p95_ms"], reference["chatbot"]["p95_ms"]),
+                "p99_ms": relative_change(current["chatbot"]["p99_ms"], reference["chatbot"]["p99_ms"]),
+                "error_rate": round(current["error_rate"] - reference["error_rate"], 4)
+            }
+            checks = [
+                ("throughput_rps", deltas["throughput_rps"] is not None and deltas["throughput_rps"] < -tolerance),
+                ("p95_ms", deltas["p95_ms"] is not None and deltas["p95_ms"] > tolerance),
+                ("p99_ms", deltas["p99_ms"] is not None and deltas["p99_ms"] > 2 * tolerance),
+                ("error_rate", deltas["error_rate"] > 0.01)
+            ]
+            regressed = [metric for metric, failed in checks if failed]
+            comparison.setdefault(executor, {})[concurrency] = {**deltas, "regressions": regressed}
+            regressions.extend(f"{executor}/c{concurrency}/{metric}" for metric in regressed)
+    return {"tolerance": tolerance, "by_run": comparison, "regressions": regressions}
+
+def load_baselines(path):
+    """Références enregistrées, par nombre de CPU (clé : str(cpu_count))"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["baselines"]
+
+def environment():
+    """Contexte de la mesure (une référence n'est comparable que sur la même machine)"""
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "engine": main.ENGINE
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de /chatbot sous charge")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3, help="Séries par configuration (médiane gardée)")
+    parser.add_argument("--workers", type=int, default=main.INFERENCE_WORKERS)
+    parser.add_argument("--executors", nargs="+", default=["inline", "thread"])
+    parser.add_argument("--cache", action="store_true", help="Garder le cache de prédictions actif")
+    parser.add_argument("--exact", action="store_true",
+                        help="Patterns tels quels (servis par exact_match, sans le modèle)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--compare", action="store_true", help="Comparer à la référence")
+    parser.add_argument("--save-baseline", action="store_true", help="Enregistrer comme référence")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--output", help="Écrire le rapport JSON dans ce fichier")
+    args = parser.parse_args()
+
+    report = {
+        "environment": environment(),
+        "settings": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "repeat": args.repeat,
+            "cache": args.cache,
+            "exact": args.exact
+        },
+    }
+    # Messages de chargement sur stderr : stdout ne contient que le rapport JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report["results"] = run_benchmark(args.executors, args.concurrency, args.requests, args.workers,
+                                          warmup=args.warmup, cache=args.cache, repeat=args.repeat,
+                                          exact=args.exact)
+
+    baselines = load_baselines(args.baseline)
+    cpu_key = str(report["environment"]["cpu_count"])
+    if args.compare:
+        baseline = baselines.get(cpu_key)
+        if baseline is None:
+            available = ", ".join(sorted(baselines, key=int)) or "aucune"
+            raise SystemExit(f"❌ Pas de référence pour {cpu_key} CPU dans {args.baseline} "
+                             f"(références : {available}) ; l'enregistrer avec --save-baseline")
+        report["baseline"] = {"path": args.baseline, "environment": baseline.get("environment")}
+        report["comparison"] = compare_with_baseline(report["results"], baseline, args.tolerance)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    if args.save_baseline:
+        # Les références des autres machines (autre nombre de CPU) sont conservées
+        baselines[cpu_key] = {key: report[key] for key in ("environment", "settings", "results")}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"baselines": baselines}, indent=2, ensure_ascii=False) + "\n")
+        print(f"✅ Référence ({cpu_key} CPU) enregistrée dans {args.baseline}", file=sys.stderr)
+    if args.compare and report["comparison"]["regressions"]:
+        print(f"❌ Régressions : {', '.join(report['comparison']['regressions'])}", file=sys.stderr)
+        sys.exit(1)
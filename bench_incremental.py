@@ -0,0 +1,83 @@
+"""
+Benchmark : latence d'une modification d'intention, réentraînement complet
+(train_nlp_model, TF-IDF) contre mise à jour incrémentale (nlp.incremental).
+
+Le corpus est synthétique et grandit jusqu'à plusieurs milliers de patterns.
+
+Usage : python bench_incremental.py --sizes 50 200 500 --patterns 10
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, "cofibot_backend"))
+
+from nlp.incremental import IncrementalTrainer
+from nlp.train_nlp import train_nlp_model
+
+SYLLABLES = ["ca", "bl", "co", "fi", "pro", "duc", "tion", "ser", "vi", "ce", "ré", "seau",
+             "con", "gé", "ho", "rai", "re", "pai", "e", "qua", "li", "té", "mé", "tal"]
+
+def make_word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+def make_intents(n_intents, n_patterns, rng):
+    """Intentions synthétiques : chaque tag a son propre sous-vocabulaire"""
+    intents = []
+    for i in range(n_intents):
+        words = [make_word(rng) for _ in range(8)]
+        patterns = [" ".join(rng.sample(words, 4)) for _ in range(n_patterns)]
+        intents.append({"tag": f"intent_{i}", "patterns": patterns, "responses": [f"Réponse {i}"]})
+    return intents
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn(*args, **kwargs)
+    return round((time.perf_counter() - start) * 1000, 1)
+
+def run_benchmark(sizes, n_patterns, seed=42):
+    rng = random.Random(seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, "model.pkl")
+        for n_intents in sizes:
+            intents = make_intents(n_intents, n_patterns, rng)
+
+            # Nouvelle intention + une intention modifiée
+            added = make_intents(1, n_patterns, rng)[0]
+            added["tag"] = "intent_new"
+            edited = [dict(intent) for intent in intents] + [added]
+            edited[0] = {**edited[0], "patterns": edited[0]["patterns"][2:] + [make_word(rng), make_word(rng)]}
+
+            full_ms = timed(train_nlp_model, intents=edited, model_path=model_path)
+
+            trainer = IncrementalTrainer()
+            with contextlib.redirect_stdout(io.StringIO()):
+                trainer.update(intents)
+            incremental_ms = timed(trainer.train, intents=edited, model_path=model_path)
+
+            results.append({
+                "intents": n_intents + 1,
+                "patterns": sum(len(intent["patterns"]) for intent in edited),
+                "full_retrain_ms": full_ms,
+                "incremental_ms": incremental_ms,
+                "speedup": round(full_ms / incremental_ms, 1) if incremental_ms else None
+            })
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Réentraînement complet vs incrémental")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[50, 200, 500])
+    parser.add_argument("--patterns", type=int, default=10, help="patterns par intention")
+    args = parser.parse_args()
+
+    print(json.dumps(run_benchmark(args.sizes, args.patterns), indent=2))
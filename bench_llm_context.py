@@ -0,0 +1,91 @@
+"""
+Benchmark : préremplissage et délai avant le premier token (TTFT) sur une
+conversation de 10 tours, transcript renvoyé à chaque tour contre contexte
+Ollama réutilisé (COFIBOT_LLM_CONTEXT_MODE).
+
+Chaque mode rejoue les mêmes questions dans une session neuve, en
+streaming ; par tour : tokens préremplis et durée de préremplissage
+(mesurés par Ollama), TTFT et durée totale côté client. Nécessite un
+serveur Ollama avec le modèle installé.
+
+Usage : python bench_llm_context.py --model llama3.2:3b --turns 10
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import uuid
+
+from cofibot_llama import CofiBotLlama
+from ollama_connection import OllamaError
+
+QUESTIONS = [
+    "Bonjour, je viens d'arriver chez Coficab.",
+    "Quels types de câbles fabrique l'entreprise ?",
+    "Quelles normes qualité s'appliquent à ces câbles ?",
+    "Comment se déroule un audit ISO ?",
+    "Qui dois-je contacter pour une question RH ?",
+    "Comment poser un jour de congé ?",
+    "Quelles sont les règles de sécurité en atelier ?",
+    "Peux-tu résumer ce que tu m'as dit sur les normes ?",
+    "Et pour les câbles haute tension ?",
+    "Merci, rappelle-moi mon premier message.",
+]
+
+def mean(values):
+    values = [value for value in values if value is not None]
+    return round(sum(values) / len(values), 1) if values else None
+
+async def run_conversation(model, base_url, mode, turns):
+    bot = CofiBotLlama(model, context_mode=mode, probe_interval=0)
+    bot.base_url = base_url
+    available, message = await bot.ais_available()
+    if not available:
+        await bot.aclose()
+        raise SystemExit(f"❌ {message}")
+
+    session_id = uuid.uuid4().hex
+    rows = []
+    try:
+        for turn in range(turns):
+            stats = {}
+            async for _ in bot.astream(QUESTIONS[turn % len(QUESTIONS)], stats, session_id=session_id):
+                pass
+            rows.append({
+                "turn": turn + 1,
+                "prompt_tokens": stats.get("prompt_tokens"),
+                "prefill_ms": round(stats["prefill_s"] * 1000, 1) if "prefill_s" in stats else None,
+                "ttft_ms": round(stats["ttft_s"] * 1000, 1) if "ttft_s" in stats else None,
+                "total_ms": round(stats["generation_s"] * 1000, 1)
+            })
+    finally:
+        await bot.aclose()
+    return {
+        "turns": rows,
+        "mean_prefill_ms": mean([row["prefill_ms"] for row in rows]),
+        "mean_ttft_ms": mean([row["ttft_ms"] for row in rows]),
+        "total_prompt_tokens": sum(row["prompt_tokens"] or 0 for row in rows)
+    }
+
+async def run_benchmark(model, base_url, modes, turns):
+    # Les modes passent l'un après l'autre : pas de concurrence sur le cache KV d'Ollama
+    report = {"model": model, "turns": turns}
+    for mode in modes:
+        report[mode] = await run_conversation(model, base_url, mode, turns)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Préremplissage et TTFT : transcript contre contexte Ollama")
+    parser.add_argument("--model", default="llama3.2:3b")
+    parser.add_argument("--url", default="http://localhost:11434")
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--modes", nargs="+", default=["transcript", "context"], choices=["transcript", "context"])
+    args = parser.parse_args()
+
+    try:
+        report = asyncio.run(run_benchmark(args.model, args.url, args.modes, args.turns))
+    except OllamaError as e:
+        print(f"❌ Génération interrompue : {e}")
+        sys.exit(1)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
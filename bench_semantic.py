@@ -0,0 +1,107 @@
+"""
+Benchmark : classifieur TF-IDF actuel contre matcher sémantique (embeddings
++ FAISS, nlp.semantic) sur des patterns mis de côté.
+
+Pour chaque intention, une part des patterns (--holdout) est retirée du
+corpus ; les deux classifieurs sont construits sur le reste et évalués sur
+ces patterns jamais vus : précision, F1 macro, latence par message (p50 /
+p95) et temps de construction (encodage à froid, puis relecture de l'index
+persisté).
+
+Usage : python bench_semantic.py --intents cofibot_backend/nlp/intents.json --holdout 0.2
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, "cofibot_backend"))
+
+from nlp.semantic import SEMANTIC_MODEL, SemanticMatcher
+from nlp.train_nlp import evaluate, train_nlp_model
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+def split_intents(intents, holdout, seed):
+    """(intentions d'entraînement, [(pattern mis de côté, tag)]) ; au moins un pattern gardé par tag"""
+    rng = random.Random(seed)
+    train, test = [], []
+    for intent in intents:
+        patterns = list(intent["patterns"])
+        rng.shuffle(patterns)
+        n_test = min(len(patterns) - 1, max(1, round(len(patterns) * holdout))) if len(patterns) > 1 else 0
+        test += [(pattern, intent["tag"]) for pattern in patterns[:n_test]]
+        train.append({**intent, "patterns": patterns[n_test:]})
+    return train, test
+
+def measure(classify, texts):
+    """Prédictions et latences d'appels message par message"""
+    predictions, latencies = [], []
+    for text in texts:
+        start = time.perf_counter()
+        predictions.append(classify(text))
+        latencies.append(time.perf_counter() - start)
+    return predictions, {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3)
+    }
+
+def run_benchmark(intents_path, holdout, seed, model_name, k):
+    with open(intents_path, "r", encoding="utf-8") as file:
+        intents = json.load(file)["intents"]
+    train, test = split_intents(intents, holdout, seed)
+    if not test:
+        raise SystemExit("❌ Pas assez de patterns pour en mettre de côté")
+    texts = [" ".join(pattern.lower().split()) for pattern, _ in test]
+    labels = [tag for _, tag in test]
+    tags = sorted({intent["tag"] for intent in intents})
+    report = {"patterns_train": sum(len(intent["patterns"]) for intent in train), "patterns_test": len(test)}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            vectorizer, model = train_nlp_model(intents=train, model_path=os.path.join(tmp_dir, "model.pkl"))
+        build_ms = round((time.perf_counter() - start) * 1000, 1)
+        predictions, latency = measure(lambda text: model.predict(vectorizer.transform([text]))[0], texts)
+        report["tfidf"] = {**evaluate(labels, predictions, tags), **latency, "build_ms": build_ms}
+
+        index_dir = os.path.join(tmp_dir, "semantic_index")
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            matcher = SemanticMatcher.build(train, index_dir, model_name, k=k)
+        cold_ms = round((time.perf_counter() - start) * 1000, 1)
+        # Redémarrage : même contenu, l'index est relu au lieu d'être réencodé
+        start = time.perf_counter()
+        SemanticMatcher.build(train, index_dir, model_name, previous=matcher, k=k)
+        warm_ms = round((time.perf_counter() - start) * 1000, 1)
+        predictions, latency = measure(lambda text: matcher.classify([text])[0][0], texts)
+        report["semantic"] = {
+            **evaluate(labels, predictions, tags), **latency,
+            "model": model_name, "k": k, "build_cold_ms": cold_ms, "build_from_index_ms": warm_ms
+        }
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TF-IDF contre embeddings sur des patterns mis de côté")
+    parser.add_argument("--intents", default=os.path.join(ROOT_DIR, "cofibot_backend", "nlp", "intents.json"))
+    parser.add_argument("--holdout", type=float, default=0.2, help="part des patterns mis de côté")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--model", default=SEMANTIC_MODEL)
+    parser.add_argument("-k", type=int, default=5, help="voisins consultés par le vote")
+    args = parser.parse_args()
+
+    try:
+        print(json.dumps(run_benchmark(args.intents, args.holdout, args.seed, args.model, args.k),
+                         indent=2, ensure_ascii=False))
+    except ImportError as e:
+        print(f"❌ Dépendance manquante ({e}) : pip install sentence-transformers faiss-cpu")
+        sys.exit(1)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+ARTIFACT_FORMAT_VERSION = 1
+# Tableaux du modèle, dans l'ordre utilisé pour le hash de contenu
+ARTIFACT_ARRAYS = ("vocabulary", "idf", "coef_by_feature", "intercept", "classes")
+
+def _plain_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Garde les hyperparamètres sérialisables en JSON (pas de dtype ni de callable)"""
+    plain = {}
+    for name, value in params.items():
+        if isinstance(value, tuple):
+            value = list(value)
+        if value is None or isinstance(value, (str, int, float, bool)) or (
+                isinstance(value, list) and all(isinstance(item, (str, int, float)) for item in value)):
+            plain[name] = value
+    return plain
+
+def file_sha256(path: str) -> str:
+    """Empreinte SHA-256 d'un fichier (modèle pickle)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def current_artifact(path: str = "nlp/model_artifact") -> Optional[str]:
+    """Dossier de la version pointée par path/CURRENT, None s'il n'y en a pas"""
+    try:
+        with open(os.path.join(path, "CURRENT"), "r", encoding="utf-8") as file:
+            name = file.read().strip()
+    except FileNotFoundError:
+        return None
+    version_dir = os.path.join(path, name)
+    return version_dir if os.path.exists(os.path.join(version_dir, "manifest.json")) else None
+
+def save_artifact(vectorizer, model, path: str = "nlp/model_artifact", keep: int = 3,
+                  metrics: Optional[Dict[str, Any]] = None) -> str:
+    """Exporte (TfidfVectorizer, LogisticRegression) en tableaux .npy + manifeste JSON.
+
+    Chaque export va dans path/<hash>/ puis path/CURRENT est remplacé
+    atomiquement : un processus qui charge en même temps voit l'ancienne ou
+    la nouvelle version, jamais un mélange. Les métriques d'entraînement
+    éventuelles sont recopiées dans le manifeste. Renvoie le hash de contenu.
+    """
+    if not isinstance(vectorizer, TfidfVectorizer) or not isinstance(model, LogisticRegression):
+        raise ValueError(f"Format mémoire non supporté pour {type(vectorizer).__name__} / "
+                         f"{type(model).__name__}")
+    vectorizer_params = vectorizer.get_params()
+    callables = [name for name in ("preprocessor", "tokenizer", "analyzer")
+                 if callable(vectorizer_params.get(name))]
+    if callables:
+        raise ValueError(f"Paramètres non exportables : {callables}")
+
+    terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    arrays = {
+        "vocabulary": np.array(terms, dtype=str),
+        "idf": np.ascontiguousarray(vectorizer.idf_, dtype=np.float64),
+        # Une ligne par feature : lue telle quelle par le moteur natif, sans copie
+        "coef_by_feature": np.ascontiguousarray(model.coef_.T, dtype=np.float64),
+        "intercept": np.ascontiguousarray(model.intercept_, dtype=np.float64),
+        "classes": np.array([str(tag) for tag in model.classes_], dtype=str)
+    }
+    params = {
+        "vectorizer": _plain_params(vectorizer_params),
+        "model": _plain_params(model.get_params())
+    }
+
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8"))
+    for name in ARTIFACT_ARRAYS:
+        digest.update(name.encode("utf-8"))
+        digest.update(str(arrays[name].dtype).encode("utf-8"))
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    content_hash = digest.hexdigest()
+
+    os.makedirs(path, exist_ok=True)
+    name = content_hash[:16]
+    version_dir = os.path.join(path, name)
+    if not os.path.exists(os.path.join(version_dir, "manifest.json")):
+        tmp_dir = f"{version_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for array_name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{array_name}.npy"), array)
+        manifest = {
+            "format_version": ARTIFACT_FORMAT_VERSION,
+            "content_hash": content_hash,
+            "n_features": int(arrays["idf"].shape[0]),
+            "n_classes": int(arrays["classes"].shape[0]),
+            "metrics": metrics,
+            **params
+        }
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=2, ensure_ascii=False)
+        shutil.rmtree(version_dir, ignore_errors=True)
+        os.replace(tmp_dir, version_dir)
+
+    tmp_pointer = os.path.join(path, "CURRENT.tmp")
+    with open(tmp_pointer, "w", encoding="utf-8") as file:
+        file.write(name)
+    os.replace(tmp_pointer, os.path.join(path, "CURRENT"))
+
+    _prune_versions(path, name, keep)
+    return content_hash
+
+def _prune_versions(path: str, current: str, keep: int):
+    """Supprime les plus vieilles versions (un processus peut encore mapper les récentes)"""
+    versions = sorted(
+        (entry for entry in os.scandir(path) if entry.is_dir() and not entry.name.endswith(".tmp")),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True
+    )
+    for entry in versions[keep:]:
+        if entry.name != current:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def load_artifact(path: str = "nlp/model_artifact") -> Tuple[TfidfVectorizer, LogisticRegression, Dict[str, Any]]:
+    """Recharge un artefact en mappant ses tableaux en mémoire (mmap_mode="r").
+
+    `path` est soit la racine (version pointée par CURRENT), soit le dossier
+    d'une version précise. Aucun coefficient n'est copié : les pages sont
+    lues à la demande et partagées par tous les processus qui mappent le
+    même fichier.
+    """
+    if os.path.exists(os.path.join(path, "manifest.json")):
+        version_dir = path
+    else:
+        version_dir = current_artifact(path)
+    if version_dir is None:
+        raise FileNotFoundError(f"Aucun artefact de modèle dans {path}")
+    with open(os.path.join(version_dir, "manifest.json"), "r", encoding="utf-8") as file:
+        manifest = json.load(file)
+    if manifest.get("format_version") != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f"Version d'artefact non supportée : {manifest.get('format_version')}")
+
+    arrays = {
+        name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode="r")
+        for name in ARTIFACT_ARRAYS
+    }
+
+    vectorizer_params = dict(manifest["vectorizer"])
+    if "ngram_range" in vectorizer_params:
+        vectorizer_params["ngram_range"] = tuple(vectorizer_params["ngram_range"])
+    vectorizer = TfidfVectorizer(**vectorizer_params)
+    vectorizer.vocabulary_ = {str(term): index for index, term in enumerate(arrays["vocabulary"])}
+    vectorizer.idf_ = arrays["idf"]
+
+    model = LogisticRegression(**manifest["model"])
+    model.classes_ = np.asarray(arrays["classes"])
+    model.coef_ = arrays["coef_by_feature"].T  # Vue transposée, pas de copie
+    model.intercept_ = arrays["intercept"]
+    model.n_features_in_ = manifest["n_features"]
+
+    manifest["path"] = version_dir
+    return vectorizer, model, manifest
+
+if __name__ == "__main__":
+    import joblib
+
+    # Conversion du modèle pickle existant
+    vectorizer, model = joblib.load("nlp/model.pkl")
+    from nlp.train_nlp import load_metrics
+
+    content_hash = save_artifact(vectorizer, model, metrics=load_metrics())
+    print(f"✅ Artefact du modèle exporté dans nlp/model_artifact ({content_hash[:16]})")
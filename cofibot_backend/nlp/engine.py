@@ -0,0 +1,166 @@
+import math
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+class NativeScorer:
+    """Moteur de scoring NumPy équivalent à TfidfVectorizer + LogisticRegression.
+
+    Le vocabulaire, les poids IDF et les coefficients sont exportés une fois
+    dans des tableaux plats ; un message est ensuite scoré avec un tokeniseur
+    maison, un produit scalaire creux et un softmax, sans passer par la
+    validation de scikit-learn à chaque appel.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, coef: np.ndarray,
+                 intercept: np.ndarray, classes: Tuple[str, ...], ngram_range: Tuple[int, int],
+                 token_pattern: str, lowercase: bool = True, sublinear_tf: bool = False,
+                 norm: str = "l2", multinomial: bool = True):
+        self.vocabulary = vocabulary
+        self.idf = np.ascontiguousarray(idf, dtype=np.float64)
+        # Une ligne par feature : les colonnes d'un message se lisent d'un bloc
+        self.coef_by_feature = np.ascontiguousarray(coef.T, dtype=np.float64)
+        self.intercept = np.ascontiguousarray(intercept, dtype=np.float64)
+        self.classes = classes
+        self.min_n, self.max_n = ngram_range
+        self.token_pattern = token_pattern
+        self.token_re = re.compile(token_pattern)
+        self.lowercase = lowercase
+        self.sublinear_tf = sublinear_tf
+        self.norm = norm
+        self.multinomial = multinomial
+
+    @classmethod
+    def from_sklearn(cls, vectorizer, model) -> "NativeScorer":
+        """Exporte un couple (TfidfVectorizer, LogisticRegression) entraîné"""
+        if not hasattr(vectorizer, "vocabulary_") or not hasattr(vectorizer, "idf_"):
+            raise ValueError(f"Vectoriseur sans vocabulaire TF-IDF : {type(vectorizer).__name__}")
+        params = vectorizer.get_params()
+        unsupported = [
+            name for name in ("preprocessor", "tokenizer", "stop_words", "strip_accents")
+            if params.get(name) is not None
+        ]
+        if params.get("analyzer") != "word":
+            unsupported.append("analyzer")
+        if params.get("norm") not in ("l2", None):
+            unsupported.append("norm")
+        if not params.get("use_idf", True) or params.get("binary"):
+            unsupported.append("use_idf/binary")
+        if unsupported:
+            raise ValueError(f"Configuration non supportée par le moteur natif : {unsupported}")
+
+        return cls(
+            vocabulary={term: int(index) for term, index in vectorizer.vocabulary_.items()},
+            idf=vectorizer.idf_,
+            coef=model.coef_,
+            intercept=model.intercept_,
+            classes=tuple(str(tag) for tag in model.classes_),
+            ngram_range=tuple(params["ngram_range"]),
+            token_pattern=params["token_pattern"],
+            lowercase=params.get("lowercase", True),
+            sublinear_tf=params.get("sublinear_tf", False),
+            norm=params.get("norm"),
+            multinomial=_is_multinomial(model)
+        )
+
+    def _features(self, text: str):
+        """Indices de features et poids TF-IDF normalisés d'un message"""
+        if self.lowercase:
+            text = text.lower()
+        tokens = self.token_re.findall(text)
+
+        counts: Dict[int, int] = {}
+        vocabulary = self.vocabulary
+        n_tokens = len(tokens)
+        for n in range(self.min_n, self.max_n + 1):
+            for start in range(n_tokens - n + 1):
+                term = tokens[start] if n == 1 else " ".join(tokens[start:start + n])
+                index = vocabulary.get(term)
+                if index is not None:
+                    counts[index] = counts.get(index, 0) + 1
+
+        if not counts:
+            return None, None
+
+        indices = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        if self.sublinear_tf:
+            tf = np.log(tf) + 1.0
+        weights = tf * self.idf[indices]
+        if self.norm == "l2":
+            weights /= math.sqrt(float(weights @ weights))
+        return indices, weights
+
+    def decision_function(self, text: str) -> np.ndarray:
+        """Scores linéaires bruts (équivalent de model.decision_function)"""
+        indices, weights = self._features(text)
+        if indices is None:
+            return self.intercept.copy()
+        return weights @ self.coef_by_feature[indices] + self.intercept
+
+    def predict_proba_one(self, text: str) -> np.ndarray:
+        """Probabilités par classe pour un message, alignées sur classes"""
+        scores = self.decision_function(text)
+
+        if len(self.classes) == 2 and scores.shape[0] == 1:
+            if self.multinomial:
+                scores = np.array([-scores[0], scores[0]])
+            else:
+                positive = 1.0 / (1.0 + math.exp(-scores[0]))
+                return np.array([1.0 - positive, positive])
+
+        if self.multinomial:
+            scores = np.exp(scores - scores.max())
+            return scores / scores.sum()
+
+        # One-vs-rest : sigmoïdes renormalisées, comme scikit-learn
+        probas = 1.0 / (1.0 + np.exp(-scores))
+        return probas / probas.sum()
+
+    def classify(self, texts: List[str]):
+        """Même contrat que IntentRuntime.classify : (indices de classe, confiances)"""
+        best = np.empty(len(texts), dtype=np.intp)
+        confidences = np.empty(len(texts), dtype=np.float64)
+        for i, text in enumerate(texts):
+            probas = self.predict_proba_one(text)
+            best[i] = probas.argmax()
+            confidences[i] = probas[best[i]]
+        return best, confidences
+
+def _is_multinomial(model) -> bool:
+    """Reproduit le choix softmax / one-vs-rest de LogisticRegression"""
+    multi_class = getattr(model, "multi_class", "auto")
+    if multi_class == "multinomial":
+        return True
+    if multi_class == "ovr":
+        return False
+    # "auto" (ou "deprecated" dans les versions récentes)
+    return len(model.classes_) > 2 and model.solver != "liblinear"
+
+if __name__ == "__main__":
+    import json
+    import time
+    import joblib
+
+    vectorizer, model = joblib.load("nlp/model.pkl")
+    scorer = NativeScorer.from_sklearn(vectorizer, model)
+
+    with open("nlp/intents.json", "r", encoding="utf-8") as f:
+        messages = [p.lower() for intent in json.load(f)["intents"] for p in intent["patterns"]]
+
+    rounds = 200
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            model.predict_proba(vectorizer.transform([message]))
+    sklearn_us = (time.perf_counter() - start) / (rounds * len(messages)) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            scorer.predict_proba_one(message)
+    native_us = (time.perf_counter() - start) / (rounds * len(messages)) * 1e6
+
+    print(f"⏱️ scikit-learn : {sklearn_us:.1f} µs/message")
+    print(f"⚡ Moteur natif : {native_us:.1f} µs/message (x{sklearn_us / native_us:.0f})")
@@ -0,0 +1,222 @@
+import json
+import os
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+from scipy import sparse
+from scipy.special import expit
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import normalize
+
+from nlp.train_nlp import measure_inference_us, save_metrics
+
+class CompactHashingVectorizer:
+    """HashingVectorizer restreint aux colonnes vues à l'entraînement.
+
+    Les coefficients ne couvrent que les features réellement présentes dans le
+    corpus (quelques milliers) au lieu des 2**n colonnes de hachage.
+    """
+
+    def __init__(self, hashing: HashingVectorizer, columns: np.ndarray):
+        self.hashing = hashing
+        self.columns = columns
+
+    def transform(self, texts):
+        return normalize(self.hashing.transform(texts)[:, self.columns])
+
+class OneVsRestLinearModel:
+    """Régressions logistiques binaires, une par intention.
+
+    Même interface que LogisticRegression (classes_, coef_, intercept_,
+    predict, predict_proba) ; chaque ligne de coefficients s'entraîne
+    séparément, ce qui permet de ne réajuster que les intentions modifiées.
+    """
+
+    def __init__(self, classes: np.ndarray, coef: np.ndarray, intercept: np.ndarray):
+        self.classes_ = classes
+        self.coef_ = coef
+        self.intercept_ = intercept
+
+    def decision_function(self, X) -> np.ndarray:
+        return np.asarray(X @ self.coef_.T) + self.intercept_
+
+    def predict_proba(self, X) -> np.ndarray:
+        # Sigmoïdes renormalisées, comme LogisticRegression en one-vs-rest
+        probas = expit(self.decision_function(X))
+        return probas / probas.sum(axis=1, keepdims=True)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[self.decision_function(X).argmax(axis=1)]
+
+class IncrementalTrainer:
+    """Entraînement incrémental : seul le delta d'intentions est recalculé.
+
+    Le HashingVectorizer est sans état : les lignes déjà calculées restent
+    valides quand le corpus change, on n'encode que les patterns ajoutés et on
+    retire les lignes des patterns supprimés. Seules les intentions dont les
+    patterns ont changé (ou qui sont nouvelles) sont réajustées, en repartant
+    de leurs coefficients précédents ; les autres gardent les leurs. Tous les
+    `full_refit_every` deltas, un réajustement complet corrige la dérive.
+    """
+
+    def __init__(self, n_features: int = 2 ** 20, ngram_range=(1, 2),
+                 C: float = 10.0, full_refit_every: int = 20):
+        self.hashing = HashingVectorizer(
+            ngram_range=ngram_range,
+            n_features=n_features,
+            alternate_sign=False,
+            norm=None
+        )
+        self.C = C
+        self.full_refit_every = full_refit_every
+        self.vectorizer = None
+        self.model = None
+        self.keys = []  # (tag, pattern normalisé), aligné sur les lignes de X
+        self.X = None  # Lignes hachées normalisées, toutes colonnes confondues
+        self.updates_since_refit = 0
+
+    @staticmethod
+    def _pattern_keys(intents):
+        """Couples (tag, pattern) dédupliqués, dans l'ordre du fichier"""
+        keys = {}
+        for intent in intents:
+            for pattern in intent["patterns"]:
+                keys[(intent["tag"], pattern.lower())] = None
+        return list(keys)
+
+    def _encode(self, patterns):
+        return normalize(self.hashing.transform(patterns))
+
+    def _fit_class(self, X, labels, tag, warm_coef=None, warm_intercept=0.0):
+        """Régression logistique binaire « tag contre le reste »"""
+        y = labels == tag
+        classifier = LogisticRegression(C=self.C, max_iter=1000)
+        if warm_coef is not None:
+            classifier.set_params(warm_start=True)
+            classifier.coef_ = warm_coef[np.newaxis, :]
+            classifier.intercept_ = np.array([warm_intercept])
+        classifier.fit(X, y)
+        return classifier.coef_[0], classifier.intercept_[0]
+
+    def _fit(self, refit_tags=None):
+        """Réajuste les intentions `refit_tags` (toutes si None) sur le corpus courant"""
+        columns = np.unique(self.X.indices)
+        X = self.X[:, columns]
+        labels = np.array([tag for tag, _ in self.keys])
+        classes = np.unique(labels)
+
+        coef = np.zeros((len(classes), len(columns)))
+        intercept = np.zeros(len(classes))
+
+        old_rows, positions, known = {}, None, None
+        if self.model is not None:
+            # Anciens coefficients réalignés sur les colonnes courantes
+            old_columns = self.vectorizer.columns
+            old_rows = {tag: i for i, tag in enumerate(self.model.classes_)}
+            positions = np.searchsorted(old_columns, columns).clip(max=len(old_columns) - 1)
+            known = old_columns[positions] == columns
+
+        for i, tag in enumerate(classes):
+            warm_coef, warm_intercept = None, 0.0
+            if tag in old_rows:
+                warm_coef = np.zeros(len(columns))
+                warm_coef[known] = self.model.coef_[old_rows[tag], positions[known]]
+                warm_intercept = self.model.intercept_[old_rows[tag]]
+
+            if refit_tags is None or tag in refit_tags or warm_coef is None:
+                coef[i], intercept[i] = self._fit_class(X, labels, tag, warm_coef, warm_intercept)
+            else:
+                coef[i], intercept[i] = warm_coef, warm_intercept
+
+        self.model = OneVsRestLinearModel(classes, coef, intercept)
+        self.vectorizer = CompactHashingVectorizer(self.hashing, columns)
+
+    def full_fit(self, intents):
+        """Vectorise tout le corpus et réajuste toutes les intentions"""
+        self.keys = self._pattern_keys(intents)
+        self.X = self._encode([pattern for _, pattern in self.keys])
+        self.model = None
+        self._fit()
+        self.updates_since_refit = 0
+        return {"mode": "full", "added": len(self.keys), "removed": 0,
+                "refit_intents": len(self.model.classes_)}
+
+    def update(self, intents, full: bool = False):
+        """Applique le delta entre le corpus connu et `intents`"""
+        if full or self.model is None or self.updates_since_refit >= self.full_refit_every:
+            return self.full_fit(intents)
+
+        new_keys = self._pattern_keys(intents)
+        wanted = set(new_keys)
+        known = set(self.keys)
+        keep_mask = np.fromiter((key in wanted for key in self.keys), dtype=bool, count=len(self.keys))
+        added = [key for key in new_keys if key not in known]
+        removed = [key for key, keep in zip(self.keys, keep_mask) if not keep]
+
+        if not added and not removed:
+            return {"mode": "noop", "added": 0, "removed": 0, "refit_intents": 0}
+
+        blocks = [self.X[keep_mask]]
+        if added:
+            blocks.append(self._encode([pattern for _, pattern in added]))
+        self.X = sparse.vstack(blocks, format="csr")
+        self.keys = [key for key, keep in zip(self.keys, keep_mask) if keep] + added
+
+        refit_tags = {tag for tag, _ in added} | {tag for tag, _ in removed}
+        self._fit(refit_tags)
+        self.updates_since_refit += 1
+        return {"mode": "incremental", "added": len(added), "removed": len(removed),
+                "refit_intents": len(refit_tags & set(self.model.classes_))}
+
+    def train(self, intents=None, model_path="nlp/model.pkl", progress=None, full: bool = False):
+        """Même contrat que train_nlp_model : met à jour, sauvegarde, renvoie (vectorizer, model)"""
+        report = progress or (lambda stage, fraction, **metrics: None)
+        start_time = time.perf_counter()
+
+        report("chargement", 0.1)
+        if intents is None:
+            with open("nlp/intents.json", "r", encoding="utf-8") as file:
+                intents = json.load(file)["intents"]
+
+        report("entraînement incrémental", 0.5)
+        delta = self.update(intents, full=full)
+        print(f"📊 Mise à jour {delta['mode']} : +{delta['added']} / -{delta['removed']} exemples, "
+              f"{delta['refit_intents']} intention(s) réajustée(s)")
+
+        report("sauvegarde", 0.9)
+        os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+        tmp_path = f"{model_path}.tmp"
+        joblib.dump((self.vectorizer, self.model), tmp_path)
+        os.replace(tmp_path, model_path)
+
+        # Pas de jeu d'évaluation en incrémental : précision non mesurée
+        metrics = {
+            "accuracy": None,
+            "macro_f1": None,
+            "recall_per_intent": {},
+            "evaluation": None,
+            "training_mode": delta["mode"],
+            "n_examples": len(self.keys),
+            "n_intents": len(self.model.classes_),
+            "train_time_s": round(time.perf_counter() - start_time, 3),
+            "inference_us_per_message": measure_inference_us(
+                self.vectorizer, self.model, [pattern for _, pattern in self.keys]),
+            "trained_at": datetime.now().isoformat()
+        }
+        save_metrics(metrics, model_path)
+
+        report(
+            "sauvegardé", 0.95,
+            training_mode=delta["mode"],
+            added_examples=delta["added"],
+            removed_examples=delta["removed"],
+            refit_intents=delta["refit_intents"],
+            n_examples=metrics["n_examples"],
+            n_intents=metrics["n_intents"],
+            train_time_s=metrics["train_time_s"],
+            inference_us_per_message=metrics["inference_us_per_message"]
+        )
+        return self.vectorizer, self.model
@@ -0,0 +1,162 @@
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from nlp.engine import NativeScorer
+
+def normalize_pattern(text: str) -> str:
+    """Clé de correspondance exacte : minuscules, ponctuation retirée, espaces compactés
+
+    Les accents sont conservés ("congés" et "conges" restent distincts,
+    comme pour le vectoriseur).
+    """
+    kept = [" " if unicodedata.category(char).startswith("P") else char for char in text.lower()]
+    return " ".join("".join(kept).split())
+
+@dataclass(frozen=True)
+class IntentRuntime:
+    """Instantané compilé et en lecture seule du modèle et des intentions.
+
+    Construit hors du chemin des requêtes puis publié par une simple
+    affectation de référence : un lecteur voit soit l'ancien, soit le
+    nouvel instantané, jamais un état intermédiaire.
+    """
+    version: int
+    vectorizer: Any
+    model: Any
+    intents: Tuple[Dict[str, Any], ...]
+    responses_by_tag: Mapping[str, Tuple[str, ...]]
+    classes: Tuple[str, ...]
+    class_responses: Tuple[Optional[Tuple[str, ...]], ...]
+    scorer: Optional[NativeScorer] = None
+    total_patterns: int = 0
+    total_responses: int = 0
+    model_hash: Optional[str] = None  # Empreinte du contenu du modèle (pickle ou artefact)
+    artifact_path: Optional[str] = None  # Dossier de l'artefact mappé en mémoire, le cas échéant
+    metrics: Optional[Mapping[str, Any]] = None  # Métriques mesurées au dernier entraînement
+    # Pattern normalisé (normalize_pattern) -> tag, pour répondre sans passer par le modèle
+    exact_matches: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+    # Matcher d'embeddings (nlp.semantic.SemanticMatcher), prioritaire sur le TF-IDF s'il tient son budget
+    semantic: Optional[Any] = None
+    class_index_by_tag: Mapping[str, int] = field(default_factory=lambda: MappingProxyType({}))
+
+    def exact_match(self, text: str) -> Optional[str]:
+        """Tag dont un pattern est identique au message (après normalisation), sinon None"""
+        return self.exact_matches.get(normalize_pattern(text))
+
+    def classify(self, texts: List[str], timings: Optional[Dict[str, float]] = None):
+        """Renvoie (indices de classe, confiances) pour des messages déjà normalisés
+
+        Si `timings` est fourni, il reçoit la durée (s) des étapes
+        "transform" et "predict_proba" ; le moteur natif fait les deux d'un
+        bloc, compté dans "predict_proba". Le matcher sémantique, s'il tient
+        son budget de latence, passe en premier ("embed" et "knn").
+        """
+        if self.semantic is not None and self.semantic.within_budget():
+            tags, confidences = self.semantic.classify(texts, timings)
+            best = np.array([self.class_index_by_tag.get(tag, -1) for tag in tags])
+            if (best >= 0).all():
+                return best, confidences
+
+        start = time.perf_counter()
+        # Moteur natif pour un message isolé, transformation creuse groupée sinon
+        if self.scorer is not None and len(texts) == 1:
+            result = self.scorer.classify(texts)
+            if timings is not None:
+                timings["predict_proba"] = time.perf_counter() - start
+            return result
+        X_input = self.vectorizer.transform(texts)
+        transformed = time.perf_counter()
+        probas = self.model.predict_proba(X_input)
+        best = probas.argmax(axis=1)
+        confidences = probas[np.arange(len(texts)), best]
+        if timings is not None:
+            timings["transform"] = transformed - start
+            timings["predict_proba"] = time.perf_counter() - transformed
+        return best, confidences
+
+    @property
+    def engine(self) -> str:
+        """Moteur utilisé pour les messages isolés"""
+        if self.semantic is not None:
+            return "semantic"
+        return "native" if self.scorer is not None else "sklearn"
+
+    def tag_for(self, class_index: int) -> str:
+        """Tag correspondant à un indice de classe (model.classes_, puis tags sémantiques)"""
+        return self.classes[class_index]
+
+    def responses_for(self, class_index: int) -> Optional[Tuple[str, ...]]:
+        """Réponses de l'intention prédite, None si elle n'existe plus"""
+        return self.class_responses[class_index]
+
+def build_runtime(vectorizer, model, intents: List[Dict[str, Any]], version: int,
+                  native_engine: bool = False, model_hash: Optional[str] = None,
+                  artifact_path: Optional[str] = None,
+                  metrics: Optional[Dict[str, Any]] = None,
+                  semantic: Optional[Any] = None) -> IntentRuntime:
+    """Compile les intentions et le modèle en un IntentRuntime immuable
+
+    Avec un matcher sémantique, les intentions pas encore apprises par le
+    modèle TF-IDF reçoivent des indices de classe après ceux du modèle.
+    """
+    frozen_intents = tuple(
+        {
+            "tag": intent["tag"],
+            "patterns": tuple(intent["patterns"]),
+            "responses": tuple(intent["responses"])
+        }
+        for intent in intents
+    )
+    responses_by_tag = MappingProxyType({
+        intent["tag"]: intent["responses"]
+        for intent in frozen_intents
+        if intent["responses"]
+    })
+    # Un pattern partagé par deux intentions est ambigu : le modèle tranchera
+    exact_matches = {}
+    ambiguous = set()
+    for intent in frozen_intents:
+        if intent["tag"] not in responses_by_tag:
+            continue
+        for pattern in intent["patterns"]:
+            key = normalize_pattern(pattern)
+            if key and exact_matches.setdefault(key, intent["tag"]) != intent["tag"]:
+                ambiguous.add(key)
+    for key in ambiguous:
+        del exact_matches[key]
+
+    classes = tuple(str(tag) for tag in model.classes_)
+    if semantic is not None:
+        classes += tuple(sorted(set(semantic.pattern_tags) - set(classes)))
+    class_responses = tuple(responses_by_tag.get(tag) for tag in classes)
+
+    scorer = None
+    if native_engine:
+        try:
+            scorer = NativeScorer.from_sklearn(vectorizer, model)
+        except ValueError as e:
+            print(f"⚠️ Moteur natif indisponible, retour à scikit-learn : {e}")
+
+    return IntentRuntime(
+        version=version,
+        vectorizer=vectorizer,
+        model=model,
+        intents=frozen_intents,
+        responses_by_tag=responses_by_tag,
+        classes=classes,
+        class_responses=class_responses,
+        scorer=scorer,
+        total_patterns=sum(len(intent["patterns"]) for intent in frozen_intents),
+        total_responses=sum(len(intent["responses"]) for intent in frozen_intents),
+        model_hash=model_hash,
+        artifact_path=artifact_path,
+        metrics=MappingProxyType(dict(metrics)) if metrics else None,
+        exact_matches=MappingProxyType(exact_matches),
+        semantic=semantic,
+        class_index_by_tag=MappingProxyType({tag: index for index, tag in enumerate(classes)})
+    )
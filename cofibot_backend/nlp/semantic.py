@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from nlp.artifact import _prune_versions
+
+# Modèle d'embeddings multilingue (le français est bien couvert), ~120 Mo
+SEMANTIC_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+SEMANTIC_INDEX_FORMAT_VERSION = 1
+
+def intents_content_hash(intents: Sequence[Dict[str, Any]], model_name: str) -> str:
+    """Empreinte des patterns (et du modèle d'embeddings) : clé de l'index persisté"""
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    for intent in intents:
+        digest.update(json.dumps([intent["tag"], list(intent["patterns"])], ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+def vote(pattern_tags: Sequence[str], neighbours: np.ndarray, similarities: np.ndarray,
+         k: int) -> Tuple[List[str], np.ndarray]:
+    """Vote des k plus proches patterns, pondéré par leur similarité cosinus
+
+    Confiance = somme des similarités (positives) du tag gagnant / k : elle
+    baisse quand les voisins se partagent entre intentions ou sont lointains.
+    """
+    tags = []
+    confidences = np.zeros(len(neighbours))
+    for row, (indices, sims) in enumerate(zip(neighbours, similarities)):
+        scores: Dict[str, float] = {}
+        for index, sim in zip(indices, sims):
+            if index < 0:  # Moins de k patterns dans l'index
+                continue
+            tag = pattern_tags[index]
+            scores[tag] = scores.get(tag, 0.0) + max(float(sim), 0.0)
+        best = max(scores, key=scores.get) if scores else None
+        tags.append(best)
+        confidences[row] = scores[best] / k if best is not None else 0.0
+    return tags, confidences
+
+def _load_encoder(model_name: str, max_tokens: int):
+    # Dépendances optionnelles (requirements.txt), importées à la demande
+    from sentence_transformers import SentenceTransformer
+
+    encoder = SentenceTransformer(model_name, device="cpu")
+    # Messages courts : tronquer borne le coût CPU de l'attention
+    encoder.max_seq_length = max_tokens
+    return encoder
+
+class SemanticMatcher:
+    """Intentions par plus proches voisins dans un index FAISS d'embeddings de patterns.
+
+    Chaque pattern n'est encodé qu'une fois : vecteurs et index sont
+    enregistrés dans path/<hash des intentions>/ et relus au redémarrage.
+    Si la latence moyenne mesurée dépasse `budget_ms` par message,
+    within_budget() devient faux et l'appelant revient au TF-IDF (une
+    requête sur `probe_every` continue de mesurer le coût réel).
+    """
+
+    def __init__(self, encoder, index, pattern_tags: Sequence[str], vectors: np.ndarray,
+                 patterns: Sequence[str], content_hash: str, path: Optional[str] = None,
+                 k: int = 5, budget_ms: float = 50.0, probe_every: int = 50):
+        self.encoder = encoder
+        self.index = index
+        self.pattern_tags = tuple(pattern_tags)
+        self.vectors = vectors
+        self.patterns = tuple(patterns)
+        self.content_hash = content_hash
+        self.path = path
+        self.k = k
+        self.budget_ms = budget_ms
+        self.probe_every = probe_every
+        self.latency_ms = None  # Moyenne mobile par message
+        self.over_budget = 0
+
+    @classmethod
+    def build(cls, intents: Sequence[Dict[str, Any]], path: str = "nlp/semantic_index",
+              model_name: str = SEMANTIC_MODEL, max_tokens: int = 64,
+              previous: Optional["SemanticMatcher"] = None, keep: int = 3, **options) -> "SemanticMatcher":
+        """Charge l'index des intentions depuis le disque, ou l'encode et l'enregistre
+
+        `previous` (matcher de l'instantané précédent) fournit l'encodeur
+        déjà chargé et les vecteurs des patterns inchangés : après une
+        modification admin, seuls les nouveaux patterns sont encodés.
+        """
+        import faiss
+
+        content_hash = intents_content_hash(intents, model_name)
+        version_dir = os.path.join(path, content_hash[:16])
+        encoder = previous.encoder if previous is not None else _load_encoder(model_name, max_tokens)
+
+        if os.path.exists(os.path.join(version_dir, "manifest.json")):
+            return cls.load(version_dir, encoder, **options)
+
+        pattern_tags = [intent["tag"] for intent in intents for _ in intent["patterns"]]
+        patterns = [pattern.lower() for intent in intents for pattern in intent["patterns"]]
+        known = {}
+        if previous is not None:
+            known = {pattern: previous.vectors[i] for i, pattern in enumerate(previous.patterns)}
+        missing = sorted({pattern for pattern in patterns if pattern not in known})
+        if missing:
+            start = time.perf_counter()
+            encoded = encoder.encode(missing, batch_size=64, convert_to_numpy=True,
+                                     normalize_embeddings=True, show_progress_bar=False)
+            known.update(zip(missing, encoded))
+            print(f"✅ {len(missing)} patterns encodés en {time.perf_counter() - start:.1f} s")
+        dim = encoder.get_sentence_embedding_dimension()
+        vectors = np.ascontiguousarray(
+            np.stack([known[pattern] for pattern in patterns]) if patterns else np.zeros((0, dim)),
+            dtype=np.float32
+        )
+
+        # Produit scalaire sur vecteurs normalisés = similarité cosinus
+        index = faiss.IndexFlatIP(dim)
+        index.add(vectors)
+
+        os.makedirs(path, exist_ok=True)
+        tmp_dir = f"{version_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, "vectors.npy"), vectors)
+        faiss.write_index(index, os.path.join(tmp_dir, "index.faiss"))
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as file:
+            json.dump({
+                "format_version": SEMANTIC_INDEX_FORMAT_VERSION,
+                "content_hash": content_hash,
+                "model_name": model_name,
+                "dimension": dim,
+                "pattern_tags": pattern_tags,
+                "patterns": patterns
+            }, file, indent=2, ensure_ascii=False)
+        shutil.rmtree(version_dir, ignore_errors=True)
+        os.replace(tmp_dir, version_dir)
+        _prune_versions(path, content_hash[:16], keep)
+
+        return cls(encoder, index, pattern_tags, vectors, patterns, content_hash, version_dir, **options)
+
+    @classmethod
+    def load(cls, version_dir: str, encoder=None, max_tokens: int = 64, **options) -> "SemanticMatcher":
+        """Relit un index enregistré (processus du pool d'inférence, redémarrage)"""
+        import faiss
+
+        with open(os.path.join(version_dir, "manifest.json"), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        if manifest.get("format_version") != SEMANTIC_INDEX_FORMAT_VERSION:
+            raise ValueError(f"Version d'index non supportée : {manifest.get('format_version')}")
+        if encoder is None:
+            encoder = _load_encoder(manifest["model_name"], max_tokens)
+        return cls(
+            encoder,
+            faiss.read_index(os.path.join(version_dir, "index.faiss")),
+            manifest["pattern_tags"],
+            np.load(os.path.join(version_dir, "vectors.npy"), mmap_mode="r"),
+            manifest["patterns"],
+            manifest["content_hash"],
+            version_dir,
+            **options
+        )
+
+    def within_budget(self) -> bool:
+        """Vrai si le coût mesuré tient dans le budget (ou périodiquement, pour le remesurer)"""
+        if self.latency_ms is None or self.latency_ms <= self.budget_ms:
+            return True
+        self.over_budget += 1
+        return self.over_budget % self.probe_every == 0
+
+    def classify(self, texts: List[str], timings: Optional[Dict[str, float]] = None):
+        """Renvoie (tags, confiances) ; tag None si l'index est vide"""
+        start = time.perf_counter()
+        vectors = self.encoder.encode(texts, batch_size=64, convert_to_numpy=True,
+                                      normalize_embeddings=True, show_progress_bar=False)
+        encoded = time.perf_counter()
+        k = max(1, min(self.k, self.index.ntotal))
+        similarities, neighbours = self.index.search(np.ascontiguousarray(vectors, dtype=np.float32), k)
+        tags, confidences = vote(self.pattern_tags, neighbours, similarities, k)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(texts)
+        self.latency_ms = elapsed_ms if self.latency_ms is None else 0.9 * self.latency_ms + 0.1 * elapsed_ms
+        if timings is not None:
+            timings["embed"] = encoded - start
+            timings["knn"] = time.perf_counter() - encoded
+        return tags, confidences
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "content_hash": self.content_hash[:16],
+            "patterns": len(self.patterns),
+            "k": self.k,
+            "budget_ms": self.budget_ms,
+            "latency_ms": round(self.latency_ms, 2) if self.latency_ms is not None else None,
+            "over_budget": self.over_budget
+        }
@@ -1,58 +1,195 @@
 import json
 import random
+import time
+from collections import Counter
+from datetime import datetime
 import joblib
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, f1_score, recall_score
+from sklearn.model_selection import GridSearchCV, StratifiedKFold, cross_val_predict, train_test_split
+from sklearn.pipeline import Pipeline
 import os
 
-def train_nlp_model():
-    """Entraîne le modèle NLP pour la classification d'intentions"""
-    
+# Réglages explorés par la recherche d'hyperparamètres (train_nlp_model(search=True))
+SEARCH_GRID = {
+    "vectorizer__ngram_range": [(1, 1), (1, 2), (1, 3)],
+    "vectorizer__max_features": [1000, 5000, None],
+    "vectorizer__sublinear_tf": [False, True],
+    "classifier__C": [1.0, 10.0, 100.0],
+}
+
+def metrics_path_for(model_path="nlp/model.pkl"):
+    """Fichier de métriques enregistré à côté du modèle"""
+    return os.path.splitext(model_path)[0] + ".metrics.json"
+
+def save_metrics(metrics, model_path="nlp/model.pkl"):
+    path = metrics_path_for(model_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(metrics, file, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def load_metrics(model_path="nlp/model.pkl"):
+    """Métriques du dernier entraînement, None si le modèle n'en a pas"""
+    try:
+        with open(metrics_path_for(model_path), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def evaluate(y_true, y_pred, tags):
+    """Précision, F1 macro et rappel par intention"""
+    recalls = recall_score(y_true, y_pred, labels=tags, average=None, zero_division=0)
+    return {
+        "accuracy": round(float(accuracy_score(y_true, y_pred)), 4),
+        "macro_f1": round(float(f1_score(y_true, y_pred, labels=tags, average="macro", zero_division=0)), 4),
+        "recall_per_intent": {tag: round(float(recall), 4) for tag, recall in zip(tags, recalls)}
+    }
+
+def measure_inference_us(vectorizer, model, texts, limit=200):
+    """Temps moyen de prédiction d'un message isolé, en microsecondes"""
+    sample = texts[:limit]
+    start = time.perf_counter()
+    for text in sample:
+        model.predict_proba(vectorizer.transform([text]))
+    return round((time.perf_counter() - start) / len(sample) * 1e6, 1)
+
+def search_hyperparameters(texts, labels, n_jobs=-1):
+    """Validation croisée stratifiée de toute la grille, en parallèle sur tous les cœurs
+
+    Renvoie le pipeline gagnant (réentraîné sur tout le corpus), ses
+    réglages, les prédictions hors pli et le nombre de plis.
+    """
+    n_splits = max(2, min(5, min(Counter(labels).values())))
+    cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
+    pipeline = Pipeline([
+        ("vectorizer", TfidfVectorizer(stop_words=None)),
+        ("classifier", LogisticRegression(random_state=42, max_iter=1000))
+    ])
+    search = GridSearchCV(
+        pipeline, SEARCH_GRID,
+        scoring={"accuracy": "accuracy", "macro_f1": "f1_macro"},
+        refit="macro_f1", cv=cv, n_jobs=n_jobs
+    )
+    search.fit(texts, labels)
+    # Prédictions hors pli du réglage gagnant : base des métriques par intention
+    predictions = cross_val_predict(search.best_estimator_, texts, labels, cv=cv, n_jobs=n_jobs)
+    return search.best_estimator_, search.best_params_, predictions, n_splits
+
+def train_nlp_model(intents=None, model_path="nlp/model.pkl", progress=None, search=False, n_jobs=-1):
+    """Entraîne le modèle NLP pour la classification d'intentions
+
+    `intents` évite de relire nlp/intents.json (entraînement en processus
+    depuis l'API) ; `progress(stage, fraction, **metrics)` est appelé à
+    chaque étape. `search=True` choisit vectoriseur et régularisation par
+    validation croisée (`n_jobs` processus, -1 = tous les cœurs). Les
+    métriques sont enregistrées dans nlp/model.metrics.json.
+    """
+    report = progress or (lambda stage, fraction, **metrics: None)
+    start_time = time.perf_counter()
+
     # Charger les données d'intentions
-    with open("nlp/intents.json", "r", encoding="utf-8") as file:
-        data = json.load(file)
-    
+    report("chargement", 0.1)
+    if intents is None:
+        with open("nlp/intents.json", "r", encoding="utf-8") as file:
+            intents = json.load(file)["intents"]
+
     texts = []
     labels = []
-    
+
     # Préparer les données d'entraînement
-    for intent in data["intents"]:
+    for intent in intents:
         for pattern in intent["patterns"]:
             texts.append(pattern.lower())  # Normaliser en minuscules
             labels.append(intent["tag"])
-    
-    print(f"📊 Données chargées : {len(texts)} exemples, {len(set(labels))} intentions")
-    
-    # Vectorisation TF-IDF
-    vectorizer = TfidfVectorizer(
-        ngram_range=(1, 2),  # Unigrammes et bigrammes
-        max_features=1000,
-        stop_words=None  # Pas de stop words pour le français
+
+    tags = sorted(set(labels))
+    print(f"📊 Données chargées : {len(texts)} exemples, {len(tags)} intentions")
+
+    if search:
+        # Recherche d'hyperparamètres
+        report("recherche d'hyperparamètres", 0.3)
+        pipeline, best_params, predictions, n_splits = search_hyperparameters(texts, labels, n_jobs)
+        vectorizer = pipeline.named_steps["vectorizer"]
+        model = pipeline.named_steps["classifier"]
+
+        report("évaluation", 0.8)
+        metrics = evaluate(labels, predictions, tags)
+        metrics["evaluation"] = f"validation croisée ({n_splits} plis)"
+        metrics["best_params"] = {
+            name.split("__", 1)[1]: list(value) if isinstance(value, tuple) else value
+            for name, value in best_params.items()
+        }
+        print(f"🔎 Meilleurs réglages : {metrics['best_params']}")
+    else:
+        # Vectorisation TF-IDF
+        report("vectorisation", 0.3)
+        vectorizer = TfidfVectorizer(
+            ngram_range=(1, 2),  # Unigrammes et bigrammes
+            max_features=1000,
+            stop_words=None  # Pas de stop words pour le français
+        )
+
+        X = vectorizer.fit_transform(texts)
+        y = labels
+
+        # Division train/test
+        try:
+            X_train, X_test, y_train, y_test = train_test_split(
+                X, y, test_size=0.2, random_state=42, stratify=y
+            )
+        except ValueError as e:
+            # Trop peu d'exemples par intention pour un jeu de test stratifié
+            print(f"⚠️ Évaluation impossible ({e}), entraînement sur tout le corpus")
+            X_train, X_test, y_train, y_test = X, None, y, None
+
+        # Entraînement du modèle
+        report("entraînement", 0.6)
+        model = LogisticRegression(random_state=42, max_iter=1000)
+        model.fit(X_train, y_train)
+
+        # Évaluation
+        report("évaluation", 0.8)
+        if X_test is not None:
+            metrics = evaluate(y_test, model.predict(X_test), tags)
+            metrics["evaluation"] = "jeu de test (20 %)"
+        else:
+            metrics = {"accuracy": None, "macro_f1": None, "recall_per_intent": {}, "evaluation": None}
+
+    if metrics["accuracy"] is not None:
+        print(f"🎯 Précision du modèle : {metrics['accuracy']:.2%} (F1 macro {metrics['macro_f1']:.2%})")
+
+    metrics.update(
+        training_mode="search" if search else "full",
+        n_examples=len(texts),
+        n_intents=len(tags),
+        train_time_s=round(time.perf_counter() - start_time, 3),
+        inference_us_per_message=measure_inference_us(vectorizer, model, texts),
+        trained_at=datetime.now().isoformat()
     )
-    
-    X = vectorizer.fit_transform(texts)
-    y = labels
-    
-    # Division train/test
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
+
+    # Sauvegarde (fichier temporaire puis remplacement atomique)
+    report("sauvegarde", 0.9)
+    os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+    tmp_path = f"{model_path}.tmp"
+    joblib.dump((vectorizer, model), tmp_path)
+    os.replace(tmp_path, model_path)
+    save_metrics(metrics, model_path)
+
+    print(f"✅ Modèle NLP entraîné et sauvegardé dans {model_path}")
+    report(
+        "sauvegardé", 0.95,
+        accuracy=metrics["accuracy"],
+        macro_f1=metrics["macro_f1"],
+        n_examples=metrics["n_examples"],
+        n_intents=metrics["n_intents"],
+        train_time_s=metrics["train_time_s"],
+        inference_us_per_message=metrics["inference_us_per_message"]
     )
-    
-    # Entraînement du modèle
-    model = LogisticRegression(random_state=42, max_iter=1000)
-    model.fit(X_train, y_train)
-    
-    # Évaluation
-    accuracy = model.score(X_test, y_test)
-    print(f"🎯 Précision du modèle : {accuracy:.2%}")
-    
-    # Sauvegarde
-    os.makedirs("nlp", exist_ok=True)
-    joblib.dump((vectorizer, model), "nlp/model.pkl")
-    
-    print("✅ Modèle NLP entraîné et sauvegardé dans nlp/model.pkl")
     return vectorizer, model
 
 if __name__ == "__main__":
-    train_nlp_model()
+    import sys
+
+    train_nlp_model(search="--search" in sys.argv)
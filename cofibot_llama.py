@@ -1,13 +1,44 @@
-import requests
 import json
+import os
+import time
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional
 
-class CofiBotLlama:
-    def __init__(self, model="llama3.2:3b"):
+import httpx
+
+from generation_cache import CacheEntry, GenerationCache, namespace_hash
+from ollama_connection import OllamaConnection, OllamaError
+from session_memory import SessionMemory
+
+# Session utilisée quand l'appelant n'en précise pas (interface en ligne de commande)
+DEFAULT_SESSION = "default"
+# "transcript" : historique récent renvoyé (et prérempli) à chaque tour ;
+# "context" : tokens déjà traités par Ollama réutilisés, seul le nouveau message est prérempli
+LLM_CONTEXT_MODE = os.getenv("COFIBOT_LLM_CONTEXT_MODE", "transcript")
+# Durée pendant laquelle Ollama garde le modèle (et son cache KV) chargé après un appel
+OLLAMA_KEEP_ALIVE = os.getenv("COFIBOT_OLLAMA_KEEP_ALIVE", "30m")
+# Contexte plus long abandonné : le tour suivant repart du transcript (prompt système compris)
+LLM_CONTEXT_TOKENS = int(os.getenv("COFIBOT_LLM_CONTEXT_TOKENS", "3072"))
+
+class CofiBotLlama(OllamaConnection):
+    def __init__(self, model="llama3.2:3b", store=None, memory: Optional[SessionMemory] = None,
+                 context_mode: str = LLM_CONTEXT_MODE, cache: Optional[GenerationCache] = None,
+                 **connection_options):
+        if context_mode not in ("transcript", "context"):
+            raise ValueError(f"Mode de contexte inconnu : {context_mode}")
         self.model = model
         self.base_url = "http://localhost:11434"
-        self.conversation_history = []
+        # Historique par session : chaque prompt ne voit que les échanges de son utilisateur
+        self.memory = memory if memory is not None else SessionMemory()
+        self.context_mode = context_mode
+        self.keep_alive = OLLAMA_KEEP_ALIVE
+        self.context_tokens = LLM_CONTEXT_TOKENS
+        # Journal durable optionnel (conversation_store.ConversationStore)
+        self.store = store
+        # Réponses déjà générées pour les questions d'ouverture de session (None pour désactiver)
+        self.cache = cache if cache is not None else GenerationCache()
+        # Session persistante et disponibilité en cache (ollama_connection)
+        self._init_connection(**connection_options)
         
         # Prompt système optimisé pour CofiBot
         self.system_prompt = """Tu es CofiBot, l'assistant intelligent de Coficab.
@@ -30,30 +61,180 @@ DOMAINES D'EXPERTISE:
 - Procédures d'entreprise
 - Questions RH générales"""
     
+    def _availability(self, running: bool, model_names: List[str], error: Optional[str]):
+        # Vérifier la connexion
+        if not running:
+            return False, error
+        
+        # Vérifier si le modèle existe
+        if self.model not in model_names:
+            return False, f"Modèle {self.model} non trouvé. Modèles disponibles: {model_names}"
+        
+        return True, "OK"
+    
     def is_available(self):
-        """Vérifie si Ollama et le modèle sont disponibles"""
-        try:
-            # Vérifier la connexion
-            response = requests.get(f"{self.base_url}/api/tags")
-            if response.status_code != 200:
-                return False, "Ollama n'est pas accessible"
-            
-            # Vérifier si le modèle existe
-            models = response.json().get("models", [])
-            model_names = [m["name"] for m in models]
+        """Vérifie si Ollama et le modèle sont disponibles (état en cache, sans aller-retour)"""
+        return self._availability(*self.backend_status())
+    
+    async def ais_available(self):
+        """is_available() sans bloquer la boucle asyncio"""
+        return self._availability(*await self.abackend_status())
+    
+    def _generation_options(self) -> Dict[str, Any]:
+        return {
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "max_tokens": 400,
+            "stop": ["Utilisateur:", "User:"]
+        }
+    
+    def _generate_payload(self, full_prompt: str, context: Optional[List[int]] = None) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "prompt": full_prompt,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": self._generation_options()
+        }
+        if context:
+            payload["context"] = context
+        return payload
+    
+    def _request_payload(self, user_message: str, hint: Optional[str],
+                         session_id: Optional[str]) -> Dict[str, Any]:
+        """Payload du tour : transcript complet, ou nouveau message seul sur le contexte de la session"""
+        context = None
+        if self.context_mode == "context" and session_id is not None:
+            context = self.memory.context(session_id)
+        if context:
+            return self._generate_payload(self._turn_prompt(user_message, hint), context)
+        return self._generate_payload(self._build_prompt(user_message, hint, session_id))
+    
+    def _keep_context(self, session_id: Optional[str], data: Dict[str, Any]):
+        """Garde le contexte renvoyé par Ollama pour le tour suivant (mode "context")"""
+        if self.context_mode != "context" or session_id is None:
+            return
+        context = data.get("context")
+        # Trop long : Ollama tronquerait le début, prompt système compris
+        self.memory.set_context(session_id, context if context and len(context) <= self.context_tokens else None)
+    
+    def cache_namespace(self) -> str:
+        """Empreinte du modèle, des options et du prompt système (clé du cache de réponses)"""
+        return namespace_hash(self.model, self._generation_options(), self.system_prompt)
+    
+    def _cacheable(self, session_id: Optional[str]) -> bool:
+        # Seules les questions qui ouvrent une session passent par le cache :
+        # ensuite, la réponse dépend de la conversation
+        return self.cache is not None and not (session_id is not None and self.memory.recent(session_id))
+    
+    def _cache_lookup(self, user_message: str, hint: Optional[str], session_id: Optional[str],
+                      timings: Dict[str, float]):
+        """(réponse en cache ou None, cacheable)"""
+        if not self._cacheable(session_id):
+            return None, False
+        start = time.perf_counter()
+        entry = self.cache.get(self.cache_namespace(), user_message, hint)
+        timings["cache"] = time.perf_counter() - start
+        return entry, True
+    
+    async def _acache_lookup(self, user_message: str, hint: Optional[str], session_id: Optional[str],
+                             timings: Dict[str, float]):
+        """_cache_lookup() pour asyncio : niveau disque du cache lu dans un thread"""
+        if not self._cacheable(session_id):
+            return None, False
+        start = time.perf_counter()
+        entry = await self.cache.aget(self.cache_namespace(), user_message, hint)
+        timings["cache"] = time.perf_counter() - start
+        return entry, True
+    
+    def _cache_store(self, cacheable: bool, user_message: str, hint: Optional[str],
+                     result: Dict[str, Any], generation_s: float):
+        if cacheable and result["success"]:
+            self.cache.put(self.cache_namespace(), user_message, result["response"], generation_s, hint)
+    
+    async def _acache_store(self, cacheable: bool, user_message: str, hint: Optional[str],
+                            result: Dict[str, Any], generation_s: float):
+        if cacheable and result["success"]:
+            await self.cache.aput(self.cache_namespace(), user_message, result["response"], generation_s, hint)
+    
+    def _cached_result(self, user_message: str, entry: CacheEntry,
+                       session_id: Optional[str]) -> Dict[str, Any]:
+        self._record_exchange(user_message, entry.response, session_id)
+        return {
+            "success": True,
+            "response": entry.response,
+            "model": self.model,
+            "timestamp": datetime.now().isoformat(),
+            "cached": True
+        }
+    
+    def _generation_result(self, user_message: str, response, timings: Dict[str, float],
+                           session_id: Optional[str]) -> Dict[str, Any]:
+        """Résultat de chat() / achat() à partir de la réponse HTTP (requests ou httpx)"""
+        if response.status_code == 200:
+            data = response.json()
+            bot_response = data["response"].strip()
+            # Préremplissage du prompt mesuré par Ollama (ns)
+            if data.get("prompt_eval_duration"):
+                timings["prefill"] = data["prompt_eval_duration"] / 1e9
             
-            if self.model not in model_names:
-                return False, f"Modèle {self.model} non trouvé. Modèles disponibles: {model_names}"
+            # Nettoyer la réponse
+            start = time.perf_counter()
+            bot_response = self._clean_response(bot_response)
+            timings["cleanup"] = time.perf_counter() - start
             
-            return True, "OK"
+            # Sauvegarder dans l'historique
+            start = time.perf_counter()
+            self._record_exchange(user_message, bot_response, session_id)
+            self._keep_context(session_id, data)
+            timings["history"] = time.perf_counter() - start
             
-        except Exception as e:
-            return False, f"Erreur: {str(e)}"
+            return {
+                "success": True,
+                "response": bot_response,
+                "model": self.model,
+                "timestamp": datetime.now().isoformat(),
+                "cached": False
+            }
+        
+        self.mark_down(f"Erreur HTTP: {response.status_code}")
+        return {
+            "success": False,
+            "error": f"Erreur HTTP: {response.status_code}",
+            "response": None
+        }
+    
+    def _communication_error(self, e: Exception) -> Dict[str, Any]:
+        self.mark_down(f"Erreur de communication: {str(e)}")
+        return {
+            "success": False,
+            "error": f"Erreur de communication: {str(e)}",
+            "response": None
+        }
     
-    def chat(self, user_message: str) -> Dict[str, Any]:
-        """Conversation avec l'utilisateur"""
+    def chat(self, user_message: str, timings: Optional[Dict[str, float]] = None,
+             hint: Optional[str] = None, session_id: Optional[str] = DEFAULT_SESSION) -> Dict[str, Any]:
+        """Conversation avec l'utilisateur
+
+        Si `timings` est fourni, il reçoit la durée (s) de chaque étape :
+        cache, availability, prompt, generation (dont prefill, mesuré par
+        Ollama), cleanup, history. `hint` ajoute au prompt une indication
+        venant du classifieur d'intentions ; seul l'historique de
+        `session_id` entre dans le prompt (ou son contexte Ollama en mode
+        "context") ; avec None, l'échange est sans historique et n'est pas
+        gardé en mémoire (seulement dans le journal durable). Une question
+        d'ouverture déjà posée est servie par le cache ("cached": True) sans
+        appeler Ollama.
+        """
+        timings = {} if timings is None else timings
+        cached, cacheable = self._cache_lookup(user_message, hint, session_id, timings)
+        if cached is not None:
+            return self._cached_result(user_message, cached, session_id)
+        start = time.perf_counter()
+        
         # Vérifier la disponibilité
         available, message = self.is_available()
+        timings["availability"] = time.perf_counter() - start
         if not available:
             return {
                 "success": False,
@@ -62,60 +243,160 @@ DOMAINES D'EXPERTISE:
             }
         
         # Construire le prompt complet
-        full_prompt = self._build_prompt(user_message)
+        start = time.perf_counter()
+        payload = self._request_payload(user_message, hint, session_id)
+        timings["prompt"] = time.perf_counter() - start
         
         try:
-            response = requests.post(f"{self.base_url}/api/generate", json={
-                "model": self.model,
-                "prompt": full_prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "max_tokens": 400,
-                    "stop": ["Utilisateur:", "User:"]
-                }
-            })
-            
-            if response.status_code == 200:
-                bot_response = response.json()["response"].strip()
-                
-                # Nettoyer la réponse
-                bot_response = self._clean_response(bot_response)
-                
-                # Sauvegarder dans l'historique
-                self.conversation_history.append({
-                    "timestamp": datetime.now().isoformat(),
-                    "user": user_message,
-                    "bot": bot_response
-                })
-                
-                return {
-                    "success": True,
-                    "response": bot_response,
-                    "model": self.model,
-                    "timestamp": datetime.now().isoformat()
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Erreur HTTP: {response.status_code}",
-                    "response": None
-                }
-                
+            start = time.perf_counter()
+            response = self.session.post(f"{self.base_url}/api/generate", json=payload)
+            timings["generation"] = time.perf_counter() - start
+            result = self._generation_result(user_message, response, timings, session_id)
         except Exception as e:
+            return self._communication_error(e)
+        self._cache_store(cacheable, user_message, hint, result, timings["generation"])
+        return result
+    
+    async def achat(self, user_message: str, timings: Optional[Dict[str, float]] = None,
+                    hint: Optional[str] = None, session_id: Optional[str] = DEFAULT_SESSION) -> Dict[str, Any]:
+        """chat() pour asyncio : la boucle reste libre pendant la génération
+
+        Au plus `parallel` générations sont envoyées à Ollama en même temps ;
+        l'attente d'un emplacement est mesurée dans timings["queue"].
+        """
+        timings = {} if timings is None else timings
+        cached, cacheable = await self._acache_lookup(user_message, hint, session_id, timings)
+        if cached is not None:
+            return self._cached_result(user_message, cached, session_id)
+        start = time.perf_counter()
+        
+        available, message = await self.ais_available()
+        timings["availability"] = time.perf_counter() - start
+        if not available:
             return {
                 "success": False,
-                "error": f"Erreur de communication: {str(e)}",
+                "error": message,
                 "response": None
             }
+        
+        start = time.perf_counter()
+        payload = self._request_payload(user_message, hint, session_id)
+        timings["prompt"] = time.perf_counter() - start
+        
+        try:
+            start = time.perf_counter()
+            async with self.generation_slot():
+                timings["queue"] = time.perf_counter() - start
+                start = time.perf_counter()
+                response = await self.async_client.post(f"{self.base_url}/api/generate", json=payload)
+                timings["generation"] = time.perf_counter() - start
+            result = self._generation_result(user_message, response, timings, session_id)
+        except Exception as e:
+            return self._communication_error(e)
+        await self._acache_store(cacheable, user_message, hint, result, timings["generation"])
+        return result
     
-    def _build_prompt(self, user_message: str) -> str:
+    async def astream(self, user_message: str, stats: Optional[Dict[str, Any]] = None,
+                      hint: Optional[str] = None, session_id: Optional[str] = DEFAULT_SESSION) -> AsyncIterator[str]:
+        """Génère la réponse en streaming : produit les morceaux de texte dès leur arrivée
+
+        La réponse complète (nettoyée) n'entre dans l'historique qu'à la fin
+        du flux. `stats` reçoit queue_s, ttft_s (premier token, attente
+        comprise), generation_s, tokens, tokens_per_s, et prompt_tokens /
+        prefill_s (préremplissage mesuré par Ollama) ; une réponse servie
+        par le cache arrive d'un bloc, avec cached=True. OllamaError si
+        Ollama refuse ou coupe la génération (le backend est alors marqué
+        hors service).
+        """
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        timings = {}
+        cached, cacheable = await self._acache_lookup(user_message, hint, session_id, timings)
+        stats["cached"] = cached is not None
+        if cached is not None:
+            self._record_exchange(user_message, cached.response, session_id)
+            stats["ttft_s"] = stats["generation_s"] = round(time.perf_counter() - start, 4)
+            yield cached.response
+            return
+        payload = {**self._request_payload(user_message, hint, session_id), "stream": True}
+        chunks = []
+        final = {}
+        
+        try:
+            async with self.generation_slot():
+                stats["queue_s"] = round(time.perf_counter() - start, 4)
+                async with self.async_client.stream("POST", f"{self.base_url}/api/generate", json=payload) as response:
+                    if response.status_code != 200:
+                        raise OllamaError(f"Erreur HTTP: {response.status_code}")
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        data = json.loads(line)
+                        chunk = data.get("response", "")
+                        if chunk:
+                            if not chunks:
+                                stats["ttft_s"] = round(time.perf_counter() - start, 4)
+                                first_token = time.perf_counter()
+                            chunks.append(chunk)
+                            yield chunk
+                        if data.get("done"):
+                            final = data
+                            break
+        except (OllamaError, httpx.HTTPError, ValueError) as e:
+            self.mark_down(str(e) if isinstance(e, OllamaError) else f"Erreur de communication: {str(e)}")
+            raise OllamaError(str(e)) from e
+        
+        if not final:
+            self.mark_down("Flux interrompu par Ollama")
+            raise OllamaError("Flux interrompu par Ollama")
+        
+        stats["generation_s"] = round(time.perf_counter() - start, 4)
+        # Compteurs d'Ollama (durée côté serveur, en ns) ; sinon, mesure côté client
+        stats["tokens"] = final.get("eval_count") or len(chunks)
+        if final.get("eval_duration"):
+            stats["tokens_per_s"] = round(stats["tokens"] / (final["eval_duration"] / 1e9), 2)
+        elif chunks and time.perf_counter() > first_token:
+            stats["tokens_per_s"] = round(len(chunks) / (time.perf_counter() - first_token), 2)
+        if "prompt_eval_count" in final:
+            stats["prompt_tokens"] = final["prompt_eval_count"]
+        if final.get("prompt_eval_duration"):
+            stats["prefill_s"] = round(final["prompt_eval_duration"] / 1e9, 4)
+        
+        bot_response = self._clean_response("".join(chunks).strip())
+        self._record_exchange(user_message, bot_response, session_id)
+        self._keep_context(session_id, final)
+        await self._acache_store(cacheable, user_message, hint, {"success": True, "response": bot_response},
+                                 stats["generation_s"])
+    
+    def _record_exchange(self, user_message: str, bot_response: str,
+                         session_id: Optional[str] = DEFAULT_SESSION):
+        """Ajoute un échange à l'historique de la session (et au journal durable s'il existe)"""
+        timestamp = datetime.now().isoformat()
+        # Sans session, rien à poursuivre : pas d'entrée qui évincerait celles des utilisateurs
+        if session_id is not None:
+            self.memory.append(session_id, {
+                "timestamp": timestamp,
+                "user": user_message,
+                "bot": bot_response
+            })
+        if self.store is not None:
+            self.store.enqueue("llama", user_message, bot_response, timestamp=timestamp, model=self.model,
+                               session_id=session_id)
+    
+    def history(self, session_id: str = DEFAULT_SESSION) -> List[Dict[str, str]]:
+        """Échanges gardés pour une session"""
+        return self.memory.recent(session_id)
+    
+    def _build_prompt(self, user_message: str, hint: Optional[str] = None,
+                      session_id: Optional[str] = DEFAULT_SESSION) -> str:
         """Construit le prompt complet avec contexte"""
         prompt = f"{self.system_prompt}\n\n"
         
+        if hint:
+            prompt += f"INDICE (classifieur d'intentions, peut être faux):\n{hint}\n\n"
+        
         # Ajouter l'historique récent (3 derniers échanges)
-        recent_history = self.conversation_history[-3:]
+        recent_history = self.memory.recent(session_id, 3) if session_id is not None else []
         for exchange in recent_history:
             prompt += f"Utilisateur: {exchange['user']}\n"
             prompt += f"CofiBot: {exchange['bot']}\n\n"
@@ -124,6 +405,11 @@ DOMAINES D'EXPERTISE:
         
         return prompt
     
+    def _turn_prompt(self, user_message: str, hint: Optional[str] = None) -> str:
+        """Prompt d'un tour en mode "context" : prompt système et historique sont déjà dans le contexte"""
+        prompt = f"INDICE (classifieur d'intentions, peut être faux):\n{hint}\n\n" if hint else ""
+        return prompt + f"Utilisateur: {user_message}\nCofiBot: "
+    
     def _clean_response(self, response: str) -> str:
         """Nettoie la réponse du modèle"""
         # Supprimer les préfixes indésirables
@@ -143,14 +429,17 @@ DOMAINES D'EXPERTISE:
     def get_stats(self) -> Dict[str, Any]:
         """Statistiques de conversation"""
         return {
-            "total_conversations": len(self.conversation_history),
+            "total_conversations": self.memory.total_exchanges,
             "model_used": self.model,
-            "last_conversation": self.conversation_history[-1]["timestamp"] if self.conversation_history else None
+            "context_mode": self.context_mode,
+            "last_conversation": self.memory.last_timestamp,
+            "sessions": self.memory.stats(),
+            "cache": self.cache.stats() if self.cache is not None else None
         }
     
-    def clear_history(self):
-        """Efface l'historique de conversation"""
-        self.conversation_history = []
+    def clear_history(self, session_id: Optional[str] = None):
+        """Efface l'historique d'une session (de toutes si `session_id` est None)"""
+        self.memory.clear(session_id)
 
 # Interface de test
 def interactive_chat():
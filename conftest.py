@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Comme en production, c'est main.py qui rend le paquet nlp (cofibot_backend/nlp) importable
+from main import BACKEND_DIR
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Copie nlp/ dans un dossier temporaire pour ne jamais modifier les fichiers du dépôt"""
+    shutil.copytree(os.path.join(BACKEND_DIR, "nlp"), tmp_path / "nlp",
+                    ignore=shutil.ignore_patterns("__pycache__"))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def client(workspace, monkeypatch):
+    """Client de test de l'API main.py avec le modèle chargé"""
+    from fastapi.testclient import TestClient
+    from conversation_store import ConversationStore
+    import main
+
+    main.conversation_log.clear()
+    monkeypatch.setattr(main, "conversation_store", ConversationStore("data/conversations.db"))
+    monkeypatch.setattr(main.retrain_scheduler, "quiet_window", 0.05)
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+class FakeOllama:
+    """Serveur Ollama minimal (/api/tags, /api/generate) pour tester les clients sans modèle"""
+
+    def __init__(self):
+        self.models = ["llama3.2:3b", "mistral:7b"]
+        self.generate_status = 200
+        self.reply = "Bonjour, je suis CofiBot."
+        self.delay = 0.0  # Durée simulée d'une génération (s)
+        self.token_delay = 0.0  # Pause entre deux tokens en streaming (s)
+        self.active = 0
+        self.max_active = 0  # Générations simultanées observées
+        lock = threading.Lock()
+        self.requests = []  # (méthode, chemin, port client)
+        self.payloads = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                fake.requests.append(("GET", self.path, self.client_address[1]))
+                if self.path == "/api/tags":
+                    self._send(200, {"models": [{"name": name} for name in fake.models]})
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                fake.requests.append(("POST", self.path, self.client_address[1]))
+                fake.payloads.append(json.loads(body or b"{}"))
+                with lock:
+                    fake.active += 1
+                    fake.max_active = max(fake.max_active, fake.active)
+                time.sleep(fake.delay)
+                with lock:
+                    fake.active -= 1
+                if fake.generate_status != 200:
+                    self._send(fake.generate_status, {"error": "panne"})
+                elif fake.payloads[-1].get("stream"):
+                    self._stream(fake.reply.split(" "), fake.payloads[-1])
+                else:
+                    self._send(200, {"response": fake.reply, "done": True,
+                                     **fake.final_fields(fake.payloads[-1], fake.reply.split(" "))})
+
+            def _stream(self, words, payload):
+                # NDJSON en transfert chunked, comme Ollama avec "stream": true
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                lines = [{"response": word if i == 0 else f" {word}", "done": False} for i, word in enumerate(words)]
+                lines.append({"response": "", "done": True, "eval_count": len(words), "eval_duration": 500_000_000,
+                              **fake.final_fields(payload, words)})
+                for line in lines:
+                    data = (json.dumps(line) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+                    time.sleep(fake.token_delay)
+                self.wfile.write(b"0\r\n\r\n")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def final_fields(payload, words):
+        # Un mot = un token : le contexte renvoyé prolonge celui reçu du prompt et de la réponse,
+        # seul le prompt du tour est prérempli (1 ms par token)
+        prompt_tokens = len(payload.get("prompt", "").split())
+        context = list(payload.get("context") or []) + list(range(prompt_tokens + len(words)))
+        return {"context": context, "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": prompt_tokens * 1_000_000}
+
+    def count(self, method, path):
+        return sum(1 for m, p, _ in self.requests if (m, p) == (method, path))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def ollama_server():
+    """Faux serveur Ollama local"""
+    server = FakeOllama()
+    yield server
+    server.close()
+
+@pytest.fixture
+def llama_bot(ollama_server, monkeypatch):
+    """Client LLM de api_with_llama.py branché sur le faux serveur, sans journal sur disque"""
+    import api_with_llama
+    from generation_cache import GenerationCache
+    from session_memory import SessionMemory
+
+    bot = api_with_llama.cofibot
+    monkeypatch.setattr(api_with_llama, "conversation_store", None)
+    monkeypatch.setattr(bot, "base_url", ollama_server.url)
+    monkeypatch.setattr(bot, "store", None)
+    monkeypatch.setattr(bot, "cache", GenerationCache())
+    monkeypatch.setattr(bot, "_status", None)
+    monkeypatch.setattr(bot, "probe_interval", 0)
+    monkeypatch.setattr(bot, "memory", SessionMemory())
+    return bot
@@ -0,0 +1,234 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+class ConversationStore:
+    """Journal durable des conversations (SQLite en mode WAL, ajout seul).
+
+    Le chemin des requêtes se contente de mettre l'échange en file ; un thread
+    d'écriture en arrière-plan vide la file par lots, une transaction par lot.
+    File pleine : l'échange est ajouté à un fichier de débordement
+    (`<path>.spill`, une ligne JSON par échange) que le thread d'écriture
+    reverse dans la base dès que la file est vide ; il n'est perdu (compté
+    dans `dropped`) que si ce fichier ne peut pas être écrit.
+    Les lectures ouvrent leur propre connexion et ne bloquent pas l'écriture.
+    """
+
+    def __init__(self, path: str = "data/conversations.db", batch_size: int = 200,
+                 flush_interval: float = 0.5, queue_size: int = 10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.spill_path = f"{path}.spill"
+        self.dropped = 0
+        self.spilled = 0
+        self.written = 0
+        self._thread = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def start(self):
+        """Crée la base si besoin et lance le thread d'écriture"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self.path = os.path.abspath(self.path)
+            self.spill_path = f"{self.path}.spill"
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self._connect() as connection:
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS conversations (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        source TEXT NOT NULL,
+                        timestamp TEXT NOT NULL,
+                        user_message TEXT NOT NULL,
+                        bot_response TEXT,
+                        intent TEXT,
+                        confidence REAL,
+                        extra TEXT
+                    )
+                """)
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_conversations_source_time "
+                    "ON conversations (source, timestamp)"
+                )
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._writer_loop, name="cofibot-conversation-writer",
+                                            daemon=True)
+            self._thread.start()
+
+    def enqueue(self, source: str, user_message: str, bot_response: Optional[str],
+                intent: Optional[str] = None, confidence: Optional[float] = None,
+                timestamp: Optional[str] = None, **extra):
+        """Met un échange en file sans attendre la base (débordement sur disque si la file est pleine)"""
+        if self._thread is None:
+            self.start()
+        row = (
+            source,
+            timestamp or datetime.now().isoformat(),
+            user_message,
+            bot_response,
+            intent,
+            confidence,
+            json.dumps(extra, ensure_ascii=False) if extra else None
+        )
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self._spill(row)
+
+    def _spill(self, row):
+        try:
+            with self._spill_lock:
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                self.spilled += 1
+        except OSError as e:
+            print(f"❌ Échange perdu (débordement impossible) : {e}")
+            self.dropped += 1
+
+    def _insert(self, connection: sqlite3.Connection, rows):
+        with connection:
+            connection.executemany(
+                "INSERT INTO conversations "
+                "(source, timestamp, user_message, bot_response, intent, confidence, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        self.written += len(rows)
+
+    def _drain_spill(self, connection: sqlite3.Connection):
+        """Reverse le fichier de débordement dans la base (une transaction)"""
+        draining_path = f"{self.spill_path}.draining"
+        with self._drain_lock:
+            try:
+                if not os.path.exists(draining_path):
+                    # Renommé sous verrou : les débordements suivants repartent d'un fichier neuf
+                    with self._spill_lock:
+                        if not os.path.exists(self.spill_path):
+                            return
+                        os.replace(self.spill_path, draining_path)
+                rows = []
+                with open(draining_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            rows.append(tuple(json.loads(line)))
+                        except ValueError:
+                            self.dropped += 1  # Ligne tronquée (arrêt brutal pendant l'écriture)
+                self._insert(connection, rows)
+                os.remove(draining_path)
+            except (OSError, sqlite3.Error) as e:
+                # Le fichier reste en place : nouvel essai au prochain passage
+                print(f"❌ Erreur écriture historique (débordement) : {e}")
+
+    def _writer_loop(self):
+        connection = self._connect()
+        try:
+            while not (self._stopping.is_set() and self.queue.empty()):
+                try:
+                    batch = [self.queue.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    self._drain_spill(connection)
+                    continue
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    self._insert(connection, batch)
+                except sqlite3.Error as e:
+                    print(f"❌ Erreur écriture historique : {e}")
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+                if self.queue.empty():
+                    self._drain_spill(connection)
+            self._drain_spill(connection)
+        finally:
+            connection.close()
+
+    def flush(self):
+        """Attend que tous les échanges en file (ou débordés) soient écrits"""
+        if self._thread is not None:
+            self.queue.join()
+            connection = self._connect()
+            try:
+                self._drain_spill(connection)
+            finally:
+                connection.close()
+
+    def close(self):
+        """Écrit ce qui reste en file puis arrête le thread d'écriture"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def query(self, source: Optional[str] = None, start: Optional[str] = None,
+              end: Optional[str] = None, limit: int = 50,
+              before_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Page d'échanges, du plus récent au plus ancien.
+
+        `start`/`end` bornent l'horodatage ISO (inclus/exclu) ; pour la page
+        suivante, repasser l'id du dernier élément reçu dans `before_id`.
+        """
+        if self._thread is None and not os.path.exists(self.path):
+            return []
+
+        clauses, params = [], []
+        if source is not None:
+            clauses.append("source = ?")
+            params.append(source)
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(end)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        connection = self._connect()
+        try:
+            connection.row_factory = sqlite3.Row
+            rows = connection.execute(
+                f"SELECT * FROM conversations {where} ORDER BY id DESC LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+        finally:
+            connection.close()
+
+        conversations = []
+        for row in rows:
+            conversation = dict(row)
+            extra = conversation.pop("extra")
+            if extra:
+                conversation.update(json.loads(extra))
+            conversations.append(conversation)
+        return conversations
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "pending": self.queue.qsize(),
+            "written": self.written,
+            "spilled": self.spilled,
+            "dropped": self.dropped
+        }
@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+# Réponses gardées en mémoire (0 pour désactiver le cache)
+LLM_CACHE_SIZE = int(os.getenv("COFIBOT_LLM_CACHE_SIZE", "512"))
+# Âge maximal d'une réponse en cache (s)
+LLM_CACHE_TTL_S = float(os.getenv("COFIBOT_LLM_CACHE_TTL_S", "86400"))
+# Niveau disque SQLite qui survit aux redémarrages (chaîne vide pour le désactiver)
+LLM_CACHE_DB = os.getenv("COFIBOT_LLM_CACHE_DB", "")
+# Réponses gardées sur disque au plus
+LLM_CACHE_DISK_SIZE = int(os.getenv("COFIBOT_LLM_CACHE_DISK_SIZE", "10000"))
+# Similarité (trigrammes de caractères) au-delà de laquelle une question voisine compte
+# comme un succès ; 0 = questions identiques (une fois normalisées) uniquement
+LLM_CACHE_SIMILARITY = float(os.getenv("COFIBOT_LLM_CACHE_SIMILARITY", "0"))
+
+def normalize_question(text: str) -> str:
+    """Minuscules, sans accents ni ponctuation, espaces compactés"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+def trigrams(text: str) -> FrozenSet[str]:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Indice de Jaccard de deux ensembles de trigrammes"""
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+def namespace_hash(model: str, options: Dict[str, Any], system_prompt: str) -> str:
+    """Empreinte de ce qui fait varier une génération hors question : modèle, options, prompt système"""
+    return hashlib.sha256(
+        json.dumps([model, options, system_prompt], sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:16]
+
+class CacheEntry:
+    __slots__ = ("namespace", "question", "response", "generation_s", "created", "grams")
+
+    def __init__(self, namespace: str, question: str, response: str, generation_s: float, created: float):
+        self.namespace = namespace
+        self.question = question
+        self.response = response
+        self.generation_s = generation_s
+        self.created = created
+        self.grams = trigrams(question)
+
+class GenerationCache:
+    """Cache des réponses du LLM : question normalisée -> réponse générée.
+
+    La clé combine l'espace de noms (modèle, options, prompt système :
+    namespace_hash), l'indice éventuel du classifieur et la question
+    normalisée. Niveau mémoire LRU borné à `capacity`, entrées oubliées
+    après `ttl` secondes ; le niveau disque optionnel (SQLite) est relu au
+    démarrage. Avec `similarity` > 0, la question en cache la plus proche
+    du même espace de noms compte aussi comme un succès.
+
+    aget() / aput() servent la boucle asyncio : le niveau mémoire y est lu
+    directement, le niveau disque dans un thread (asyncio.to_thread). Le
+    verrou ne protège que le niveau mémoire, jamais une requête SQLite.
+    """
+
+    def __init__(self, capacity: int = LLM_CACHE_SIZE, ttl: float = LLM_CACHE_TTL_S,
+                 path: Optional[str] = LLM_CACHE_DB, disk_capacity: int = LLM_CACHE_DISK_SIZE,
+                 similarity: float = LLM_CACHE_SIMILARITY):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.path = os.path.abspath(path) if path else None
+        self.disk_capacity = disk_capacity
+        self.similarity = similarity
+        self.entries: "OrderedDict[Tuple[str, str, str], CacheEntry]" = OrderedDict()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.saved_s = 0.0
+        self._lock = threading.Lock()
+        if self.path and capacity > 0:
+            self._open_disk()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _open_disk(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS generations (
+                    namespace TEXT NOT NULL,
+                    hint TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    generation_s REAL NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (namespace, hint, question)
+                )
+            """)
+            connection.execute("DELETE FROM generations WHERE created < ?", (time.time() - self.ttl,))
+            # Les plus récentes reviennent en mémoire (et dans la recherche de voisins)
+            rows = connection.execute(
+                "SELECT namespace, hint, question, response, generation_s, created FROM generations "
+                "ORDER BY created DESC LIMIT ?", (self.capacity,)
+            ).fetchall()
+        for namespace, hint, question, response, generation_s, created in reversed(rows):
+            self.entries[(namespace, hint, question)] = CacheEntry(namespace, question, response,
+                                                                   generation_s, created)
+
+    def _disk_get(self, key: Tuple[str, str, str]) -> Optional[CacheEntry]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT response, generation_s, created FROM generations "
+                "WHERE namespace = ? AND hint = ? AND question = ?", key
+            ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return None
+        return CacheEntry(key[0], key[2], *row)
+
+    def _disk_put(self, key: Tuple[str, str, str], entry: CacheEntry):
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?, ?)",
+                               (*key, entry.response, entry.generation_s, entry.created))
+            connection.execute(
+                "DELETE FROM generations WHERE rowid IN (SELECT rowid FROM generations "
+                "ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.disk_capacity,)
+            )
+
+    def _store(self, key: Tuple[str, str, str], entry: CacheEntry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def _nearest(self, namespace: str, hint: str, question: str, now: float) -> Optional[CacheEntry]:
+        grams = trigrams(question)
+        best, best_score = None, self.similarity
+        for (entry_namespace, entry_hint, _), entry in self.entries.items():
+            if entry_namespace != namespace or entry_hint != hint or now - entry.created > self.ttl:
+                continue
+            score = similarity(grams, entry.grams)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    @staticmethod
+    def _key(namespace: str, question: str, hint: Optional[str]) -> Tuple[str, str, str]:
+        return (namespace, hint or "", normalize_question(question))
+
+    def _memory_get(self, key: Tuple[str, str, str], now: float) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry.created > self.ttl:
+                del self.entries[key]
+                return None
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def _resolve(self, key: Tuple[str, str, str], entry: Optional[CacheEntry], from_disk: bool,
+                 now: float) -> Optional[CacheEntry]:
+        # Compte le résultat ; question voisine en dernier recours
+        with self._lock:
+            if entry is not None:
+                if from_disk:
+                    self._store(key, entry)
+                self.hits += 1
+            elif self.similarity > 0:
+                entry = self._nearest(*key, now)
+                if entry is not None:
+                    self.near_hits += 1
+            if entry is None:
+                self.misses += 1
+                return None
+            self.saved_s += entry.generation_s
+            return entry
+
+    def get(self, namespace: str, question: str, hint: Optional[str] = None) -> Optional[CacheEntry]:
+        """Réponse en cache pour cette question (ou une question voisine), None sinon"""
+        if self.capacity <= 0:
+            return None
+        key = self._key(namespace, question, hint)
+        now = time.time()
+        entry = self._memory_get(key, now)
+        from_disk = entry is None and self.path is not None
+        if from_disk:
+            entry = self._disk_get(key)
+        return self._resolve(key, entry, from_disk, now)
+
+    async def aget(self, namespace: str, question: str, hint: Optional[str] = None) -> Optional[CacheEntry]:
+        """get() sans bloquer la boucle asyncio sur le niveau disque"""
+        if self.capacity <= 0:
+            return None
+        key = self._key(namespace, question, hint)
+        now = time.time()
+        entry = self._memory_get(key, now)
+        from_disk = entry is None and self.path is not None
+        if from_disk:
+            entry = await asyncio.to_thread(self._disk_get, key)
+        return self._resolve(key, entry, from_disk, now)
+
+    def _memory_put(self, namespace: str, question: str, response: str, generation_s: float,
+                    hint: Optional[str]):
+        key = self._key(namespace, question, hint)
+        entry = CacheEntry(namespace, key[2], response, generation_s, time.time())
+        with self._lock:
+            self._store(key, entry)
+        return key, entry
+
+    def put(self, namespace: str, question: str, response: str, generation_s: float,
+            hint: Optional[str] = None):
+        """Garde une réponse générée en `generation_s` secondes"""
+        if self.capacity <= 0 or not response:
+            return
+        key, entry = self._memory_put(namespace, question, response, generation_s, hint)
+        if self.path:
+            self._disk_put(key, entry)
+
+    async def aput(self, namespace: str, question: str, response: str, generation_s: float,
+                   hint: Optional[str] = None):
+        """put() sans bloquer la boucle asyncio sur l'écriture disque"""
+        if self.capacity <= 0 or not response:
+            return
+        key, entry = self._memory_put(namespace, question, response, generation_s, hint)
+        if self.path:
+            await asyncio.to_thread(self._disk_put, key, entry)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+        if self.path:
+            with self._connect() as connection:
+                connection.execute("DELETE FROM generations")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.near_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "capacity": self.capacity,
+            "ttl_s": self.ttl,
+            "disk": self.path,
+            "similarity": self.similarity,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.near_hits) / total, 4) if total else 0.0,
+            "saved_generation_s": round(self.saved_s, 3)
+        }
@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+class IntentExists(Exception):
+    """Une intention porte déjà ce tag"""
+
+class IntentNotFound(Exception):
+    """Aucune intention ne porte ce tag"""
+
+class IntentStore:
+    """Intentions stockées dans SQLite : une ligne par intention, pattern et réponse.
+
+    Une modification admin ne touche que les lignes de l'intention concernée,
+    dans une transaction BEGIN IMMEDIATE : deux requêtes concurrentes (même
+    dans des processus différents) sont sérialisées au lieu de s'écraser.
+    nlp/intents.json reste le format d'échange : il est importé au premier
+    démarrage (ou s'il a été modifié à la main) et réexporté avant chaque
+    entraînement pour train_nlp.py.
+    """
+
+    def __init__(self, path: str = "data/intents.db", json_path: str = "nlp/intents.json"):
+        self.path = path
+        self.json_path = json_path
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Mode autocommit : les transactions sont ouvertes explicitement
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def _json_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.json_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def open(self):
+        """Crée le schéma et (ré)importe intents.json s'il est nouveau ou modifié à la main"""
+        connection = self._connect()
+        try:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS intents (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tag TEXT NOT NULL UNIQUE,
+                    position INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS patterns (
+                    intent_id INTEGER NOT NULL REFERENCES intents (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    text TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS responses (
+                    intent_id INTEGER NOT NULL REFERENCES intents (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    text TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_intents_position ON intents (position);
+                CREATE INDEX IF NOT EXISTS idx_patterns_intent ON patterns (intent_id);
+                CREATE INDEX IF NOT EXISTS idx_responses_intent ON responses (intent_id);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+        finally:
+            connection.close()
+
+        with self._transaction() as connection:
+            json_mtime = self._json_mtime()
+            row = connection.execute("SELECT value FROM meta WHERE key = 'json_mtime'").fetchone()
+            if json_mtime is not None and (row is None or int(row[0]) != json_mtime):
+                with open(self.json_path, "r", encoding="utf-8") as f:
+                    intents = json.load(f)["intents"]
+                connection.execute("DELETE FROM intents")
+                for intent in intents:
+                    self._insert(connection, intent)
+                self._set_json_mtime(connection, json_mtime)
+                print(f"✅ {len(intents)} intentions importées depuis {self.json_path}")
+
+    @staticmethod
+    def _set_json_mtime(connection: sqlite3.Connection, json_mtime: int):
+        connection.execute(
+            "INSERT INTO meta (key, value) VALUES ('json_mtime', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (str(json_mtime),)
+        )
+
+    @staticmethod
+    def _insert_rows(connection: sqlite3.Connection, intent_id: int, intent: Dict[str, Any]):
+        connection.executemany(
+            "INSERT INTO patterns (intent_id, position, text) VALUES (?, ?, ?)",
+            [(intent_id, i, text) for i, text in enumerate(intent["patterns"])]
+        )
+        connection.executemany(
+            "INSERT INTO responses (intent_id, position, text) VALUES (?, ?, ?)",
+            [(intent_id, i, text) for i, text in enumerate(intent["responses"])]
+        )
+
+    def _insert(self, connection: sqlite3.Connection, intent: Dict[str, Any]):
+        try:
+            cursor = connection.execute(
+                "INSERT INTO intents (tag, position) "
+                "VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM intents))",
+                (intent["tag"],)
+            )
+        except sqlite3.IntegrityError:
+            raise IntentExists(intent["tag"])
+        self._insert_rows(connection, cursor.lastrowid, intent)
+
+    @staticmethod
+    def _intent_id(connection: sqlite3.Connection, tag: str) -> int:
+        row = connection.execute("SELECT id FROM intents WHERE tag = ?", (tag,)).fetchone()
+        if row is None:
+            raise IntentNotFound(tag)
+        return row[0]
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Toutes les intentions, dans l'ordre d'ajout (même forme que intents.json)"""
+        connection = self._connect()
+        try:
+            intents = {}
+            for intent_id, tag in connection.execute("SELECT id, tag FROM intents ORDER BY position"):
+                intents[intent_id] = {"tag": tag, "patterns": [], "responses": []}
+            for table in ("patterns", "responses"):
+                rows = connection.execute(f"SELECT intent_id, text FROM {table} ORDER BY intent_id, position")
+                for intent_id, text in rows:
+                    intents[intent_id][table].append(text)
+        finally:
+            connection.close()
+        return list(intents.values())
+
+    def get(self, tag: str) -> Dict[str, Any]:
+        connection = self._connect()
+        try:
+            intent_id = self._intent_id(connection, tag)
+            return {
+                "tag": tag,
+                "patterns": [text for text, in connection.execute(
+                    "SELECT text FROM patterns WHERE intent_id = ? ORDER BY position", (intent_id,))],
+                "responses": [text for text, in connection.execute(
+                    "SELECT text FROM responses WHERE intent_id = ? ORDER BY position", (intent_id,))]
+            }
+        finally:
+            connection.close()
+
+    def add(self, intent: Dict[str, Any]):
+        """Ajoute une intention (IntentExists si le tag est pris)"""
+        with self._transaction() as connection:
+            self._insert(connection, intent)
+
+    def update(self, tag: str, intent: Dict[str, Any]):
+        """Remplace patterns et réponses d'une intention, renommage compris"""
+        with self._transaction() as connection:
+            intent_id = self._intent_id(connection, tag)
+            try:
+                connection.execute("UPDATE intents SET tag = ? WHERE id = ?", (intent["tag"], intent_id))
+            except sqlite3.IntegrityError:
+                raise IntentExists(intent["tag"])
+            connection.execute("DELETE FROM patterns WHERE intent_id = ?", (intent_id,))
+            connection.execute("DELETE FROM responses WHERE intent_id = ?", (intent_id,))
+            self._insert_rows(connection, intent_id, intent)
+
+    def delete(self, tag: str):
+        with self._transaction() as connection:
+            intent_id = self._intent_id(connection, tag)
+            connection.execute("DELETE FROM intents WHERE id = ?", (intent_id,))
+
+    def export_json(self) -> str:
+        """Réécrit intents.json depuis la base (compatibilité train_nlp.py)"""
+        intents = self.load()
+        tmp_path = f"{self.json_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"intents": intents}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.json_path)
+        with self._transaction() as connection:
+            # Notre propre export ne doit pas être réimporté comme une édition manuelle
+            self._set_json_mtime(connection, self._json_mtime())
+        return self.json_path
+
+if __name__ == "__main__":
+    store = IntentStore()
+    store.open()
+    print(f"✅ intents.json exporté ({len(store.load())} intentions) : {store.export_json()}")
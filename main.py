@@ -1,21 +1,61 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
 import joblib
 import json
 import random
 import os
-from typing import Dict, Any, List
+import sys
+from typing import Dict, Any, List, Optional
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
 
+# Le paquet nlp vit dans cofibot_backend/ : main.py s'importe seul, depuis la racine
+# comme depuis cofibot_backend (python ../main.py), et dans les processus relancés
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cofibot_backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from nlp.runtime import build_runtime
+from nlp.semantic import SEMANTIC_MODEL, SemanticMatcher
+from nlp.artifact import current_artifact, file_sha256, load_artifact, save_artifact
+from nlp.train_nlp import load_metrics, train_nlp_model
+from nlp.incremental import IncrementalTrainer
+from conversation_store import ConversationStore
+from metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, MetricsRegistry
+from intent_store import IntentExists, IntentNotFound, IntentStore
+from cofibot_llama import CofiBotLlama
+import asyncio
+import itertools
+import sqlite3
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    if not load_model():
+    if conversation_store is not None:
+        conversation_store.start()
+    if preloaded and runtime is not None:
+        # Modèle chargé avant fork par serve() : pages partagées entre workers
+        inference_pool.refresh(runtime)
+    elif not load_model():
         print("⚠️ Impossible de charger le modèle. Certaines fonctionnalités ne marcheront pas.")
+    model_watcher.start()
     yield
-    # Shutdown (si nécessaire)
+    # Shutdown
+    model_watcher.stop()
+    inference_pool.shutdown()
+    retrain_scheduler.stop()
+    shutdown_retrain_executor()
+    shutdown_semantic_executor()
+    await llm.aclose()
+    if conversation_store is not None:
+        conversation_store.close()
 
 # Initialisation de l'application FastAPI avec lifespan
 app = FastAPI(
@@ -37,11 +77,27 @@ app.add_middleware(
 # Modèles Pydantic
 class Question(BaseModel):
     message: str
+    # Conversation LLM du mode hybride (/chat) ; sans identifiant, pas de contexte
+    session_id: Optional[str] = Field(None, min_length=1, max_length=128)
 
 class ChatResponse(BaseModel):
     intent: str
     response: str
     confidence: float
+    exact_match: bool = False  # Réponse issue d'un pattern identique, sans passer par le modèle
+
+class HybridChatResponse(BaseModel):
+    intent: str
+    response: str
+    confidence: float
+    route: str  # "exact", "intent", "llm" ou "fallback" (LLM indisponible)
+    exact_match: bool = False
+
+class BatchQuestion(BaseModel):
+    messages: List[str]
+
+class BatchChatResponse(BaseModel):
+    results: List[ChatResponse]
 
 class Intent(BaseModel):
     tag: str
@@ -53,59 +109,865 @@ class IntentUpdate(BaseModel):
     patterns: List[str]
     responses: List[str]
 
-# Variables globales pour le modèle
-vectorizer = None
-model = None
-intents_data = None
-conversation_history = []
+# Instantané compilé du modèle et des intentions (nlp.runtime.IntentRuntime).
+# Les requêtes le lisent sans verrou : il n'est jamais modifié, seulement
+# remplacé d'un bloc par publish_runtime().
+runtime = None
+_runtime_versions = itertools.count(1)
+# Vrai dans les workers forkés par serve() : le modèle est déjà en mémoire
+preloaded = False
+
+UNKNOWN_RESPONSE = "Je ne comprends pas ta demande 😕. Peux-tu reformuler ?"
+
+# Moteur de scoring : "sklearn" (défaut) ou "native" (nlp.engine, NumPy pur)
+ENGINE = os.getenv("COFIBOT_ENGINE", "sklearn")
+
+# Détection d'intention : "tfidf" (défaut) ou "semantic" (plus proches patterns
+# dans un index FAISS d'embeddings ; sentence-transformers et faiss-cpu requis)
+INTENT_MATCHER = os.getenv("COFIBOT_INTENT_MATCHER", "tfidf")
+SEMANTIC_INDEX_DIR = os.getenv("COFIBOT_SEMANTIC_INDEX", "nlp/semantic_index")
+SEMANTIC_MODEL_NAME = os.getenv("COFIBOT_SEMANTIC_MODEL", SEMANTIC_MODEL)
+SEMANTIC_K = int(os.getenv("COFIBOT_SEMANTIC_K", "5"))
+# Budget CPU par message : au-delà, retour au TF-IDF
+SEMANTIC_BUDGET_MS = float(os.getenv("COFIBOT_SEMANTIC_BUDGET_MS", "50"))
+SEMANTIC_MAX_TOKENS = int(os.getenv("COFIBOT_SEMANTIC_MAX_TOKENS", "64"))
+
+# Format du modèle servi : "pickle" (nlp/model.pkl) ou "artifact" (tableaux
+# .npy mappés en mémoire, partagés entre processus, démarrage quasi immédiat)
+MODEL_FORMAT = os.getenv("COFIBOT_MODEL_FORMAT", "pickle")
+MODEL_ARTIFACT_DIR = os.getenv("COFIBOT_MODEL_ARTIFACT", "nlp/model_artifact")
+
+# Taille maximale d'un lot pour /chatbot/batch
+MAX_BATCH_SIZE = int(os.getenv("COFIBOT_MAX_BATCH_SIZE", "5000"))
+
+# Nombre de messages normalisés gardés en cache (0 pour désactiver)
+PREDICTION_CACHE_SIZE = int(os.getenv("COFIBOT_CACHE_SIZE", "1024"))
+
+class PredictionCache:
+    """Cache LRU borné : message normalisé -> (indice de classe, confiance).
+
+    Chaque entrée appartient à une version de l'instantané ; dès qu'une
+    nouvelle version est publiée (load_model, retrain_model, admin), le cache
+    est vidé au premier accès. Seule la prédiction est mise en cache, la
+    réponse reste tirée au hasard à chaque requête.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _sync_version(self, version: int):
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+    def get(self, version: int, key: str):
+        with self.lock:
+            self._sync_version(version)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, version: int, key: str, class_index: int, confidence: float):
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            self._sync_version(version)
+            self.entries[key] = (class_index, confidence)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "capacity": self.capacity,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE)
+
+# Nombre de conversations gardées en mémoire pour /admin/conversations
+CONVERSATION_LOG_SIZE = int(os.getenv("COFIBOT_CONVERSATION_LOG_SIZE", "10000"))
+
+class ConversationRecord:
+    """Échange compact (pas de __dict__ par enregistrement)"""
+    __slots__ = ("id", "timestamp", "user_message", "bot_response", "intent", "confidence")
+
+    def __init__(self, id: int, timestamp: datetime, user_message: str, bot_response: str,
+                 intent: str, confidence: float):
+        self.id = id
+        self.timestamp = timestamp
+        self.user_message = user_message
+        self.bot_response = bot_response
+        self.intent = intent
+        self.confidence = confidence
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "timestamp": self.timestamp.isoformat(),
+            "user_message": self.user_message,
+            "bot_response": self.bot_response,
+            "intent": self.intent,
+            "confidence": self.confidence
+        }
+
+class ConversationLog:
+    """Tampon circulaire de conversations avec compteurs tenus à l'insertion.
+
+    Les compteurs (total, par intention, par heure de la journée) couvrent
+    toutes les conversations depuis le démarrage, y compris celles déjà
+    sorties du tampon : les statistiques admin restent en O(1).
+    """
+
+    def __init__(self, capacity: int):
+        self.records = deque(maxlen=capacity)
+        self.total = 0
+        self.intent_usage: Dict[str, int] = {}
+        self.hourly_usage = [0] * 24
+        self.lock = threading.Lock()
+
+    def append(self, user_message: str, bot_response: str, intent: str, confidence: float):
+        timestamp = datetime.now()
+        with self.lock:
+            self.total += 1
+            self.records.append(ConversationRecord(
+                self.total, timestamp, user_message, bot_response, intent, confidence
+            ))
+            self.intent_usage[intent] = self.intent_usage.get(intent, 0) + 1
+            self.hourly_usage[timestamp.hour] += 1
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        """Les `limit` dernières conversations, de la plus ancienne à la plus récente"""
+        with self.lock:
+            latest = list(itertools.islice(reversed(self.records), limit))
+        return [record.to_dict() for record in reversed(latest)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "total_conversations": self.total,
+                "intent_usage": dict(self.intent_usage),
+                "hourly_usage": list(self.hourly_usage)
+            }
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+            self.total = 0
+            self.intent_usage = {}
+            self.hourly_usage = [0] * 24
+
+    def __len__(self) -> int:
+        return self.total
+
+conversation_log = ConversationLog(CONVERSATION_LOG_SIZE)
+
+# Journal durable pour l'audit (chaîne vide pour le désactiver)
+CONVERSATION_DB = os.getenv("COFIBOT_CONVERSATION_DB", "data/conversations.db")
+conversation_store = ConversationStore(CONVERSATION_DB) if CONVERSATION_DB else None
+
+# Intentions en base SQLite (une ligne par pattern) ; vide = réécriture de intents.json
+INTENTS_DB = os.getenv("COFIBOT_INTENTS_DB", "data/intents.db")
+intent_store = IntentStore(INTENTS_DB) if INTENTS_DB else None
+
+# Métriques Prometheus (/metrics) : requêtes HTTP et durée de chaque étape de /chatbot
+metrics = MetricsRegistry()
+metrics.describe("http_requests_total", "counter", "Requêtes HTTP par route, méthode et statut")
+metrics.describe("http_request_duration_seconds", "histogram", "Durée des requêtes HTTP par route")
+metrics.describe("stage_duration_seconds", "histogram",
+                 "Durée des étapes de classification "
+                 "(normalize, exact_match, cache, transform, predict_proba, lookup, history, llm_*)")
+metrics.describe("exact_match_total", "counter", "Messages identiques à un pattern, servis sans le modèle")
+
+metrics.describe("prediction_cache_hits_total", "counter", "Prédictions servies par le cache")
+metrics.describe("prediction_cache_misses_total", "counter", "Prédictions calculées (absentes du cache)")
+metrics.describe("inference_rejected_total", "counter", "Requêtes refusées, pool d'inférence saturé")
+metrics.describe("conversations_total", "counter", "Échanges enregistrés depuis le démarrage")
+metrics.describe("model_info", "gauge", "Modèle en service (hash, moteur, format)")
+app.add_middleware(MetricsMiddleware, registry=metrics)
+
+def observe_stage(stage: str, seconds: float):
+    metrics.observe("stage_duration_seconds", seconds, stage=stage)
+
+# Mode hybride (/chat) : réponse des intentions au-dessus du seuil de confiance,
+# LLM local (CofiBotLlama) pour le reste, avec l'intention prédite en indice
+HYBRID_CONFIDENCE_THRESHOLD = float(os.getenv("COFIBOT_HYBRID_THRESHOLD", "0.45"))
+LLM_MODEL = os.getenv("COFIBOT_LLM_MODEL", "llama3.2:3b")
+HYBRID_ROUTES = ("exact", "intent", "llm", "fallback")
+llm = CofiBotLlama(LLM_MODEL)
+metrics.describe("chat_route_duration_seconds", "histogram",
+                 "Durée de /chat par route (exact, intent, llm, fallback)")
+
+def route_stats() -> Dict[str, Dict[str, Any]]:
+    """Nombre de réponses et latence moyenne de /chat par route"""
+    stats = {}
+    for route in HYBRID_ROUTES:
+        _, total, count = metrics.histogram("chat_route_duration_seconds", route=route).snapshot()
+        stats[route] = {
+            "count": count,
+            "avg_latency_ms": round(total / count * 1000, 2) if count else None
+        }
+    return stats
+
+def normalize_message(message: str) -> str:
+    """Minuscules et espaces compactés (sans effet sur la tokenisation TF-IDF)"""
+    return " ".join(message.lower().split())
+
+# Exécution de l'inférence hors de la boucle asyncio :
+# "thread" (défaut), "process" ou "inline" (dans la boucle, comme avant)
+INFERENCE_EXECUTOR = os.getenv("COFIBOT_INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("COFIBOT_INFERENCE_WORKERS", "4"))
+# Requêtes d'inférence admises en même temps (en cours + en attente) avant un 503
+INFERENCE_QUEUE_SIZE = int(os.getenv("COFIBOT_INFERENCE_QUEUE", "256"))
+
+class InferencePoolSaturated(Exception):
+    """File d'inférence pleine : la requête est refusée plutôt que mise en attente"""
+
+# Instantané propre à chaque processus du pool "process", et son scoring_key()
+_worker_runtime = None
+_worker_key = None
+
+def scoring_key(current):
+    """Ce qui décide des indices de classe et des confiances : modèle, moteur, index sémantique
+
+    Intentions et réponses n'en font pas partie : une modification admin
+    ne recrée pas les processus du pool d'inférence.
+    """
+    return (current.model_hash or id(current.model), current.artifact_path, current.scorer is not None,
+            current.semantic.path if current.semantic is not None else None)
+
+def _init_inference_worker(vectorizer, model, key, native_engine, artifact_path=None, semantic_path=None):
+    """Initialise un processus du pool avec sa propre copie du modèle
+
+    Avec un artefact, le processus mappe les mêmes fichiers que le parent :
+    les coefficients ne sont ni sérialisés ni dupliqués en mémoire. L'index
+    sémantique est relu depuis le disque, sans réencoder les patterns.
+    """
+    global _worker_runtime, _worker_key
+    if artifact_path is not None:
+        vectorizer, model, _ = load_artifact(artifact_path)
+    semantic = None
+    if semantic_path is not None:
+        semantic = SemanticMatcher.load(semantic_path, max_tokens=SEMANTIC_MAX_TOKENS,
+                                        k=SEMANTIC_K, budget_ms=SEMANTIC_BUDGET_MS)
+    _worker_runtime = build_runtime(vectorizer, model, [], 0, native_engine=native_engine,
+                                    semantic=semantic)
+    _worker_key = key
+
+def _classify_in_worker(key, texts):
+    """Classe dans un processus du pool : (indices, confiances, durées par étape)
+
+    None si son modèle n'est plus à jour.
+    """
+    if _worker_runtime is None or _worker_key != key:
+        return None
+    timings = {}
+    best, confidences = _worker_runtime.classify(texts, timings)
+    return best, confidences, timings
+
+class InferencePool:
+    """Pool d'inférence borné (threads ou processus) avec refus immédiat si saturé"""
+
+    def __init__(self, kind: str, workers: int, queue_size: int):
+        if kind not in ("thread", "process", "inline"):
+            raise ValueError(f"Exécuteur d'inférence inconnu : {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pending = 0
+        self.rejected = 0
+        self.executor = None
+        self.key = None  # scoring_key() du modèle chargé dans les processus
+
+    def refresh(self, current):
+        """Recrée les processus si le modèle a changé (mode "process" uniquement)"""
+        if self.kind != "process":
+            return
+        key = scoring_key(current)
+        if self.executor is not None and key == self.key:
+            return
+        old_executor = self.executor
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_inference_worker,
+            initargs=(
+                (None, None) if current.artifact_path else (current.vectorizer, current.model)
+            ) + (key, current.scorer is not None, current.artifact_path,
+                 current.semantic.path if current.semantic is not None else None)
+        )
+        self.key = key
+        if old_executor is not None:
+            old_executor.shutdown(wait=False)
+
+    async def classify(self, current, texts: List[str], timings: Optional[Dict[str, float]] = None):
+        """Classe des messages hors de la boucle asyncio, avec contrôle d'admission"""
+        if self.kind == "inline":
+            return current.classify(texts, timings)
+
+        # Pas de verrou nécessaire : le compteur n'est modifié que depuis la boucle
+        if self.pending >= self.queue_size:
+            self.rejected += 1
+            raise InferencePoolSaturated()
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            if self.kind == "thread":
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                       thread_name_prefix="cofibot-inference")
+                return await loop.run_in_executor(self.executor, current.classify, texts, timings)
+
+            result = None
+            key = scoring_key(current)
+            if self.key == key:
+                result = await loop.run_in_executor(self.executor, _classify_in_worker, key, texts)
+            if result is None:
+                # Modèle remplacé pendant la requête : on score localement
+                return current.classify(texts, timings)
+            best, confidences, worker_timings = result
+            if timings is not None:
+                timings.update(worker_timings)
+            return best, confidences
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self.pending,
+            "rejected": self.rejected
+        }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.executor = None
+        self.key = None
+
+inference_pool = InferencePool(INFERENCE_EXECUTOR, INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE)
+
+async def predict_cached(current, texts: List[str]):
+    """Prédit (indices, confiances) en ne scorant que les messages absents du cache"""
+    start = time.perf_counter()
+    results = [prediction_cache.get(current.version, text) for text in texts]
+    missing = [i for i, result in enumerate(results) if result is None]
+    observe_stage("cache", time.perf_counter() - start)
+
+    if missing:
+        timings = {}
+        class_indices, confidences = await inference_pool.classify(current, [texts[i] for i in missing], timings)
+        for stage, seconds in timings.items():
+            observe_stage(stage, seconds)
+        for i, class_index, confidence in zip(missing, class_indices, confidences):
+            results[i] = (int(class_index), float(confidence))
+            prediction_cache.put(current.version, texts[i], *results[i])
+
+    return results
+
+def build_semantic_matcher(intents, previous=None):
+    """Index d'embeddings des intentions ; None si désactivé ou indisponible"""
+    if INTENT_MATCHER != "semantic":
+        return None
+    try:
+        return SemanticMatcher.build(
+            intents, SEMANTIC_INDEX_DIR, SEMANTIC_MODEL_NAME, SEMANTIC_MAX_TOKENS,
+            previous=previous, k=SEMANTIC_K, budget_ms=SEMANTIC_BUDGET_MS
+        )
+    except Exception as e:
+        print(f"⚠️ Matcher sémantique indisponible, retour au TF-IDF : {e}")
+        return None
+
+# Publications concurrentes (boucle asyncio, réentraînement, index sémantique) sérialisées
+_publish_lock = threading.RLock()
+# Index sémantique reconstruit après une modification admin, hors de la boucle asyncio
+semantic_executor = None
+
+def publish_runtime(vectorizer, model, intents, model_hash=None, artifact_path=None, metrics=None,
+                    semantic=None, defer_semantic=False):
+    """Compile un nouvel instantané hors du chemin des requêtes puis le publie
+
+    Sans `semantic`, l'index sémantique est construit ici (relu du disque
+    si les patterns n'ont pas changé). Avec `defer_semantic`, l'instantané
+    garde l'index précédent et schedule_semantic_build() le remplace une
+    fois construit en arrière-plan.
+    """
+    global runtime
+    if semantic is None:
+        previous = runtime
+        previous_semantic = previous.semantic if previous is not None else None
+        # Construction (lente) hors du verrou : elle ne retient jamais une autre publication
+        semantic = previous_semantic if defer_semantic else build_semantic_matcher(intents, previous_semantic)
+    with _publish_lock:
+        new_runtime = build_runtime(
+            vectorizer, model, intents, next(_runtime_versions),
+            native_engine=(ENGINE == "native"),
+            model_hash=model_hash,
+            artifact_path=artifact_path,
+            metrics=metrics,
+            semantic=semantic
+        )
+        runtime = new_runtime  # Une seule affectation de référence
+        inference_pool.refresh(new_runtime)
+    if defer_semantic:
+        schedule_semantic_build()
+    return new_runtime
+
+def _rebuild_semantic_job():
+    current = runtime
+    if current is None:
+        return
+    matcher = build_semantic_matcher(current.intents, current.semantic)
+    with _publish_lock:
+        latest = runtime
+        # Intentions remplacées pendant la construction : le job suivant s'en charge
+        if matcher is None or latest.intents is not current.intents:
+            return
+        publish_runtime(latest.vectorizer, latest.model, latest.intents, latest.model_hash,
+                        latest.artifact_path, latest.metrics, semantic=matcher)
+
+def schedule_semantic_build():
+    """Reconstruit l'index sémantique des intentions publiées, dans un thread dédié"""
+    global semantic_executor
+    if INTENT_MATCHER != "semantic":
+        return None
+    if semantic_executor is None:
+        semantic_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cofibot-semantic")
+    return semantic_executor.submit(_rebuild_semantic_job)
+
+def shutdown_semantic_executor():
+    global semantic_executor
+    if semantic_executor is not None:
+        semantic_executor.shutdown(wait=True)
+        semantic_executor = None
+
+def export_artifact(vectorizer, model, metrics=None):
+    """Exporte le modèle en artefact mappé ; (model_hash, artifact_path) ou (None, None)"""
+    try:
+        save_artifact(vectorizer, model, MODEL_ARTIFACT_DIR, metrics=metrics)
+    except ValueError as e:
+        print(f"⚠️ Artefact non exporté, modèle servi depuis le pickle : {e}")
+        return None, None
+    _, _, manifest = load_artifact(MODEL_ARTIFACT_DIR)
+    return manifest["content_hash"], manifest["path"]
+
+def read_model():
+    """Lit le modèle sur disque : (vectorizer, model, model_hash, artifact_path, metrics)
+
+    None si aucun modèle n'est entraîné.
+    """
+    if MODEL_FORMAT == "artifact":
+        def artifact_is_stale():
+            if current_artifact(MODEL_ARTIFACT_DIR) is None:
+                return True
+            pointer = os.path.join(MODEL_ARTIFACT_DIR, "CURRENT")
+            return os.path.exists("nlp/model.pkl") and \
+                os.path.getmtime("nlp/model.pkl") > os.path.getmtime(pointer)
+
+        if artifact_is_stale() and os.path.exists("nlp/model.pkl"):
+            # Pickle plus récent que l'artefact (ou premier démarrage) : conversion
+            export_artifact(*joblib.load("nlp/model.pkl"), metrics=load_metrics())
+        if not artifact_is_stale():
+            vectorizer, model, manifest = load_artifact(MODEL_ARTIFACT_DIR)
+            return vectorizer, model, manifest["content_hash"], manifest["path"], manifest.get("metrics")
+
+    if os.path.exists("nlp/model.pkl"):
+        vectorizer, model = joblib.load("nlp/model.pkl")
+        return vectorizer, model, file_sha256("nlp/model.pkl"), None, load_metrics()
+    return None
 
 def load_model():
     """Charge le modèle NLP et les données d'intentions"""
-    global vectorizer, model, intents_data
-    
+    # Toute publication postérieure à cette lecture déclenchera un rechargement
+    model_watcher.prime()
     try:
         # Charger le modèle
-        if os.path.exists("nlp/model.pkl"):
-            vectorizer, model = joblib.load("nlp/model.pkl")
-            print("✅ Modèle NLP chargé")
-        else:
+        loaded = read_model()
+        if loaded is None:
             print("❌ Modèle non trouvé. Lance train_nlp.py d'abord !")
             return False
+        vectorizer, model, model_hash, artifact_path, metrics = loaded
+        print(f"✅ Modèle NLP chargé ({'artefact mappé' if artifact_path else 'pickle'}, {model_hash[:12]})")
         
         # Charger les intentions
-        with open("nlp/intents.json", "r", encoding="utf-8") as f:
-            intents_data = json.load(f)["intents"]
-            print("✅ Données d'intentions chargées")
+        if intent_store is not None:
+            intent_store.open()
+            intents = intent_store.load()
+        else:
+            with open("nlp/intents.json", "r", encoding="utf-8") as f:
+                intents = json.load(f)["intents"]
+        print("✅ Données d'intentions chargées")
         
+        publish_runtime(vectorizer, model, intents, model_hash, artifact_path, metrics)
         return True
     except Exception as e:
         print(f"❌ Erreur lors du chargement : {e}")
         return False
 
-def save_intents():
+def save_intents(intents):
     """Sauvegarde les intentions dans le fichier JSON"""
     try:
-        data = {"intents": intents_data}
-        with open("nlp/intents.json", "w", encoding="utf-8") as f:
+        data = {"intents": list(intents)}
+        # Remplacement atomique : les autres workers peuvent relire le fichier à tout moment
+        tmp_path = f"nlp/intents.json.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, "nlp/intents.json")
         return True
     except Exception as e:
         print(f"❌ Erreur sauvegarde : {e}")
         return False
 
-def retrain_model():
-    """Réentraîne le modèle avec les nouvelles données"""
-    try:
-        import subprocess
-        result = subprocess.run(["python", "nlp/train_nlp.py"], capture_output=True, text=True)
-        if result.returncode == 0:
-            # Recharger le modèle
-            load_model()
+# Diffusion des versions entre workers : chaque publication (modèle réentraîné ou
+# intentions modifiées) réécrit un petit fichier signal que les autres surveillent
+MODEL_SIGNAL_PATH = os.getenv("COFIBOT_MODEL_SIGNAL", "nlp/model.signal")
+MODEL_RELOAD_INTERVAL_S = float(os.getenv("COFIBOT_MODEL_RELOAD_S", "1.0"))
+
+class ModelVersionWatcher:
+    """Recharge le modèle et les intentions quand un autre worker en publie une version.
+
+    Le signal est un fichier JSON remplacé atomiquement (compteur de
+    génération + pid de l'émetteur) ; chaque worker le relit toutes les
+    `interval` secondes et le compare au dernier signal vu (génération,
+    pid), ce qu'aucune réécriture de même date ou de même taille ne
+    masque. Un worker converge donc au plus `interval` secondes (plus le
+    temps de chargement) après la publication.
+    """
+
+    def __init__(self, path: str, interval: float):
+        self.path = path
+        self.interval = interval
+        self.generation = 0
+        self.reloads = 0
+        self.last_reload_at = None
+        self._seen = (0, None)  # (génération, pid) du dernier signal chargé ou émis
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def prime(self):
+        """Mémorise le signal courant : ce qui est déjà sur disque est considéré comme chargé"""
+        with self._lock:
+            signal = self._read()
+            self._seen = (signal.get("generation", 0), signal.get("pid"))
+            self.generation = max(self.generation, self._seen[0])
+
+    def broadcast(self, reason: str, model_hash: Optional[str] = None):
+        """Annonce aux autres workers qu'une nouvelle version est sur disque"""
+        # Un signal pas encore vu serait écrasé par le nôtre : le charger d'abord
+        self.check()
+        with self._lock:
+            generation = max(self.generation, self._read().get("generation", 0)) + 1
+            signal = {
+                "generation": generation,
+                "reason": reason,
+                "model_hash": model_hash,
+                "pid": os.getpid(),
+                "published_at": datetime.now().isoformat()
+            }
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(signal, f)
+            os.replace(tmp_path, self.path)
+            self.generation = generation
+            self._seen = (generation, signal["pid"])
+
+    def check(self) -> bool:
+        """Recharge si le signal a changé depuis le dernier chargement ; True si rechargé"""
+        with self._lock:
+            signal = self._read()
+            seen = (signal.get("generation", 0), signal.get("pid"))
+            if not signal or seen == self._seen:
+                return False
+            self._seen = seen
+            self.generation = max(self.generation, seen[0])
+        print(f"🔄 Nouvelle version publiée par un autre worker ({signal.get('reason')}), rechargement")
+        if load_model():
+            self.reloads += 1
+            self.last_reload_at = datetime.now().isoformat()
             return True
         return False
+
+    def _loop(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"❌ Erreur rechargement du modèle : {e}")
+
+    def start(self):
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name="cofibot-model-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "generation": self.generation,
+            "reloads": self.reloads,
+            "last_reload_at": self.last_reload_at,
+            "interval_s": self.interval
+        }
+
+model_watcher = ModelVersionWatcher(MODEL_SIGNAL_PATH, MODEL_RELOAD_INTERVAL_S)
+
+# Mode d'entraînement : "full" (TF-IDF, tout le corpus), "search" (réglages choisis
+# par validation croisée sur tous les cœurs) ou "incremental" (delta seulement)
+TRAINING_MODE = os.getenv("COFIBOT_TRAINING_MODE", "full")
+incremental_trainer = IncrementalTrainer() if TRAINING_MODE == "incremental" else None
+
+# Réentraînements en arrière-plan : un seul à la fois, dans ce processus
+retrain_executor = None
+retrain_jobs = OrderedDict()
+RETRAIN_JOBS_KEPT = 50
+
+def _run_retrain_job(job, intents, full):
+    """Entraîne dans le thread dédié puis publie le nouveau modèle"""
+    def progress(stage, fraction, **metrics):
+        job["stage"] = stage
+        job["progress"] = fraction
+        job["metrics"].update(metrics)
+
+    job["status"] = "running"
+    job["started_at"] = datetime.now().isoformat()
+    try:
+        if intent_store is not None:
+            # Entraîner sur la base telle qu'exportée (écritures d'autres workers comprises) ;
+            # intents.json reste à jour pour un entraînement en ligne de commande
+            with open(intent_store.export_json(), "r", encoding="utf-8") as f:
+                intents = json.load(f)["intents"]
+        if incremental_trainer is not None:
+            vectorizer, model = incremental_trainer.train(intents=intents, progress=progress, full=full)
+        else:
+            vectorizer, model = train_nlp_model(intents=intents, progress=progress,
+                                                search=(TRAINING_MODE == "search"))
+        metrics = load_metrics()
+        model_hash, artifact_path = None, None
+        if MODEL_FORMAT == "artifact":
+            model_hash, artifact_path = export_artifact(vectorizer, model, metrics)
+            if artifact_path is not None:
+                # Servir les tableaux mappés plutôt que les objets en mémoire du thread
+                vectorizer, model, _ = load_artifact(artifact_path)
+        if model_hash is None:
+            model_hash = file_sha256("nlp/model.pkl")
+        job["model_hash"] = model_hash
+        current = runtime
+        if current is None:
+            # Premier modèle : relire le fichier et les intentions comme au démarrage
+            load_model()
+            published = runtime
+        else:
+            # Les intentions publiées entre-temps restent en vigueur ; leur propre job suivra
+            published = publish_runtime(vectorizer, model, current.intents, model_hash, artifact_path, metrics)
+        model_watcher.broadcast("model", model_hash)
+        job["model_version"] = published.version
+        retrain_scheduler.mark_trained(job["intents_generation"])
+        job["status"] = "succeeded"
+        job["stage"] = "publié"
+        job["progress"] = 1.0
     except Exception as e:
         print(f"❌ Erreur réentraînement : {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now().isoformat()
+
+def shutdown_retrain_executor():
+    """Laisse finir le réentraînement en cours (la publication reste cohérente)"""
+    global retrain_executor
+    if retrain_executor is not None:
+        retrain_executor.shutdown(wait=True)
+        retrain_executor = None
+
+def retrain_model(intents=None, full=False):
+    """Lance le réentraînement en arrière-plan et renvoie le job de suivi
+
+    En mode incrémental, `full=True` force un réajustement complet.
+    """
+    global retrain_executor
+    if intents is None:
+        intents = runtime.intents if runtime else None
+    
+    job = {
+        "id": uuid.uuid4().hex[:12],
+        "mode": "incremental" if incremental_trainer is not None and not full else (
+            "search" if TRAINING_MODE == "search" else "full"),
+        "status": "pending",
+        "stage": "en attente",
+        "progress": 0.0,
+        "created_at": datetime.now().isoformat(),
+        "started_at": None,
+        "finished_at": None,
+        "metrics": {},
+        "model_version": None,
+        "model_hash": None,
+        "intents_generation": retrain_scheduler.saved_generation,
+        "error": None
+    }
+    retrain_jobs[job["id"]] = job
+    while len(retrain_jobs) > RETRAIN_JOBS_KEPT:
+        retrain_jobs.popitem(last=False)
+    
+    if retrain_executor is None:
+        retrain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cofibot-retrain")
+    retrain_executor.submit(_run_retrain_job, job, [dict(intent) for intent in intents] if intents else None, full)
+    return job
+
+# Regroupement des réentraînements : une rafale de modifications admin ne
+# déclenche qu'un seul job, après un silence ou au plus tard après un délai max
+RETRAIN_QUIET_WINDOW_S = float(os.getenv("COFIBOT_RETRAIN_QUIET_S", "2.0"))
+RETRAIN_MAX_DELAY_S = float(os.getenv("COFIBOT_RETRAIN_MAX_DELAY_S", "30.0"))
+
+class RetrainScheduler:
+    """Planificateur de réentraînement avec anti-rebond.
+
+    Chaque modification sauvegardée incrémente `saved_generation` ; le job
+    lancé emporte la génération courante et, une fois publié, la reporte
+    dans `trained_generation`. Le modèle en service est en retard tant que
+    les deux diffèrent.
+    """
+
+    def __init__(self, quiet_window: float, max_delay: float):
+        self.quiet_window = quiet_window
+        self.max_delay = max_delay
+        self.saved_generation = 0
+        self.trained_generation = 0
+        self.first_dirty_at = None
+        self.last_edit_at = None
+        self.last_job_id = None
+        self.condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def _due_at(self):
+        return min(self.last_edit_at + self.quiet_window, self.first_dirty_at + self.max_delay)
+
+    def mark_dirty(self):
+        """Enregistre une modification sauvegardée et (re)planifie le réentraînement"""
+        with self.condition:
+            now = time.monotonic()
+            self.saved_generation += 1
+            self.last_edit_at = now
+            if self.first_dirty_at is None:
+                self.first_dirty_at = now
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._loop, name="cofibot-retrain-scheduler",
+                                                daemon=True)
+                self._thread.start()
+            self.condition.notify()
+
+    def mark_trained(self, generation: int):
+        with self.condition:
+            self.trained_generation = max(self.trained_generation, generation)
+
+    def cancel_pending(self):
+        """Oublie le réentraînement planifié (un job immédiat va le couvrir)"""
+        with self.condition:
+            self.first_dirty_at = None
+            self.last_edit_at = None
+
+    def _loop(self):
+        with self.condition:
+            while not self._stopping:
+                if self.first_dirty_at is None:
+                    self.condition.wait()
+                    continue
+                delay = self._due_at() - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                self.first_dirty_at = None
+                self.last_edit_at = None
+                self.last_job_id = retrain_model()["id"]
+
+    def stop(self):
+        with self.condition:
+            self._stopping = True
+            self.condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def status(self) -> Dict[str, Any]:
+        with self.condition:
+            due_in = None
+            if self.first_dirty_at is not None:
+                due_in = round(max(0.0, self._due_at() - time.monotonic()), 3)
+            return {
+                "model_behind_intents": self.trained_generation < self.saved_generation,
+                "retrain_pending": self.first_dirty_at is not None,
+                "retrain_due_in_s": due_in,
+                "saved_generation": self.saved_generation,
+                "trained_generation": self.trained_generation,
+                "last_job_id": self.last_job_id
+            }
+
+retrain_scheduler = RetrainScheduler(RETRAIN_QUIET_WINDOW_S, RETRAIN_MAX_DELAY_S)
+
+def commit_intents(intents, persist=None):
+    """Sauvegarde une nouvelle liste d'intentions et publie l'instantané associé
+
+    Avec la base d'intentions, seule la modification `persist(intent_store)`
+    est écrite (IntentExists / IntentNotFound remontent à l'appelant) ;
+    sinon tout intents.json est réécrit.
+    """
+    current = runtime
+    if intent_store is not None and persist is not None:
+        try:
+            persist(intent_store)
+            # Publier la base entière : les écritures d'un autre worker y figurent aussi
+            intents = intent_store.load()
+        except sqlite3.Error as e:
+            print(f"❌ Erreur sauvegarde : {e}")
+            return False
+    elif not save_intents(intents):
         return False
+    # Le modèle courant reste en service jusqu'au réentraînement planifié, l'index
+    # sémantique précédent jusqu'à sa reconstruction (encodage hors de la boucle asyncio)
+    publish_runtime(current.vectorizer, current.model, intents, current.model_hash, current.artifact_path,
+                    current.metrics, defer_semantic=True)
+    model_watcher.broadcast("intents", current.model_hash)
+    retrain_scheduler.mark_dirty()
+    return True
+
+def record_conversation(user_message: str, response: str, intent: str, confidence: float):
+    """Ajoute un échange à l'historique des conversations"""
+    conversation_log.append(user_message, response, intent, confidence)
+    if conversation_store is not None:
+        # Simple mise en file : l'écriture disque se fait par lots en arrière-plan
+        conversation_store.enqueue("chatbot", user_message, response, intent, confidence)
 
 # Routes existantes
 @app.get("/")
@@ -116,7 +978,10 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "chat": "/chatbot",
+            "batch": "/chatbot/batch",
+            "hybrid": "/chat",
             "health": "/health",
+            "metrics": "/metrics",
             "admin": "/admin"
         }
     }
@@ -124,66 +989,114 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Vérification de l'état de l'API"""
-    model_loaded = vectorizer is not None and model is not None
+    current = runtime
+    model_loaded = current is not None
     return {
         "status": "healthy" if model_loaded else "degraded",
         "model_loaded": model_loaded,
-        "intents_loaded": intents_data is not None,
-        "total_intents": len(intents_data) if intents_data else 0
+        "intents_loaded": model_loaded,
+        "total_intents": len(current.intents) if current else 0,
+        "model_version": current.version if current else None,
+        "engine": current.engine if current else None,
+        "model_format": ("artifact" if current.artifact_path else "pickle") if current else None,
+        "model_hash": current.model_hash if current else None,
+        "exact_patterns": len(current.exact_matches) if current else 0,
+        "semantic": current.semantic.stats() if current and current.semantic else None,
+        "worker_pid": os.getpid(),
+        "model_watcher": model_watcher.stats(),
+        "prediction_cache": prediction_cache.stats(),
+        "inference_pool": inference_pool.stats(),
+        "conversation_store": conversation_store.stats() if conversation_store else None
     }
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Métriques au format texte Prometheus"""
+    current = runtime
+    cache = prediction_cache.stats()
+    pool = inference_pool.stats()
+    gauges = [
+        ("model_loaded", 1 if current is not None else 0, {}),
+        ("model_version", current.version if current is not None else 0, {}),
+    ]
+    if current is not None:
+        gauges.append(("model_info", 1, {
+            "hash": (current.model_hash or "")[:12],
+            "engine": current.engine,
+            "format": "artifact" if current.artifact_path else "pickle"
+        }))
+    gauges += [
+        ("exact_patterns", len(current.exact_matches) if current is not None else 0, {}),
+        ("model_behind_intents", int(retrain_scheduler.status()["model_behind_intents"]), {}),
+        ("prediction_cache_hits_total", cache["hits"], {}),
+        ("prediction_cache_misses_total", cache["misses"], {}),
+        ("prediction_cache_size", cache["size"], {}),
+        ("prediction_cache_capacity", cache["capacity"], {}),
+        ("inference_pending", pool["pending"], {}),
+        ("inference_rejected_total", pool["rejected"], {}),
+        ("conversations_total", conversation_log.total, {}),
+    ]
+    return Response(metrics.render(gauges), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.post("/chatbot", response_model=ChatResponse)
 async def chatbot(query: Question):
     """Endpoint principal du chatbot"""
+    current = runtime
     
-    if not vectorizer or not model or not intents_data:
+    if current is None:
         raise HTTPException(
             status_code=503, 
             detail="Modèle non chargé. Contacte l'administrateur."
         )
     
-    user_input = query.message.strip().lower()
+    start = time.perf_counter()
+    user_input = normalize_message(query.message)
+    observe_stage("normalize", time.perf_counter() - start)
     
     if not user_input:
         raise HTTPException(status_code=400, detail="Message vide")
     
+    # Message identique à un pattern : réponse directe, ni vectoriseur ni modèle
+    start = time.perf_counter()
+    exact_tag = current.exact_match(user_input)
+    observe_stage("exact_match", time.perf_counter() - start)
+    if exact_tag is not None:
+        metrics.inc("exact_match_total")
+        response = random.choice(current.responses_by_tag[exact_tag])
+        start = time.perf_counter()
+        record_conversation(query.message, response, exact_tag, 1.0)
+        observe_stage("history", time.perf_counter() - start)
+        return ChatResponse(intent=exact_tag, response=response, confidence=1.0, exact_match=True)
+    
     try:
         # Prédiction
-        X_input = vectorizer.transform([user_input])
-        prediction = model.predict(X_input)[0]
-        confidence = max(model.predict_proba(X_input)[0])
+        class_index, confidence = (await predict_cached(current, [user_input]))[0]
         
-        # Trouver la réponse correspondante
-        for intent in intents_data:
-            if intent["tag"] == prediction:
-                response = random.choice(intent["responses"])
-                
-                # Sauvegarder dans l'historique
-                conversation_history.append({
-                    "id": len(conversation_history) + 1,
-                    "timestamp": datetime.now().isoformat(),
-                    "user_message": query.message,
-                    "bot_response": response,
-                    "intent": prediction,
-                    "confidence": round(confidence, 2)
-                })
-                
-                return ChatResponse(
-                    intent=prediction,
-                    response=response,
-                    confidence=round(confidence, 2)
-                )
+        # Trouver la réponse correspondante (index précalculé, O(1))
+        start = time.perf_counter()
+        responses = current.responses_for(class_index)
+        if responses:
+            prediction = current.tag_for(class_index)
+            response = random.choice(responses)
+            observe_stage("lookup", time.perf_counter() - start)
+            
+            # Sauvegarder dans l'historique
+            start = time.perf_counter()
+            record_conversation(query.message, response, prediction, round(confidence, 2))
+            observe_stage("history", time.perf_counter() - start)
+            
+            return ChatResponse(
+                intent=prediction,
+                response=response,
+                confidence=round(confidence, 2)
+            )
         
         # Intention non trouvée
-        response = "Je ne comprends pas ta demande 😕. Peux-tu reformuler ?"
-        conversation_history.append({
-            "id": len(conversation_history) + 1,
-            "timestamp": datetime.now().isoformat(),
-            "user_message": query.message,
-            "bot_response": response,
-            "intent": "unknown",
-            "confidence": 0.0
-        })
+        response = UNKNOWN_RESPONSE
+        observe_stage("lookup", time.perf_counter() - start)
+        start = time.perf_counter()
+        record_conversation(query.message, response, "unknown", 0.0)
+        observe_stage("history", time.perf_counter() - start)
         
         return ChatResponse(
             intent="unknown",
@@ -191,6 +1104,142 @@ async def chatbot(query: Question):
             confidence=0.0
         )
         
+    except InferencePoolSaturated:
+        raise HTTPException(status_code=503, detail="Serveur saturé, réessaie dans un instant")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur interne : {str(e)}")
+
+def intent_hint(tag: str, confidence: float, responses) -> Optional[str]:
+    """Indice transmis au LLM : intention prédite et une réponse de référence"""
+    if not responses:
+        return None
+    return f"Intention probable : {tag} (confiance {confidence:.0%}). Réponse de référence : {responses[0]}"
+
+@app.post("/chat", response_model=HybridChatResponse)
+async def hybrid_chat(query: Question):
+    """Mode hybride : intentions si le classifieur est sûr de lui, LLM local sinon"""
+    current = runtime
+    
+    if current is None:
+        raise HTTPException(
+            status_code=503, 
+            detail="Modèle non chargé. Contacte l'administrateur."
+        )
+    
+    request_start = time.perf_counter()
+    user_input = normalize_message(query.message)
+    if not user_input:
+        raise HTTPException(status_code=400, detail="Message vide")
+    
+    exact_tag = current.exact_match(user_input)
+    if exact_tag is not None:
+        tag, confidence, route = exact_tag, 1.0, "exact"
+        responses = current.responses_by_tag[exact_tag]
+    else:
+        try:
+            class_index, confidence = (await predict_cached(current, [user_input]))[0]
+        except InferencePoolSaturated:
+            raise HTTPException(status_code=503, detail="Serveur saturé, réessaie dans un instant")
+        responses = current.responses_for(class_index)
+        tag = current.tag_for(class_index) if responses else "unknown"
+        route = "intent" if responses and confidence >= HYBRID_CONFIDENCE_THRESHOLD else "llm"
+    
+    if route == "llm":
+        timings = {}
+        result = await llm.achat(query.message, timings, hint=intent_hint(tag, confidence, responses),
+                                 session_id=query.session_id)
+        for stage, seconds in timings.items():
+            observe_stage(f"llm_{stage}", seconds)
+        if result["success"]:
+            response = result["response"]
+        else:
+            # LLM indisponible : la réponse des intentions vaut mieux qu'une erreur
+            route = "fallback"
+            response = random.choice(responses) if responses else UNKNOWN_RESPONSE
+    else:
+        response = random.choice(responses)
+    
+    confidence = round(float(confidence), 2)
+    record_conversation(query.message, response, tag, confidence)
+    metrics.observe("chat_route_duration_seconds", time.perf_counter() - request_start, route=route)
+    
+    return HybridChatResponse(
+        intent=tag,
+        response=response,
+        confidence=confidence,
+        route=route,
+        exact_match=(route == "exact")
+    )
+
+@app.post("/chatbot/batch", response_model=BatchChatResponse)
+async def chatbot_batch(batch: BatchQuestion):
+    """Classe un lot de messages en une seule passe (passerelles, rejeux nocturnes)"""
+    current = runtime
+    
+    if current is None:
+        raise HTTPException(
+            status_code=503, 
+            detail="Modèle non chargé. Contacte l'administrateur."
+        )
+    
+    if not batch.messages:
+        raise HTTPException(status_code=400, detail="Lot vide")
+    
+    if len(batch.messages) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Lot trop volumineux ({len(batch.messages)} > {MAX_BATCH_SIZE})"
+        )
+    
+    start = time.perf_counter()
+    user_inputs = [normalize_message(message) for message in batch.messages]
+    observe_stage("normalize", time.perf_counter() - start)
+    empty = [i for i, user_input in enumerate(user_inputs) if not user_input]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"Messages vides aux positions : {empty}")
+    
+    start = time.perf_counter()
+    exact_tags = [current.exact_match(user_input) for user_input in user_inputs]
+    observe_stage("exact_match", time.perf_counter() - start)
+    to_classify = [i for i, tag in enumerate(exact_tags) if tag is None]
+    if len(to_classify) < len(user_inputs):
+        metrics.inc("exact_match_total", len(user_inputs) - len(to_classify))
+    
+    try:
+        # Une seule transformation creuse et un seul predict_proba pour les messages hors cache
+        predictions = dict(zip(
+            to_classify,
+            await predict_cached(current, [user_inputs[i] for i in to_classify]) if to_classify else []
+        ))
+        
+        results = []
+        for i, message in enumerate(batch.messages):
+            if exact_tags[i] is not None:
+                response = random.choice(current.responses_by_tag[exact_tags[i]])
+                record_conversation(message, response, exact_tags[i], 1.0)
+                results.append(ChatResponse(intent=exact_tags[i], response=response, confidence=1.0,
+                                            exact_match=True))
+                continue
+            
+            class_index, confidence = predictions[i]
+            responses = current.responses_for(class_index)
+            
+            if responses:
+                intent_tag = current.tag_for(class_index)
+                response = random.choice(responses)
+                confidence = round(float(confidence), 2)
+            else:
+                intent_tag = "unknown"
+                response = UNKNOWN_RESPONSE
+                confidence = 0.0
+            
+            record_conversation(message, response, intent_tag, confidence)
+            results.append(ChatResponse(intent=intent_tag, response=response, confidence=confidence))
+        
+        return BatchChatResponse(results=results)
+        
+    except InferencePoolSaturated:
+        raise HTTPException(status_code=503, detail="Serveur saturé, réessaie dans un instant")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur interne : {str(e)}")
 
@@ -198,43 +1247,48 @@ async def chatbot(query: Question):
 @app.get("/admin/stats")
 async def get_admin_stats():
     """Statistiques pour l'interface admin"""
-    if not intents_data:
+    current = runtime
+    if current is None:
         raise HTTPException(status_code=503, detail="Données non chargées")
     
-    total_patterns = sum(len(intent["patterns"]) for intent in intents_data)
-    total_responses = sum(len(intent["responses"]) for intent in intents_data)
-    
-    # Statistiques des conversations
-    intent_usage = {}
-    for conv in conversation_history:
-        intent = conv["intent"]
-        intent_usage[intent] = intent_usage.get(intent, 0) + 1
+    # Statistiques des conversations (compteurs tenus à l'insertion)
+    conversation_stats = conversation_log.stats()
+    metrics = dict(current.metrics) if current.metrics else {}
     
     return {
-        "total_intents": len(intents_data),
-        "total_patterns": total_patterns,
-        "total_responses": total_responses,
-        "total_conversations": len(conversation_history),
-        "intent_usage": intent_usage,
-        "model_accuracy": "75%" if model else "N/A"
+        "total_intents": len(current.intents),
+        "total_patterns": current.total_patterns,
+        "total_responses": current.total_responses,
+        **conversation_stats,
+        "model_behind_intents": retrain_scheduler.status()["model_behind_intents"],
+        # Mesures du dernier entraînement (nlp/model.metrics.json)
+        "model_accuracy": f"{metrics['accuracy']:.0%}" if metrics.get("accuracy") is not None else "N/A",
+        "model_metrics": metrics or None,
+        # Mode hybride : part des réponses payées en calcul LLM
+        "hybrid_threshold": HYBRID_CONFIDENCE_THRESHOLD,
+        "hybrid_routes": route_stats(),
+        # Réponses du LLM resservies par le cache (questions d'ouverture répétées)
+        "llm_cache": llm.cache.stats() if llm.cache is not None else None
     }
 
 @app.get("/admin/intents")
 async def get_intents():
     """Récupérer toutes les intentions"""
-    if not intents_data:
+    current = runtime
+    if current is None:
         raise HTTPException(status_code=503, detail="Données non chargées")
     
-    return {"intents": intents_data}
+    return {"intents": current.intents}
 
 @app.post("/admin/intents")
 async def create_intent(intent: Intent):
     """Créer une nouvelle intention"""
-    if not intents_data:
+    current = runtime
+    if current is None:
         raise HTTPException(status_code=503, detail="Données non chargées")
     
     # Vérifier si l'intention existe déjà
-    for existing_intent in intents_data:
+    for existing_intent in current.intents:
         if existing_intent["tag"] == intent.tag:
             raise HTTPException(status_code=400, detail="Cette intention existe déjà")
     
@@ -245,39 +1299,47 @@ async def create_intent(intent: Intent):
         "responses": intent.responses
     }
     
-    intents_data.append(new_intent)
+    # Copie sur écriture : l'instantané en service n'est jamais modifié
+    new_intents = list(current.intents) + [new_intent]
     
     # Sauvegarder
-    if save_intents():
-        # Réentraîner le modèle
-        if retrain_model():
-            return {"message": "Intention créée et modèle réentraîné avec succès"}
-        else:
-            return {"message": "Intention créée, mais erreur lors du réentraînement"}
+    try:
+        saved = commit_intents(new_intents, lambda store: store.add(new_intent))
+    except IntentExists:
+        # Créée entre-temps par une autre requête (ou un autre worker)
+        raise HTTPException(status_code=400, detail="Cette intention existe déjà")
+    if saved:
+        # Réentraînement regroupé avec les autres modifications récentes
+        return {"message": "Intention créée, réentraînement planifié", "retrain": retrain_scheduler.status()}
     else:
         raise HTTPException(status_code=500, detail="Erreur lors de la sauvegarde")
 
 @app.put("/admin/intents/{intent_tag}")
 async def update_intent(intent_tag: str, intent: IntentUpdate):
     """Modifier une intention existante"""
-    if not intents_data:
+    current = runtime
+    if current is None:
         raise HTTPException(status_code=503, detail="Données non chargées")
     
     # Trouver l'intention à modifier
-    for i, existing_intent in enumerate(intents_data):
+    for i, existing_intent in enumerate(current.intents):
         if existing_intent["tag"] == intent_tag:
-            intents_data[i] = {
+            new_intents = list(current.intents)
+            new_intents[i] = {
                 "tag": intent.tag,
                 "patterns": intent.patterns,
                 "responses": intent.responses
             }
             
             # Sauvegarder
-            if save_intents():
-                if retrain_model():
-                    return {"message": "Intention modifiée et modèle réentraîné avec succès"}
-                else:
-                    return {"message": "Intention modifiée, mais erreur lors du réentraînement"}
+            try:
+                saved = commit_intents(new_intents, lambda store: store.update(intent_tag, new_intents[i]))
+            except IntentExists:
+                raise HTTPException(status_code=400, detail="Cette intention existe déjà")
+            except IntentNotFound:
+                raise HTTPException(status_code=404, detail="Intention non trouvée")
+            if saved:
+                return {"message": "Intention modifiée, réentraînement planifié", "retrain": retrain_scheduler.status()}
             else:
                 raise HTTPException(status_code=500, detail="Erreur lors de la sauvegarde")
     
@@ -286,38 +1348,141 @@ async def update_intent(intent_tag: str, intent: IntentUpdate):
 @app.delete("/admin/intents/{intent_tag}")
 async def delete_intent(intent_tag: str):
     """Supprimer une intention"""
-    if not intents_data:
+    current = runtime
+    if current is None:
         raise HTTPException(status_code=503, detail="Données non chargées")
     
     # Trouver et supprimer l'intention
-    for i, intent in enumerate(intents_data):
+    for i, intent in enumerate(current.intents):
         if intent["tag"] == intent_tag:
-            del intents_data[i]
+            new_intents = list(current.intents)
+            del new_intents[i]
             
             # Sauvegarder
-            if save_intents():
-                if retrain_model():
-                    return {"message": "Intention supprimée et modèle réentraîné avec succès"}
-                else:
-                    return {"message": "Intention supprimée, mais erreur lors du réentraînement"}
+            try:
+                saved = commit_intents(new_intents, lambda store: store.delete(intent_tag))
+            except IntentNotFound:
+                raise HTTPException(status_code=404, detail="Intention non trouvée")
+            if saved:
+                return {"message": "Intention supprimée, réentraînement planifié", "retrain": retrain_scheduler.status()}
             else:
                 raise HTTPException(status_code=500, detail="Erreur lors de la sauvegarde")
     
     raise HTTPException(status_code=404, detail="Intention non trouvée")
 
+def parse_period_bound(name: str, value: Optional[str]) -> Optional[str]:
+    """Borne de période ISO 8601 ramenée au format des horodatages du journal (heure locale)"""
+    if value is None:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} : date ISO 8601 invalide")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment.isoformat()
+
 @app.get("/admin/conversations")
-async def get_conversations():
-    """Récupérer l'historique des conversations"""
-    return {"conversations": conversation_history[-50:]}  # 50 dernières conversations
+async def get_conversations(start: Optional[str] = None, end: Optional[str] = None,
+                            limit: int = 50, before_id: Optional[int] = None):
+    """Récupérer l'historique des conversations (paginé, filtrable par période ISO)"""
+    limit = max(1, min(limit, 500))
+    # Comparées comme chaînes en base : une date mal formée filtrerait n'importe quoi
+    start = parse_period_bound("start", start)
+    end = parse_period_bound("end", end)
+    
+    if conversation_store is None:
+        return {"conversations": conversation_log.recent(limit)}  # Dernières conversations en mémoire
+    
+    page = conversation_store.query(source="chatbot", start=start, end=end,
+                                    limit=limit, before_id=before_id)
+    return {
+        "conversations": page[::-1],  # Ordre chronologique, comme avant
+        "next_before_id": page[-1]["id"] if len(page) == limit else None
+    }
 
-@app.post("/admin/retrain")
+@app.post("/admin/retrain", status_code=202)
 async def retrain_model_endpoint():
-    """Réentraîner le modèle manuellement"""
-    if retrain_model():
-        return {"message": "Modèle réentraîné avec succès"}
-    else:
-        raise HTTPException(status_code=500, detail="Erreur lors du réentraînement")
+    """Réentraîner le modèle manuellement (en arrière-plan)"""
+    retrain_scheduler.cancel_pending()
+    job = retrain_model(full=True)
+    return {"message": "Réentraînement lancé", "job_id": job["id"]}
 
-if __name__ == "__main__":
+@app.get("/admin/retrain")
+async def get_retrain_status():
+    """Le modèle en service est-il à jour des intentions sauvegardées ?"""
+    return {
+        **retrain_scheduler.status(),
+        "jobs": [{**job, "metrics": dict(job["metrics"])} for job in list(retrain_jobs.values())[-10:]]
+    }
+
+@app.get("/admin/retrain/{job_id}")
+async def get_retrain_job(job_id: str):
+    """Avancement et métriques d'un réentraînement"""
+    job = retrain_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job de réentraînement inconnu")
+    # Copie : le thread d'entraînement peut encore modifier le job
+    return {**job, "metrics": dict(job["metrics"])}
+
+# Service multi-workers : COFIBOT_WORKERS processus partagent le même socket
+SERVER_HOST = os.getenv("COFIBOT_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("COFIBOT_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("COFIBOT_WORKERS", "1"))
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT, workers: int = SERVER_WORKERS):
+    """Précharge le modèle puis forke `workers` processus uvicorn sur un socket partagé
+
+    Les pages du modèle chargé avant le fork sont partagées en copie sur
+    écriture ; ensuite chaque worker suit les publications des autres via
+    model_watcher.
+    """
+    import signal
+    import socket
     import uvicorn
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
+    global preloaded
+
+    if not hasattr(os, "fork"):
+        # Windows : pas de fork, uvicorn relance des processus qui chargent chacun le modèle
+        uvicorn.run("main:app", host=host, port=port, workers=workers)
+        return
+
+    preloaded = load_model()
+    # Les processus d'inférence éventuels seront recréés dans chaque worker
+    inference_pool.shutdown()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    print(f"🚀 CofiBot sur http://{host}:{port} avec {workers} workers")
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+            server.run(sockets=[sock])
+            os._exit(0)
+        children.append(pid)
+
+    def stop_workers(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    for child in children:
+        os.waitpid(child, 0)
+    sock.close()
+
+if __name__ == "__main__":
+    if SERVER_WORKERS > 1:
+        serve()
+    else:
+        import uvicorn
+        uvicorn.run("main:app", host=SERVER_HOST, port=SERVER_PORT, reload=True)
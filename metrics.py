@@ -0,0 +1,164 @@
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Bornes des histogrammes de latence (secondes), de 10 µs à 10 s
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Histogram:
+    """Histogramme à seaux fixes : une recherche dichotomique et trois additions par mesure"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Dernier seau : +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+class MetricsRegistry:
+    """Compteurs et histogrammes étiquetés, rendus au format texte Prometheus.
+
+    Volontairement minimal (pas de dépendance à prometheus_client) : les
+    mesures se font avec time.perf_counter() et coûtent quelques
+    centaines de nanosecondes.
+    """
+
+    def __init__(self, prefix: str = "cofibot"):
+        self.prefix = prefix
+        self._descriptions: Dict[str, Tuple[str, str]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: Optional[Tuple[float, ...]] = None):
+        """Type et aide d'une série ; `buckets` remplace LATENCY_BUCKETS pour un histogramme"""
+        self._descriptions[name] = (kind, help_text)
+        if buckets is not None:
+            self._buckets[name] = tuple(buckets)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        key = _labels(labels)
+        series = self._histograms.get(name)
+        if series is None or key not in series:
+            with self._lock:
+                series = self._histograms.setdefault(name, {})
+                series.setdefault(key, Histogram(self._buckets.get(name, LATENCY_BUCKETS)))
+        return self._histograms[name][key]
+
+    def observe(self, name: str, value: float, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    def _header(self, lines: List[str], name: str, default_kind: str):
+        kind, help_text = self._descriptions.get(name, (default_kind, ""))
+        full_name = f"{self.prefix}_{name}"
+        if help_text:
+            lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+
+    def render(self, gauges: Iterable[Tuple[str, float, Dict[str, str]]] = ()) -> str:
+        """Texte d'exposition Prometheus ; `gauges` = (nom, valeur, étiquettes) lus au scrape"""
+        lines: List[str] = []
+
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: dict(series) for name, series in self._histograms.items()}
+
+        for name, series in sorted(counters.items()):
+            self._header(lines, name, "counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{self.prefix}_{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name, series in sorted(histograms.items()):
+            self._header(lines, name, "histogram")
+            for labels, histogram in sorted(series.items()):
+                counts, total, count = histogram.snapshot()
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = ("le", _format_value(bound) if bound != float("inf") else "+Inf")
+                    lines.append(f"{self.prefix}_{name}_bucket{_format_labels(labels, le)} {cumulative}")
+                lines.append(f"{self.prefix}_{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{self.prefix}_{name}_count{_format_labels(labels)} {count}")
+
+        seen = set()
+        for name, value, labels in gauges:
+            if name not in seen:
+                self._header(lines, name, "gauge")
+                seen.add(name)
+            lines.append(f"{self.prefix}_{name}{_format_labels(_labels(labels))} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+class MetricsMiddleware:
+    """Middleware ASGI : nombre et durée des requêtes HTTP par route et code de statut"""
+
+    def __init__(self, app, registry: MetricsRegistry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Nom de la fonction de route (renseigné par le routeur) : cardinalité bornée
+            handler = getattr(scope.get("endpoint"), "__name__", "other")
+            self.registry.inc("http_requests_total", handler=handler, method=scope["method"], status=status)
+            self.registry.observe("http_request_duration_seconds", time.perf_counter() - start,
+                                  handler=handler)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
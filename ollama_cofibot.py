@@ -1,12 +1,17 @@
-import requests
 import json
 from datetime import datetime
 
-class OllamaCofiBot:
-    def __init__(self, model="mistral:7b"):
+from ollama_connection import OllamaConnection
+
+class OllamaCofiBot(OllamaConnection):
+    def __init__(self, model="mistral:7b", store=None, **connection_options):
         self.model = model
         self.base_url = "http://localhost:11434"
         self.conversation_history = []
+        # Journal durable optionnel (conversation_store.ConversationStore)
+        self.store = store
+        # Session persistante et disponibilité en cache (ollama_connection)
+        self._init_connection(**connection_options)
         
         # Prompt système pour CofiBot
         self.system_prompt = """Tu es CofiBot, l'assistant intelligent de Coficab, une entreprise française spécialisée dans la fabrication de câbles automobiles.
@@ -20,23 +25,12 @@ Tes caractéristiques:
 Si tu ne connais pas une information spécifique à Coficab, dis-le clairement et propose d'autres solutions."""
     
     def is_ollama_running(self):
-        """Vérifie si Ollama est en marche"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags")
-            return response.status_code == 200
-        except:
-            return False
+        """Vérifie si Ollama est en marche (état en cache)"""
+        return self.backend_status()[0]
     
     def list_models(self):
         """Liste les modèles disponibles"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags")
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                return [model["name"] for model in models]
-            return []
-        except:
-            return []
+        return self.backend_status()[1]
     
     def chat(self, user_message):
         """Discute avec l'utilisateur"""
@@ -57,7 +51,7 @@ Si tu ne connais pas une information spécifique à Coficab, dis-le clairement e
         full_prompt += f"Utilisateur: {user_message}\nCofiBot:"
         
         try:
-            response = requests.post(f"{self.base_url}/api/generate", json={
+            response = self.session.post(f"{self.base_url}/api/generate", json={
                 "model": self.model,
                 "prompt": full_prompt,
                 "stream": False,
@@ -72,11 +66,7 @@ Si tu ne connais pas une information spécifique à Coficab, dis-le clairement e
                 bot_response = response.json()["response"].strip()
                 
                 # Sauvegarder dans l'historique
-                self.conversation_history.append({
-                    "timestamp": datetime.now().isoformat(),
-                    "user": user_message,
-                    "bot": bot_response
-                })
+                self._record_exchange(user_message, bot_response)
                 
                 return {
                     "response": bot_response,
@@ -84,17 +74,30 @@ Si tu ne connais pas une information spécifique à Coficab, dis-le clairement e
                     "timestamp": datetime.now().isoformat()
                 }
             else:
+                self.mark_down(f"Erreur HTTP: {response.status_code}")
                 return {
                     "error": f"Erreur HTTP: {response.status_code}",
                     "response": None
                 }
                 
         except Exception as e:
+            self.mark_down(f"Erreur: {str(e)}")
             return {
                 "error": f"Erreur: {str(e)}",
                 "response": None
             }
     
+    def _record_exchange(self, user_message, bot_response):
+        """Ajoute un échange à l'historique (et au journal durable s'il existe)"""
+        timestamp = datetime.now().isoformat()
+        self.conversation_history.append({
+            "timestamp": timestamp,
+            "user": user_message,
+            "bot": bot_response
+        })
+        if self.store is not None:
+            self.store.enqueue("ollama", user_message, bot_response, timestamp=timestamp, model=self.model)
+    
     def chat_stream(self, user_message):
         """Chat avec streaming"""
         if not self.is_ollama_running():
@@ -104,11 +107,15 @@ Si tu ne connais pas une information spécifique à Coficab, dis-le clairement e
         full_prompt = f"{self.system_prompt}\n\nUtilisateur: {user_message}\nCofiBot:"
         
         try:
-            response = requests.post(f"{self.base_url}/api/generate", json={
+            response = self.session.post(f"{self.base_url}/api/generate", json={
                 "model": self.model,
                 "prompt": full_prompt,
                 "stream": True
             }, stream=True)
+            if response.status_code != 200:
+                self.mark_down(f"Erreur HTTP: {response.status_code}")
+                print(f"❌ Erreur HTTP: {response.status_code}")
+                return
             
             print("🤖 CofiBot: ", end="", flush=True)
             full_response = ""
@@ -125,13 +132,10 @@ Si tu ne connais pas une information spécifique à Coficab, dis-le clairement e
                         break
             
             # Sauvegarder dans l'historique
-            self.conversation_history.append({
-                "timestamp": datetime.now().isoformat(),
-                "user": user_message,
-                "bot": full_response
-            })
+            self._record_exchange(user_message, full_response)
             
         except Exception as e:
+            self.mark_down(f"Erreur: {str(e)}")
             print(f"❌ Erreur: {e}")
 
 # Interface de test
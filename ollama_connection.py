@@ -0,0 +1,181 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# État d'Ollama gardé en cache au plus ce nombre de secondes
+OLLAMA_STATUS_TTL_S = float(os.getenv("COFIBOT_OLLAMA_STATUS_TTL_S", "10"))
+# Intervalle de la sonde en arrière-plan (0 pour la désactiver)
+OLLAMA_PROBE_INTERVAL_S = float(os.getenv("COFIBOT_OLLAMA_PROBE_S", "5"))
+OLLAMA_PROBE_TIMEOUT_S = float(os.getenv("COFIBOT_OLLAMA_PROBE_TIMEOUT_S", "2"))
+# Connexions keep-alive gardées ouvertes vers Ollama
+OLLAMA_POOL_SIZE = int(os.getenv("COFIBOT_OLLAMA_POOL_SIZE", "8"))
+# Générations asynchrones en vol en même temps : à aligner sur OLLAMA_NUM_PARALLEL
+OLLAMA_PARALLEL = int(os.getenv("COFIBOT_OLLAMA_PARALLEL", "4"))
+
+class OllamaError(Exception):
+    """Génération refusée ou interrompue par Ollama"""
+
+class OllamaConnection:
+    """Session HTTP persistante vers Ollama et disponibilité mise en cache.
+
+    Mixin de CofiBotLlama et OllamaCofiBot (qui définissent base_url). Les
+    connexions TCP sont réutilisées d'un appel à l'autre. L'état (serveur
+    joignable, modèles installés) est rafraîchi par une sonde en
+    arrière-plan et relu en cache tant qu'il a moins de `status_ttl`
+    secondes ; un échec de génération le passe aussitôt hors service,
+    jusqu'à la prochaine sonde réussie.
+
+    Le chemin asyncio (aprobe, generation_slot) passe par un
+    httpx.AsyncClient partagé ; un sémaphore limite les générations en vol
+    à `parallel`, les suivantes attendent leur tour sans bloquer la boucle.
+    """
+
+    def _init_connection(self, status_ttl: float = OLLAMA_STATUS_TTL_S,
+                         probe_interval: float = OLLAMA_PROBE_INTERVAL_S,
+                         parallel: int = OLLAMA_PARALLEL):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.status_ttl = status_ttl
+        self.probe_interval = probe_interval
+        # (joignable, modèles, erreur, instant de la mesure) : remplacé d'un bloc
+        self._status = None
+        self._probe_lock = threading.Lock()
+        self._probe_stop = threading.Event()
+        self._probe_thread = None
+        self.parallel = parallel
+        self.in_flight = 0
+        self.waiting = 0
+        # Client et sémaphore asyncio, liés à la boucle qui les a créés
+        self._async_client = None
+        self._async_slots = None
+        self._async_loop = None
+        self._async_probe = None
+
+    @staticmethod
+    def _tags_status(response) -> Tuple[bool, List[str], Optional[str]]:
+        # Réponse requests ou httpx
+        if response.status_code != 200:
+            return False, [], "Ollama n'est pas accessible"
+        return True, [m["name"] for m in response.json().get("models", [])], None
+
+    def probe(self) -> Tuple[bool, List[str], Optional[str]]:
+        """Interroge /api/tags et met l'état en cache"""
+        try:
+            status = self._tags_status(
+                self.session.get(f"{self.base_url}/api/tags", timeout=OLLAMA_PROBE_TIMEOUT_S)
+            )
+        except Exception as e:
+            status = (False, [], f"Erreur: {str(e)}")
+        self._status = status + (time.monotonic(),)
+        return status
+
+    def _async_http(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.parallel + 2,
+                                    max_keepalive_connections=self.parallel + 2),
+                # Pas de limite sur la génération elle-même, seulement sur la connexion
+                timeout=httpx.Timeout(None, connect=OLLAMA_PROBE_TIMEOUT_S)
+            )
+            self._async_slots = asyncio.Semaphore(self.parallel)
+            self._async_loop = loop
+        return self._async_client, self._async_slots
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Client httpx partagé de la boucle courante"""
+        return self._async_http()[0]
+
+    async def aprobe(self) -> Tuple[bool, List[str], Optional[str]]:
+        """probe() sans bloquer la boucle asyncio"""
+        try:
+            status = self._tags_status(
+                await self.async_client.get(f"{self.base_url}/api/tags", timeout=OLLAMA_PROBE_TIMEOUT_S)
+            )
+        except Exception as e:
+            status = (False, [], f"Erreur: {str(e)}")
+        self._status = status + (time.monotonic(),)
+        return status
+
+    def backend_status(self) -> Tuple[bool, List[str], Optional[str]]:
+        """(joignable, modèles installés, erreur) depuis le cache, sondé s'il est périmé"""
+        self.start_probe()
+        status = self._status
+        if status is None or time.monotonic() - status[3] > self.status_ttl:
+            return self.probe()
+        return status[:3]
+
+    async def abackend_status(self) -> Tuple[bool, List[str], Optional[str]]:
+        """backend_status() sans bloquer la boucle asyncio"""
+        self.start_probe()
+        status = self._status
+        if status is None or time.monotonic() - status[3] > self.status_ttl:
+            # Un seul sondage pour toutes les requêtes arrivées avec un état périmé
+            probe = self._async_probe
+            if probe is None or probe.done() or probe.get_loop() is not asyncio.get_running_loop():
+                probe = self._async_probe = asyncio.ensure_future(self.aprobe())
+            return await probe
+        return status[:3]
+
+    @asynccontextmanager
+    async def generation_slot(self):
+        """Réserve l'un des `parallel` emplacements de génération (attente asynchrone)"""
+        _, slots = self._async_http()
+        self.waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            slots.release()
+
+    def generation_stats(self) -> Dict[str, Any]:
+        return {"parallel": self.parallel, "in_flight": self.in_flight, "waiting": self.waiting}
+
+    def mark_down(self, error: str):
+        """Génération en échec : hors service jusqu'à la prochaine sonde réussie"""
+        self._status = (False, [], error, time.monotonic())
+
+    def _probe_loop(self):
+        while not self._probe_stop.wait(self.probe_interval):
+            self.probe()
+
+    def start_probe(self):
+        """Démarre la sonde en arrière-plan (une seule fois)"""
+        if self._probe_thread is not None or self.probe_interval <= 0:
+            return
+        with self._probe_lock:
+            if self._probe_thread is None:
+                self._probe_stop.clear()
+                self._probe_thread = threading.Thread(target=self._probe_loop, name="ollama-probe", daemon=True)
+                self._probe_thread.start()
+
+    def close(self):
+        """Arrête la sonde et ferme les connexions"""
+        with self._probe_lock:
+            thread, self._probe_thread = self._probe_thread, None
+        if thread is not None:
+            self._probe_stop.set()
+            thread.join(timeout=OLLAMA_PROBE_TIMEOUT_S + 1)
+        self.session.close()
+
+    async def aclose(self):
+        """close() plus fermeture du client asynchrone de la boucle courante"""
+        if self._async_client is not None and self._async_loop is asyncio.get_running_loop():
+            await self._async_client.aclose()
+        self._async_client = self._async_slots = self._async_loop = self._async_probe = None
+        self.close()
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Sequence
+
+# Sessions gardées au plus (les moins récemment utilisées sont évincées)
+MAX_SESSIONS = int(os.getenv("COFIBOT_MAX_SESSIONS", "1000"))
+# Session oubliée après ce délai d'inactivité (s)
+SESSION_TTL_S = float(os.getenv("COFIBOT_SESSION_TTL_S", "1800"))
+# Échanges gardés par session (ceux qui entrent dans le prompt)
+SESSION_TURNS = int(os.getenv("COFIBOT_SESSION_TURNS", "3"))
+# Plafond global de texte en mémoire, toutes sessions confondues (octets UTF-8)
+SESSION_MEMORY_BYTES = int(os.getenv("COFIBOT_SESSION_MEMORY_BYTES", str(8 * 1024 * 1024)))
+
+def _exchange_size(exchange: Dict[str, str]) -> int:
+    return len(exchange["user"].encode("utf-8")) + len(exchange["bot"].encode("utf-8"))
+
+class Session:
+    __slots__ = ("exchanges", "context", "last_used", "size")
+
+    def __init__(self, turns: int):
+        self.exchanges = deque(maxlen=turns)
+        self.context = None  # Tokens du contexte Ollama (array("l")), mode "context"
+        self.last_used = time.monotonic()
+        self.size = 0
+
+class SessionMemory:
+    """Historique de conversation par session, borné en nombre, en âge et en taille.
+
+    Chaque session ne garde que ses `turns` derniers échanges. Les sessions
+    sont rangées de la moins à la plus récemment utilisée : au-delà de
+    `max_sessions` ou de `max_bytes` (texte et contexte Ollama), les plus
+    anciennes sont évincées ; une session inactive depuis `ttl` secondes
+    est oubliée.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl: float = SESSION_TTL_S,
+                 turns: int = SESSION_TURNS, max_bytes: int = SESSION_MEMORY_BYTES):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.turns = turns
+        self.max_bytes = max_bytes
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.bytes = 0
+        self.total_exchanges = 0
+        self.last_timestamp = None
+        self.evicted = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, session_id: str) -> Session:
+        session = self.sessions.pop(session_id)
+        self.bytes -= session.size
+        return session
+
+    def _expire(self, now: float):
+        # Les sessions expirées sont en tête (ordre d'utilisation)
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if now - session.last_used <= self.ttl:
+                break
+            self._drop(session_id)
+            self.expired += 1
+
+    def recent(self, session_id: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        """Derniers échanges de la session (copie), du plus ancien au plus récent"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            session = self.sessions.get(session_id)
+            if session is None:
+                return []
+            session.last_used = now
+            self.sessions.move_to_end(session_id)
+            exchanges = list(session.exchanges)
+        return exchanges[-limit:] if limit else exchanges
+
+    def _touch(self, session_id: str, now: float) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session(self.turns)
+        session.last_used = now
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def _enforce_caps(self):
+        # Toujours garder la session courante, même si elle dépasse à elle seule le plafond
+        while len(self.sessions) > 1 and (
+                len(self.sessions) > self.max_sessions or self.bytes > self.max_bytes):
+            self._drop(next(iter(self.sessions)))
+            self.evicted += 1
+
+    def append(self, session_id: str, exchange: Dict[str, str]):
+        """Ajoute un échange ({"timestamp", "user", "bot"}) puis applique les plafonds"""
+        size = _exchange_size(exchange)
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            session = self._touch(session_id, now)
+            if len(session.exchanges) == session.exchanges.maxlen:
+                oldest = _exchange_size(session.exchanges[0])
+                session.size -= oldest
+                self.bytes -= oldest
+            session.exchanges.append(exchange)
+            session.size += size
+            self.bytes += size
+            self.total_exchanges += 1
+            self.last_timestamp = exchange.get("timestamp")
+            self._enforce_caps()
+
+    def context(self, session_id: str) -> Optional[List[int]]:
+        """Contexte Ollama de la session (tokens déjà traités), None s'il n'y en a pas"""
+        with self._lock:
+            self._expire(time.monotonic())
+            session = self.sessions.get(session_id)
+            if session is None or session.context is None:
+                return None
+            return session.context.tolist()
+
+    def set_context(self, session_id: str, tokens: Optional[Sequence[int]]):
+        """Remplace le contexte Ollama de la session (None pour l'oublier)"""
+        context = array("l", tokens) if tokens else None
+        with self._lock:
+            session = self._touch(session_id, time.monotonic())
+            old_size = len(session.context) * session.context.itemsize if session.context is not None else 0
+            new_size = len(context) * context.itemsize if context is not None else 0
+            session.context = context
+            session.size += new_size - old_size
+            self.bytes += new_size - old_size
+            self._enforce_caps()
+
+    def clear(self, session_id: Optional[str] = None):
+        """Oublie une session, ou toutes si `session_id` est None"""
+        with self._lock:
+            if session_id is None:
+                self.sessions.clear()
+                self.bytes = 0
+            elif session_id in self.sessions:
+                self._drop(session_id)
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self.sessions),
+                "max_sessions": self.max_sessions,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl,
+                "turns_per_session": self.turns,
+                "evicted": self.evicted,
+                "expired": self.expired
+            }
@@ -0,0 +1,648 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import main
+
+def wait_for_job(client, job_id, timeout=30.0):
+    """Attend la fin d'un réentraînement lancé en arrière-plan"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/admin/retrain/{job_id}").json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} non terminé")
+
+def wait_until_trained(client, timeout=30.0):
+    """Attend que le modèle en service rattrape les intentions sauvegardées"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get("/admin/retrain").json()
+        if not status["model_behind_intents"] and not status["retrain_pending"]:
+            return status
+        time.sleep(0.05)
+    raise AssertionError("Modèle toujours en retard sur les intentions")
+
+def test_chatbot_simple(client):
+    """Le endpoint principal renvoie une intention connue"""
+    response = client.post("/chatbot", json={"message": "Bonjour"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["intent"] == "salutation"
+    assert 0.0 < data["confidence"] <= 1.0
+
+def test_chatbot_batch_ordre_et_coherence(client):
+    """Le lot renvoie les mêmes intentions que /chatbot, dans l'ordre d'entrée"""
+    messages = ["Bonjour", "merci beaucoup", "je veux poser des congés", "norme ISO"]
+    response = client.post("/chatbot/batch", json={"messages": messages})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == len(messages)
+
+    for message, result in zip(messages, results):
+        single = client.post("/chatbot", json={"message": message}).json()
+        assert result["intent"] == single["intent"]
+        assert result["confidence"] == single["confidence"]
+
+    assert len(main.conversation_log) == 2 * len(messages)
+
+def test_chatbot_batch_erreurs(client):
+    """Lots vides ou contenant des messages vides refusés"""
+    assert client.post("/chatbot/batch", json={"messages": []}).status_code == 400
+    response = client.post("/chatbot/batch", json={"messages": ["bonjour", "  "]})
+    assert response.status_code == 400
+    assert "[1]" in response.json()["detail"]
+
+def test_admin_intents_copie_sur_ecriture(client):
+    """Une modification publie un nouvel instantané sans toucher l'ancien"""
+    before = main.runtime
+    response = client.post("/admin/intents", json={
+        "tag": "cantine",
+        "patterns": ["menu de la cantine", "on mange quoi à midi", "horaires du restaurant"],
+        "responses": ["Le menu est affiché à l'entrée du restaurant."]
+    })
+    assert response.status_code == 200
+
+    after = main.runtime
+    assert after is not before
+    assert after.version > before.version
+    assert "cantine" not in before.responses_by_tag
+    assert after.responses_by_tag["cantine"] == ("Le menu est affiché à l'entrée du restaurant.",)
+    assert after.classes == tuple(str(tag) for tag in after.model.classes_)
+
+    assert main.intent_store.get("cantine")["patterns"][0] == "menu de la cantine"
+    assert client.post("/admin/intents", json={
+        "tag": "cantine", "patterns": ["x"], "responses": ["y"]}).status_code == 400
+
+    assert response.json()["retrain"]["model_behind_intents"]
+    status = wait_until_trained(client)
+    assert wait_for_job(client, status["last_job_id"])["status"] == "succeeded"
+    assert "cantine" in main.runtime.classes
+
+    assert client.delete("/admin/intents/cantine").status_code == 200
+    assert "cantine" not in main.runtime.responses_by_tag
+    assert "cantine" not in [intent["tag"] for intent in main.intent_store.load()]
+
+def test_admin_intents_ecritures_externes(client):
+    """Une intention écrite par un autre processus est servie et entraînée à l'édition suivante"""
+    from intent_store import IntentStore
+
+    IntentStore(main.intent_store.path).add({
+        "tag": "parking",
+        "patterns": ["où me garer", "places de parking", "stationnement visiteurs"],
+        "responses": ["Le parking visiteurs est devant l'accueil."]
+    })
+    response = client.post("/admin/intents", json={
+        "tag": "navette",
+        "patterns": ["horaires de la navette", "bus du personnel", "transport vers l'usine"],
+        "responses": ["La navette part de la gare à 7h."]
+    })
+    assert response.status_code == 200
+    assert {"parking", "navette"} <= set(main.runtime.responses_by_tag)
+
+    status = wait_until_trained(client)
+    assert wait_for_job(client, status["last_job_id"])["status"] == "succeeded"
+    assert {"parking", "navette"} <= set(main.runtime.classes)
+
+def test_index_semantique_reconstruit_en_arriere_plan(client, monkeypatch):
+    """Une modification admin garde l'index sémantique précédent et l'encode hors de la boucle asyncio"""
+    import threading
+
+    release = threading.Event()
+
+    class Matcher:
+        def __init__(self, intents):
+            self.pattern_tags = tuple(intent["tag"] for intent in intents for _ in intent["patterns"])
+
+        def within_budget(self):
+            return False
+
+        def stats(self):
+            return {"patterns": len(self.pattern_tags)}
+
+    def slow_build(intents, previous=None):
+        release.wait(5)  # Encodage simulé
+        return Matcher(intents)
+
+    monkeypatch.setattr(main, "INTENT_MATCHER", "semantic")
+    monkeypatch.setattr(main, "build_semantic_matcher", slow_build)
+    before = main.runtime
+
+    start = time.perf_counter()
+    response = client.post("/admin/intents", json={
+        "tag": "navette", "patterns": ["horaires de la navette"], "responses": ["Départ à 7 h 30."]})
+    assert response.status_code == 200
+    assert time.perf_counter() - start < 2
+    assert main.runtime.semantic is before.semantic
+    assert client.get("/health").status_code == 200
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while main.runtime.semantic is before.semantic and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert "navette" in main.runtime.semantic.pattern_tags
+    assert "navette" in main.runtime.classes
+
+def test_base_intentions_concurrente(workspace):
+    """Ajouts concurrents sans perte, erreurs explicites, export JSON et réimport"""
+    import json
+    import threading
+    from intent_store import IntentExists, IntentNotFound, IntentStore
+
+    store = IntentStore("data/intents.db")
+    store.open()
+    initial = store.load()
+    with open("nlp/intents.json", "r", encoding="utf-8") as f:
+        assert initial == json.load(f)["intents"]
+
+    def add(i):
+        IntentStore("data/intents.db").add(
+            {"tag": f"concurrent_{i}", "patterns": [f"question {i}"], "responses": [f"réponse {i}"]})
+
+    threads = [threading.Thread(target=add, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tags = [intent["tag"] for intent in store.load()]
+    assert len(tags) == len(initial) + 8
+    assert {f"concurrent_{i}" for i in range(8)} <= set(tags)
+
+    with pytest.raises(IntentExists):
+        store.add({"tag": "concurrent_0", "patterns": [], "responses": []})
+    with pytest.raises(IntentExists):
+        store.update("concurrent_1", {"tag": "concurrent_2", "patterns": [], "responses": []})
+    with pytest.raises(IntentNotFound):
+        store.delete("inconnue")
+
+    store.update("concurrent_1", {"tag": "concurrent_1", "patterns": ["a", "b"], "responses": ["c"]})
+    assert store.get("concurrent_1") == {"tag": "concurrent_1", "patterns": ["a", "b"], "responses": ["c"]}
+    store.delete("concurrent_0")
+
+    # Export pour train_nlp.py, puis une édition manuelle du JSON est réimportée
+    store.export_json()
+    with open("nlp/intents.json", "r", encoding="utf-8") as f:
+        exported = json.load(f)["intents"]
+    assert exported == store.load()
+    store.open()
+    assert store.load() == exported
+
+    with open("nlp/intents.json", "w", encoding="utf-8") as f:
+        json.dump({"intents": initial}, f)
+    store.open()
+    assert store.load() == initial
+
+def test_runtime_moteur_natif(client):
+    """Le moteur natif donne les mêmes réponses que scikit-learn via l'API"""
+    from nlp.runtime import build_runtime
+
+    current = main.runtime
+    native = build_runtime(current.vectorizer, current.model, list(current.intents),
+                           current.version, native_engine=True)
+    assert native.engine == "native"
+    for message in ["bonjour", "je veux des congés", "merci"]:
+        expected = current.classify([message])
+        got = native.classify([message])
+        assert int(got[0][0]) == int(expected[0][0])
+        assert float(got[1][0]) == pytest.approx(float(expected[1][0]))
+
+def test_modele_artefact_mappe(workspace, monkeypatch):
+    """En format artefact, le pickle est converti au démarrage et /health expose son hash"""
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(main, "MODEL_FORMAT", "artifact")
+    monkeypatch.setattr(main, "conversation_store", None)
+    with TestClient(main.app) as client:
+        health = client.get("/health").json()
+        assert health["model_format"] == "artifact"
+        assert health["model_hash"] == main.runtime.model_hash
+        assert main.runtime.artifact_path.startswith(main.MODEL_ARTIFACT_DIR)
+
+        response = client.post("/chatbot", json={"message": "bonjour"})
+        assert response.status_code == 200
+
+    # Redémarrage : l'artefact existant est repris tel quel
+    with TestClient(main.app) as client:
+        assert client.get("/health").json()["model_hash"] == health["model_hash"]
+
+def test_metriques_prometheus(client):
+    """/metrics expose les histogrammes par étape, les requêtes et l'état du modèle"""
+    import re
+
+    def sample(text, name, **labels):
+        label_text = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+        pattern = "^" + re.escape(f"cofibot_{name}" + (f"{{{label_text}}}" if labels else "")) + r" (\S+)"
+        match = re.search(pattern, text, re.MULTILINE)
+        return float(match.group(1)) if match else 0.0
+
+    # Le registre est global au processus : on compare avant / après
+    before = client.get("/metrics").text
+    client.post("/chatbot", json={"message": "une question encore jamais posée"})
+    client.post("/chatbot", json={"message": "une question encore jamais posée"})
+    client.post("/chatbot", json={"message": "   "})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+
+    def delta(name, **labels):
+        return sample(text, name, **labels) - sample(before, name, **labels)
+
+    assert delta("http_requests_total", handler="chatbot", method="POST", status="200") == 2
+    assert delta("http_requests_total", handler="chatbot", method="POST", status="400") == 1
+    assert delta("stage_duration_seconds_count", stage="normalize") == 3
+    for stage in ("cache", "lookup", "history"):
+        assert delta("stage_duration_seconds_count", stage=stage) == 2
+    # Le message répété vient du cache : une seule inférence
+    assert delta("stage_duration_seconds_count", stage="predict_proba") == 1
+    normalize_count = int(sample(text, "stage_duration_seconds_count", stage="normalize"))
+    assert f'cofibot_stage_duration_seconds_bucket{{stage="normalize",le="+Inf"}} {normalize_count}' in text
+    assert sample(text, "model_version") == main.runtime.version
+    assert delta("prediction_cache_hits_total") == 1
+
+def test_metriques_api_llama(workspace, monkeypatch):
+    """L'API LLM expose aussi /metrics, y compris quand Ollama est injoignable"""
+    from fastapi.testclient import TestClient
+    import api_with_llama
+    from generation_cache import GenerationCache
+
+    monkeypatch.setattr(api_with_llama, "conversation_store", None)
+    monkeypatch.setattr(api_with_llama.cofibot, "base_url", "http://127.0.0.1:9")
+    monkeypatch.setattr(api_with_llama.cofibot, "_status", None)
+    monkeypatch.setattr(api_with_llama.cofibot, "cache", GenerationCache())
+    series = [
+        'cofibot_chat_total{outcome="error"}',
+        'cofibot_stage_duration_seconds_count{stage="availability"}',
+        'cofibot_http_requests_total{handler="chat_endpoint",method="POST",status="503"}',
+    ]
+
+    def values(text):
+        lines = dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+        return [float(lines.get(name, 0)) for name in series]
+
+    # Registre global au processus : on compare avant / après
+    with TestClient(api_with_llama.app) as client:
+        before = values(client.get("/metrics").text)
+        assert client.post("/chat", json={"message": "Bonjour"}).status_code == 503
+        after = values(client.get("/metrics").text)
+    assert [a - b for a, b in zip(after, before)] == [1, 1, 1]
+
+def test_cache_predictions_versionne(client):
+    """Les questions répétées sont servies par le cache, invalidé au rechargement"""
+    main.prediction_cache.entries.clear()
+    main.prediction_cache.hits = main.prediction_cache.misses = 0
+
+    # Message hors patterns : "Bonjour" seul serait servi par la correspondance exacte
+    first = client.post("/chatbot", json={"message": "Bonjour tout le monde ici"}).json()
+    second = client.post("/chatbot", json={"message": "  BONJOUR tout le   monde ICI "}).json()
+    assert first["intent"] == second["intent"]
+    assert first["confidence"] == second["confidence"]
+
+    stats = client.get("/health").json()["prediction_cache"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+    assert main.load_model()
+    client.post("/chatbot", json={"message": "bonjour tout le monde ici"})
+    stats = client.get("/health").json()["prediction_cache"]
+    assert stats["misses"] == 2
+    assert stats["version"] == main.runtime.version
+
+def test_correspondance_exacte(client):
+    """Un message identique à un pattern est servi sans le modèle, avec une confiance de 1"""
+    main.prediction_cache.entries.clear()
+    main.prediction_cache.misses = 0
+    intent = main.runtime.intents[0]
+
+    data = client.post("/chatbot", json={"message": f"  {intent['patterns'][0].upper()} !?"}).json()
+    assert data["intent"] == intent["tag"]
+    assert data["confidence"] == 1.0
+    assert data["exact_match"] is True
+    assert data["response"] in intent["responses"]
+    assert main.prediction_cache.stats()["misses"] == 0
+
+    # Une intention ajoutée par l'admin répond immédiatement, avant le réentraînement
+    new_intent = {"tag": "parking", "patterns": ["Où puis-je me garer ?"], "responses": ["Parking niveau -2."]}
+    assert client.post("/admin/intents", json=new_intent).status_code == 200
+    data = client.post("/chatbot", json={"message": "où puis je me garer"}).json()
+    assert (data["intent"], data["exact_match"]) == ("parking", True)
+
+    batch = client.post("/chatbot/batch", json={"messages": ["où puis-je me garer", "une question jamais vue"]}).json()
+    assert [result["exact_match"] for result in batch["results"]] == [True, False]
+    assert batch["results"][0]["intent"] == "parking"
+
+    assert client.delete("/admin/intents/parking").status_code == 200
+    data = client.post("/chatbot", json={"message": "où puis je me garer"}).json()
+    assert data["exact_match"] is False
+
+def test_chat_hybride(client, monkeypatch):
+    """/chat répond depuis les intentions au-dessus du seuil, via le LLM en dessous"""
+    calls = []
+
+    async def fake_llm_chat(user_message, timings=None, hint=None, session_id=None):
+        calls.append((user_message, hint, session_id))
+        timings["generation"] = 0.01
+        return {"success": True, "response": "Réponse du LLM", "model": "test",
+                "timestamp": datetime.now().isoformat()}
+
+    monkeypatch.setattr(main.llm, "achat", fake_llm_chat)
+    before = main.route_stats()
+
+    data = client.post("/chat", json={"message": main.runtime.intents[0]["patterns"][0]}).json()
+    assert (data["route"], data["confidence"], data["exact_match"]) == ("exact", 1.0, True)
+
+    monkeypatch.setattr(main, "HYBRID_CONFIDENCE_THRESHOLD", 0.0)
+    data = client.post("/chat", json={"message": "je voudrais poser des congés"}).json()
+    assert data["route"] == "intent"
+    assert data["response"] in main.runtime.responses_by_tag[data["intent"]]
+
+    monkeypatch.setattr(main, "HYBRID_CONFIDENCE_THRESHOLD", 1.0)
+    data = client.post("/chat", json={"message": "je voudrais poser des congés"}).json()
+    assert (data["route"], data["response"]) == ("llm", "Réponse du LLM")
+    assert len(calls) == 1
+    assert f"Intention probable : {data['intent']}" in calls[0][1]
+    # Sans identifiant, pas de session créée côté LLM
+    assert calls[0][2] is None
+    client.post("/chat", json={"message": "je voudrais poser des congés", "session_id": "alice"})
+    assert calls[1][2] == "alice"
+
+    # LLM en panne : on retombe sur la réponse de l'intention
+    async def failing_llm_chat(*args, **kwargs):
+        return {"success": False, "error": "hors ligne"}
+
+    monkeypatch.setattr(main.llm, "achat", failing_llm_chat)
+    data = client.post("/chat", json={"message": "je voudrais poser des congés"}).json()
+    assert data["route"] == "fallback"
+    assert data["response"] in main.runtime.responses_by_tag[data["intent"]]
+
+    routes = client.get("/admin/stats").json()["hybrid_routes"]
+    for route, count in (("exact", 1), ("intent", 1), ("llm", 2), ("fallback", 1)):
+        assert routes[route]["count"] == before[route]["count"] + count
+        assert routes[route]["avg_latency_ms"] is not None
+
+def test_pool_inference_sature(client, monkeypatch):
+    """Une file d'inférence pleine renvoie 503 au lieu d'attendre"""
+    monkeypatch.setattr(main, "inference_pool", main.InferencePool("thread", 1, 0))
+    main.prediction_cache.entries.clear()
+    response = client.post("/chatbot", json={"message": "question jamais posée"})
+    assert response.status_code == 503
+    assert main.inference_pool.stats()["rejected"] == 1
+
+def test_pool_processus_garde_ses_workers(client, monkeypatch):
+    """Mode "process" : une modification d'intentions garde les processus, un nouveau modèle les recrée"""
+    pool = main.InferencePool("process", 1, 8)
+    monkeypatch.setattr(main, "inference_pool", pool)
+    pool.refresh(main.runtime)
+    executor = pool.executor
+
+    assert client.post("/admin/intents", json={
+        "tag": "vestiaire", "patterns": ["où sont les casiers", "vestiaires du personnel"],
+        "responses": ["Au rez-de-chaussée."]
+    }).status_code == 200
+    assert pool.executor is executor
+    # Le processus sert toujours le nouvel instantané (mêmes modèle et indices de classe)
+    result = executor.submit(main._classify_in_worker, main.scoring_key(main.runtime), ["bonjour"]).result()
+    assert result is not None
+
+    status = wait_until_trained(client)
+    assert wait_for_job(client, status["last_job_id"])["status"] == "succeeded"
+    assert pool.executor is not executor
+    pool.shutdown()
+
+def test_journal_conversations_borne(client, monkeypatch):
+    """Le tampon garde les N derniers échanges, les compteurs restent globaux"""
+    monkeypatch.setattr(main, "conversation_log", main.ConversationLog(3))
+    monkeypatch.setattr(main, "conversation_store", None)
+    for message in ["bonjour", "merci", "bonjour", "merci", "bonjour"]:
+        assert client.post("/chatbot", json={"message": message}).status_code == 200
+
+    conversations = client.get("/admin/conversations").json()["conversations"]
+    assert [conv["id"] for conv in conversations] == [3, 4, 5]
+    assert [conv["user_message"] for conv in conversations] == ["bonjour", "merci", "bonjour"]
+
+    stats = client.get("/admin/stats").json()
+    assert stats["total_conversations"] == 5
+    assert stats["intent_usage"]["salutation"] == 3
+    assert sum(stats["hourly_usage"]) == 5
+    assert stats["total_patterns"] == sum(len(i["patterns"]) for i in main.runtime.intents)
+
+def test_journal_durable_pagine(client):
+    """Les échanges sont écrits sur disque et relus par pages"""
+    messages = ["bonjour", "merci", "congés", "norme iso", "salut"]
+    for message in messages:
+        client.post("/chatbot", json={"message": message})
+    main.conversation_store.flush()
+
+    first = client.get("/admin/conversations", params={"limit": 3}).json()
+    assert [conv["user_message"] for conv in first["conversations"]] == messages[2:]
+    second = client.get("/admin/conversations",
+                        params={"limit": 3, "before_id": first["next_before_id"]}).json()
+    assert [conv["user_message"] for conv in second["conversations"]] == messages[:2]
+    assert second["next_before_id"] is None
+
+    future = client.get("/admin/conversations", params={"start": "2999-01-01"}).json()
+    assert future["conversations"] == []
+    # Date (sans heure) et fuseau explicite ramenés au format du journal
+    today = client.get("/admin/conversations", params={"start": datetime.now().date().isoformat(),
+                                                        "end": "2999-01-01T00:00:00+00:00"}).json()
+    assert len(today["conversations"]) == len(messages)
+    assert client.get("/admin/conversations", params={"start": "hier"}).status_code == 400
+    assert client.get("/admin/conversations", params={"end": "2024-13-01"}).status_code == 400
+
+def test_journal_durable_survit_au_redemarrage(workspace):
+    """Un nouveau store relit ce qu'un précédent a écrit (source LLM comprise)"""
+    from conversation_store import ConversationStore
+
+    store = ConversationStore("data/conversations.db", flush_interval=0.05)
+    store.enqueue("llama", "Bonjour", "Bonjour, je suis CofiBot.", model="llama3.2:3b")
+    store.close()
+
+    reopened = ConversationStore("data/conversations.db")
+    rows = reopened.query(source="llama")
+    assert len(rows) == 1
+    assert rows[0]["bot_response"] == "Bonjour, je suis CofiBot."
+    assert rows[0]["model"] == "llama3.2:3b"
+
+def test_journal_durable_deborde_sur_disque(workspace):
+    """File pleine : les échanges passent par le fichier de débordement, aucun n'est perdu"""
+    import os
+    import sqlite3
+    from conversation_store import ConversationStore
+
+    store = ConversationStore("data/conversations.db", flush_interval=0.05, queue_size=1)
+    store.start()
+    # Base verrouillée par un autre écrivain : le thread d'écriture reste bloqué sur son lot
+    blocker = sqlite3.connect("data/conversations.db", isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    for i in range(20):
+        store.enqueue("chatbot", f"question {i}", f"réponse {i}")
+    assert store.spilled >= 18 and store.dropped == 0
+    blocker.execute("COMMIT")
+    blocker.close()
+
+    store.flush()
+    messages = {row["user_message"] for row in store.query(limit=100)}
+    assert messages == {f"question {i}" for i in range(20)}
+    assert not os.path.exists(store.spill_path)
+
+    # Débordement impossible : seulement alors l'échange est compté comme perdu
+    store.spill_path = str(workspace / "absent" / "conversations.db.spill")
+    blocker = sqlite3.connect("data/conversations.db", isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    for i in range(3):
+        store.enqueue("chatbot", "perdu", "perdu")
+    assert store.dropped >= 1
+    blocker.execute("COMMIT")
+    blocker.close()
+    store.close()
+
+def test_reentrainement_en_arriere_plan(client):
+    """/admin/retrain rend la main tout de suite et publie un nouveau modèle"""
+    before = main.runtime
+    response = client.post("/admin/retrain")
+    assert response.status_code == 202
+
+    job = wait_for_job(client, response.json()["job_id"])
+    assert job["status"] == "succeeded"
+    assert job["progress"] == 1.0
+    assert job["metrics"]["n_intents"] == len(before.classes)
+    if main.incremental_trainer is None:
+        assert 0.0 <= job["metrics"]["accuracy"] <= 1.0
+    assert main.runtime.version == job["model_version"] > before.version
+    assert main.runtime.model is not before.model
+
+    # /admin/stats expose les métriques mesurées, plus une valeur figée
+    stats = client.get("/admin/stats").json()
+    assert stats["model_metrics"]["train_time_s"] == job["metrics"]["train_time_s"]
+    assert stats["model_metrics"]["inference_us_per_message"] > 0
+    if main.incremental_trainer is None:
+        assert stats["model_accuracy"] == f"{job['metrics']['accuracy']:.0%}"
+
+    assert client.get("/admin/retrain/inconnu").status_code == 404
+
+def test_reentrainement_regroupe(client, monkeypatch):
+    """Une rafale de modifications ne déclenche qu'un seul réentraînement"""
+    monkeypatch.setattr(main.retrain_scheduler, "quiet_window", 0.3)
+    jobs_before = len(main.retrain_jobs)
+
+    for i in range(5):
+        tag = f"rafale_{i % 2}"
+        intent = {
+            "tag": tag,
+            "patterns": [f"question rafale {tag}", f"demande rafale {tag}", f"rafale {tag} version {i}"],
+            "responses": [f"Réponse {i}"]
+        }
+        if i < 2:
+            response = client.post("/admin/intents", json=intent)
+        else:
+            response = client.put(f"/admin/intents/{tag}", json=intent)
+        assert response.status_code == 200
+    assert client.get("/admin/retrain").json()["model_behind_intents"]
+
+    wait_until_trained(client)
+    assert len(main.retrain_jobs) == jobs_before + 1
+    assert {"rafale_0", "rafale_1"} <= set(main.runtime.classes)
+
+def test_signal_modele_par_generation(workspace, monkeypatch):
+    """Le signal est comparé par (génération, pid) ; broadcast recharge un signal pas encore vu"""
+    import json
+
+    reloads = []
+    monkeypatch.setattr(main, "load_model", lambda: reloads.append(1) or True)
+    first = main.ModelVersionWatcher("data/model_signal.json", 0)
+    second = main.ModelVersionWatcher("data/model_signal.json", 0)
+    second.prime()
+
+    first.broadcast("intents")
+    assert not first.check()
+    assert second.check() and len(reloads) == 1
+    assert not second.check()
+
+    # Réécriture de même génération (et de même taille) par un autre processus
+    with open("data/model_signal.json", "r", encoding="utf-8") as f:
+        signal = json.load(f)
+    signal["pid"] = signal["pid"] + 1
+    with open("data/model_signal.json", "w", encoding="utf-8") as f:
+        json.dump(signal, f)
+    assert second.check() and len(reloads) == 2
+
+    # first n'a pas vu ce signal : il recharge avant de publier le sien
+    first.broadcast("model")
+    assert len(reloads) == 3
+    assert first.generation == 2
+    assert second.check() and second.generation == 2
+
+def test_workers_convergent(workspace):
+    """Des workers forkés convergent vers les intentions et le modèle publiés par l'un d'eux"""
+    import os
+    import socket
+    import subprocess
+    import sys
+    import requests
+
+    if not hasattr(os, "fork"):
+        pytest.skip("Service multi-workers par fork indisponible")
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    env = {
+        **os.environ,
+        "COFIBOT_WORKERS": "3",
+        "COFIBOT_PORT": str(port),
+        "COFIBOT_MODEL_RELOAD_S": "0.2",
+        "COFIBOT_RETRAIN_QUIET_S": "0.1",
+        "COFIBOT_CONVERSATION_DB": ""
+    }
+    server = subprocess.Popen([sys.executable, main.__file__], cwd=workspace, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+
+    def sample_workers(requests_count=60):
+        """Dernier état vu pour chaque worker (une connexion par requête)"""
+        states = {}
+        for _ in range(requests_count):
+            health = requests.get(f"{base_url}/health", headers={"Connection": "close"}, timeout=5).json()
+            states[health["worker_pid"]] = (health["total_intents"], health["model_hash"])
+        return states
+
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(f"{base_url}/health", timeout=1)
+                break
+            except requests.ConnectionError:
+                assert time.monotonic() < deadline, "Serveur multi-workers non démarré"
+                time.sleep(0.1)
+
+        initial = sample_workers()
+        assert len(initial) >= 2
+        assert len(set(initial.values())) == 1
+        (total_intents, model_hash), = set(initial.values())
+
+        response = requests.post(f"{base_url}/admin/intents", json={
+            "tag": "multi_workers",
+            "patterns": ["question multi workers", "demande multi workers",
+                         "aide multi workers", "info multi workers"],
+            "responses": ["Réponse multi workers"]
+        }, timeout=5)
+        assert response.status_code == 200
+
+        # Intentions puis modèle réentraîné visibles dans tous les workers
+        deadline = time.monotonic() + 30
+        while True:
+            states = sample_workers()
+            if len(states) >= 2 and all(
+                    total == total_intents + 1 and current_hash != model_hash
+                    for total, current_hash in states.values()):
+                break
+            assert time.monotonic() < deadline, f"Workers non convergents : {states}"
+            time.sleep(0.2)
+        assert len(set(states.values())) == 1
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
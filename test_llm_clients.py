@@ -0,0 +1,339 @@
+import time
+
+from cofibot_llama import CofiBotLlama
+from generation_cache import GenerationCache
+from ollama_cofibot import OllamaCofiBot
+from session_memory import SessionMemory
+
+def make_bot(cls, server, **options):
+    bot = cls(**{"probe_interval": 0, "status_ttl": 60, **options})
+    bot.base_url = server.url
+    return bot
+
+def test_disponibilite_en_cache_et_connexion_reutilisee(ollama_server):
+    """Un seul /api/tags pour plusieurs messages, une seule connexion TCP"""
+    bot = make_bot(CofiBotLlama, ollama_server)
+    for _ in range(3):
+        result = bot.chat("Bonjour")
+        assert result["success"], result
+        assert result["response"] == ollama_server.reply
+    bot.close()
+
+    assert ollama_server.count("GET", "/api/tags") == 1
+    assert ollama_server.count("POST", "/api/generate") == 3
+    assert len({port for _, _, port in ollama_server.requests}) == 1
+
+def test_echec_generation_marque_hors_service(ollama_server):
+    """Une génération en échec coupe le backend jusqu'à la prochaine sonde"""
+    bot = make_bot(CofiBotLlama, ollama_server)
+    ollama_server.generate_status = 500
+    assert not bot.chat("Bonjour")["success"]
+
+    # Hors service : plus d'appel à Ollama tant que l'état n'est pas rafraîchi
+    result = bot.chat("Bonjour")
+    assert result["error"] == "Erreur HTTP: 500"
+    assert ollama_server.count("POST", "/api/generate") == 1
+
+    ollama_server.generate_status = 200
+    bot.probe()
+    assert bot.chat("Bonjour")["success"]
+    bot.close()
+
+def test_modele_absent(ollama_server):
+    bot = make_bot(CofiBotLlama, ollama_server, model="inconnu:1b")
+    available, message = bot.is_available()
+    assert not available
+    assert "inconnu:1b" in message
+    bot.close()
+
+def test_sonde_en_arriere_plan(ollama_server):
+    """La sonde rafraîchit l'état sans attendre un message ; close() l'arrête"""
+    bot = make_bot(OllamaCofiBot, ollama_server, probe_interval=0.05)
+    bot.mark_down("panne simulée")
+    assert not bot.is_ollama_running()
+
+    deadline = time.monotonic() + 5
+    while not bot.is_ollama_running() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert bot.is_ollama_running()
+    assert "mistral:7b" in bot.list_models()
+    assert bot.chat("Bonjour")["response"] == ollama_server.reply
+
+    bot.close()
+    probes = ollama_server.count("GET", "/api/tags")
+    time.sleep(0.2)
+    assert ollama_server.count("GET", "/api/tags") == probes
+
+def test_generations_asynchrones_bornees(ollama_server):
+    """achat() garde au plus `parallel` générations en vol, les autres attendent"""
+    import asyncio
+
+    bot = make_bot(CofiBotLlama, ollama_server, parallel=2)
+    ollama_server.delay = 0.2
+
+    async def run():
+        timings = [{} for _ in range(4)]
+        start = time.perf_counter()
+        results = await asyncio.gather(*(bot.achat(f"Question {i}", timings[i]) for i in range(4)))
+        elapsed = time.perf_counter() - start
+        await bot.aclose()
+        return results, timings, elapsed
+
+    results, timings, elapsed = asyncio.run(run())
+    assert all(result["success"] for result in results)
+    assert ollama_server.max_active == 2
+    assert 0.4 <= elapsed < 0.8 + 0.5  # Deux vagues de deux générations
+    assert max(t["queue"] for t in timings) >= 0.15
+    assert ollama_server.count("GET", "/api/tags") == 1
+
+def test_api_llama_non_bloquante(llama_bot, ollama_server):
+    """/health répond pendant qu'une génération est en cours"""
+    import asyncio
+
+    import httpx
+    import api_with_llama
+
+    ollama_server.delay = 0.5
+
+    async def run():
+        transport = httpx.ASGITransport(app=api_with_llama.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.get("/health")  # Premier sondage, mis en cache
+            chat = asyncio.create_task(client.post("/chat", json={"message": "Bonjour"}))
+            await asyncio.sleep(0.1)
+            start = time.perf_counter()
+            health = await client.get("/health")
+            health_s = time.perf_counter() - start
+            chat_done_before_health = chat.done()
+            chat_response = await chat
+        await llama_bot.aclose()
+        return health, health_s, chat_done_before_health, chat_response
+
+    health, health_s, chat_done_before_health, chat_response = asyncio.run(run())
+    assert health.status_code == 200
+    assert health.json()["generations"]["in_flight"] == 1
+    assert health_s < 0.3
+    assert not chat_done_before_health
+    assert chat_response.status_code == 200
+    assert chat_response.json()["response"] == ollama_server.reply
+
+def test_chat_stream_sse(llama_bot, ollama_server):
+    """/chat/stream relaie les tokens en SSE puis enregistre la réponse complète"""
+    import json
+
+    from fastapi.testclient import TestClient
+    import api_with_llama
+
+    ollama_server.token_delay = 0.01
+
+    with TestClient(api_with_llama.app) as client:
+        with client.stream("POST", "/chat/stream", json={"message": "Bonjour"}) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = []
+            for block in response.iter_text():
+                events.append(block)
+        stats = client.get("/stats").json()["streaming"]
+
+    parsed = []
+    for block in "".join(events).strip().split("\n\n"):
+        event, data = block.split("\n")
+        parsed.append((event[len("event: "):], json.loads(data[len("data: "):])))
+
+    tokens = [data["text"] for event, data in parsed if event == "token"]
+    assert "".join(tokens) == ollama_server.reply
+    assert len(tokens) == len(ollama_server.reply.split(" "))
+    event, done = parsed[-1]
+    assert event == "done"
+    assert done["tokens"] == len(tokens)
+    assert done["tokens_per_s"] == round(len(tokens) / 0.5, 2)  # eval_duration du faux serveur
+    assert 0 < done["ttft_s"] <= done["generation_s"]
+    assert llama_bot.history(done["session_id"])[-1]["bot"] == ollama_server.reply
+    assert stats["streams"] >= 1 and stats["avg_ttft_ms"] is not None
+
+def test_chat_stream_erreurs(llama_bot, ollama_server):
+    """503 avant le flux si Ollama est absent ; événement "error" si la génération échoue"""
+    from fastapi.testclient import TestClient
+    import api_with_llama
+
+    ollama_server.generate_status = 500
+
+    with TestClient(api_with_llama.app) as client:
+        response = client.post("/chat/stream", json={"message": "Bonjour"})
+        assert response.status_code == 200
+        assert response.text.startswith("event: error")
+        assert "Erreur HTTP: 500" in response.text
+        # Backend marqué hors service : le flux suivant est refusé d'emblée
+        assert client.post("/chat/stream", json={"message": "Bonjour"}).status_code == 503
+    assert len(llama_bot.memory) == 0
+
+def test_memoire_sessions_bornee():
+    """LRU, TTL, plafond d'octets et échanges par session"""
+    memory = SessionMemory(max_sessions=2, ttl=60, turns=2, max_bytes=1000)
+    for i in range(3):
+        memory.append("a", {"user": f"q{i}", "bot": f"r{i}"})
+    assert [e["user"] for e in memory.recent("a")] == ["q1", "q2"]
+    assert memory.bytes == 8
+
+    memory.append("b", {"user": "x", "bot": "y"})
+    memory.recent("a")  # "a" redevient la plus récente
+    memory.append("c", {"user": "x", "bot": "y"})
+    assert memory.recent("b") == []
+    assert len(memory) == 2 and memory.evicted == 1
+
+    # Nombre de sessions dépassé (évince "a"), puis plafond d'octets (évince "c")
+    memory.append("gros", {"user": "u" * 999, "bot": ""})
+    assert list(memory.sessions) == ["gros"]
+    assert memory.bytes == 999 and memory.evicted == 3
+
+    memory.ttl = 0.05
+    time.sleep(0.1)
+    assert memory.recent("gros") == []
+    assert memory.expired == 1 and memory.bytes == 0
+
+def test_historique_isole_par_session(llama_bot, ollama_server):
+    """Chaque prompt ne contient que la conversation de sa session ; /clear ne touche qu'elle"""
+    from fastapi.testclient import TestClient
+    import api_with_llama
+
+
+    with TestClient(api_with_llama.app) as client:
+        alice = client.post("/chat", json={"message": "Mon badge est le 4242", "session_id": "alice"}).json()
+        assert alice["session_id"] == "alice"
+        client.post("/chat", json={"message": "Quel temps fait-il ?", "session_id": "bob"})
+        anonymous = client.post("/chat", json={"message": "Bonjour"}).json()
+        assert anonymous["session_id"] not in ("alice", "bob")
+
+        prompts = [payload["prompt"] for payload in ollama_server.payloads]
+        assert "4242" not in prompts[1] and "4242" not in prompts[2]
+
+        client.post("/chat", json={"message": "Et mon badge ?", "session_id": "alice"})
+        assert "4242" in ollama_server.payloads[-1]["prompt"]
+        assert "Quel temps" not in ollama_server.payloads[-1]["prompt"]
+
+        assert client.post("/clear").status_code == 422
+        assert client.post("/clear", params={"session_id": "alice"}).status_code == 200
+        assert llama_bot.history("alice") == []
+        assert len(llama_bot.history("bob")) == 1
+
+def test_mode_contexte_ne_preremplit_que_le_nouveau_message(ollama_server):
+    """Mode "context" : le contexte Ollama est renvoyé, le transcript et le prompt système ne le sont plus"""
+    import asyncio
+
+    bot = make_bot(CofiBotLlama, ollama_server, context_mode="context")
+    timings = {}
+    assert bot.chat("Mon badge est le 4242", timings, session_id="alice")["success"]
+    first = ollama_server.payloads[-1]
+    assert "context" not in first and bot.system_prompt in first["prompt"]
+    assert first["keep_alive"] == bot.keep_alive
+    assert timings["prefill"] > 0
+
+    assert bot.chat("Et mon badge ?", timings, session_id="alice")["success"]
+    second = ollama_server.payloads[-1]
+    assert second["context"] and second["prompt"] == "Utilisateur: Et mon badge ?\nCofiBot: "
+
+    # Streaming : même contexte prolongé, préremplissage rapporté
+    async def run():
+        stats = {}
+        chunks = [chunk async for chunk in bot.astream("Merci", stats, session_id="alice")]
+        await bot.aclose()
+        return chunks, stats
+
+    chunks, stats = asyncio.run(run())
+    assert "".join(chunks) == ollama_server.reply
+    assert ollama_server.payloads[-1]["context"][:len(second["context"])] == second["context"]
+    assert stats["prompt_tokens"] == 3 and stats["prefill_s"] > 0
+
+    # Une autre session ne voit pas ce contexte ; un contexte trop long est abandonné
+    bot.chat("Bonjour", session_id="bob")
+    assert "context" not in ollama_server.payloads[-1]
+    bot.context_tokens = 10
+    bot.chat("Encore une question", session_id="alice")
+    assert bot.memory.context("alice") is None
+    bot.chat("Et la suivante ?", session_id="alice")
+    assert bot.system_prompt in ollama_server.payloads[-1]["prompt"]
+
+    bot.clear_history("bob")
+    assert bot.memory.context("bob") is None
+
+def test_cache_generations(ollama_server, tmp_path):
+    """Question d'ouverture déjà posée : servie sans Ollama, y compris après redémarrage"""
+    path = str(tmp_path / "llm_cache.db")
+    bot = make_bot(CofiBotLlama, ollama_server, cache=GenerationCache(path=path, similarity=0.6))
+    assert not bot.chat("Comment faire une demande de congés ?", session_id="a")["cached"]
+
+    # Même question normalisée (casse, accents, ponctuation), puis question voisine
+    result = bot.chat("comment faire une demande de conges", session_id="b")
+    assert result["cached"] and result["response"] == ollama_server.reply
+    assert bot.chat("Comment faire une demande de congé ?", session_id="c")["cached"]
+    assert ollama_server.count("POST", "/api/generate") == 1
+    assert bot.history("b")[-1]["bot"] == ollama_server.reply
+
+    # En cours de conversation, la réponse dépend de l'historique : pas de cache
+    assert not bot.chat("Comment faire une demande de congés ?", session_id="a")["cached"]
+    # Un autre modèle ou un autre indice ne partage pas les réponses
+    assert not bot.chat("Comment faire une demande de congés ?", hint="Intention probable : conges",
+                        session_id="d")["cached"]
+
+    stats = bot.get_stats()["cache"]
+    assert (stats["hits"], stats["near_hits"], stats["misses"]) == (1, 1, 2)
+    assert stats["saved_generation_s"] > 0
+
+    # Niveau disque : relu par une nouvelle instance
+    restarted = make_bot(CofiBotLlama, ollama_server, cache=GenerationCache(path=path))
+    assert restarted.chat("Comment faire une demande de congés ?", session_id="e")["cached"]
+    restarted.model = "mistral:7b"
+    assert not restarted.chat("Comment faire une demande de congés ?", session_id="f")["cached"]
+    bot.close()
+    restarted.close()
+
+def test_cache_generations_lru_et_ttl():
+    cache = GenerationCache(capacity=2, ttl=60, path=None)
+    for question in ("un", "deux", "trois"):
+        cache.put("ns", question, f"réponse {question}", 1.0)
+    assert cache.get("ns", "un") is None
+    assert cache.get("ns", "Deux !").response == "réponse deux"
+
+    cache.ttl = 0.05
+    time.sleep(0.1)
+    assert cache.get("ns", "trois") is None
+    assert cache.stats()["hit_rate"] == round(1 / 3, 4)
+
+def test_echange_sans_session_non_garde(ollama_server):
+    """session_id=None : prompt sans historique, aucune session créée en mémoire"""
+    bot = make_bot(CofiBotLlama, ollama_server, memory=SessionMemory(max_sessions=1))
+    assert bot.chat("Mon badge est le 4242", session_id="alice")["success"]
+    for _ in range(3):
+        assert bot.chat("Question anonyme", session_id=None)["success"]
+    assert bot.system_prompt in ollama_server.payloads[-1]["prompt"]
+    assert "4242" not in ollama_server.payloads[-1]["prompt"]
+    assert list(bot.memory.sessions) == ["alice"] and bot.memory.evicted == 0
+    bot.close()
+
+def test_cache_disque_hors_boucle_asyncio(ollama_server, tmp_path):
+    """achat() : lectures et écritures SQLite du cache faites dans un thread, pas dans la boucle"""
+    import asyncio
+    import threading
+
+    cache = GenerationCache(path=str(tmp_path / "llm_cache.db"))
+    bot = make_bot(CofiBotLlama, ollama_server, cache=cache)
+    threads = []
+    for name in ("_disk_get", "_disk_put"):
+        method = getattr(cache, name)
+
+        def recorded(*args, _method=method, _name=name):
+            threads.append((_name, threading.current_thread()))
+            return _method(*args)
+        setattr(cache, name, recorded)
+
+    async def run():
+        first = await bot.achat("Où est la cantine ?", session_id="a")
+        cache.entries.clear()  # Oblige à relire le niveau disque
+        second = await bot.achat("Où est la cantine ?", session_id="b")
+        await bot.aclose()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert not first["cached"] and second["cached"]
+    assert [name for name, _ in threads] == ["_disk_get", "_disk_put", "_disk_get"]
+    assert all(thread is not threading.main_thread() for _, thread in threads)
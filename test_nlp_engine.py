@@ -0,0 +1,115 @@
+import json
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+from nlp.artifact import current_artifact, load_artifact, save_artifact
+from nlp.engine import NativeScorer
+from nlp.semantic import SemanticMatcher, intents_content_hash, vote
+
+def load_messages():
+    """Patterns d'entraînement + messages hors vocabulaire"""
+    with open("nlp/intents.json", "r", encoding="utf-8") as f:
+        intents = json.load(f)["intents"]
+    messages = [pattern.lower() for intent in intents for pattern in intent["patterns"]]
+    return messages + [
+        "bonjour je voudrais poser mes congés pour la norme iso",
+        "xyz inconnu totalement",
+        "a",
+        "Merci MERCI merci !!",
+    ]
+
+def assert_parity(vectorizer, model, messages):
+    scorer = NativeScorer.from_sklearn(vectorizer, model)
+    expected = model.predict_proba(vectorizer.transform(messages))
+    for message, expected_probas in zip(messages, expected):
+        probas = scorer.predict_proba_one(message)
+        np.testing.assert_allclose(probas, expected_probas, rtol=1e-9, atol=1e-12)
+
+    indices, confidences = scorer.classify(messages)
+    assert list(model.classes_[indices]) == list(model.predict(vectorizer.transform(messages)))
+    np.testing.assert_allclose(confidences, expected.max(axis=1), rtol=1e-9)
+
+def test_parite_modele_livre(workspace):
+    """Le moteur natif reproduit exactement nlp/model.pkl"""
+    vectorizer, model = joblib.load("nlp/model.pkl")
+    assert_parity(vectorizer, model, load_messages())
+
+@pytest.mark.parametrize("options", [
+    {"ngram_range": (1, 3), "sublinear_tf": True},
+    {"ngram_range": (1, 1), "norm": None},
+])
+def test_parite_configurations(workspace, options):
+    """Parité sur d'autres réglages du vectoriseur, y compris le cas binaire"""
+    messages = load_messages()
+    labels = ["a" if i % 2 else "b" for i in range(len(messages))]
+    vectorizer = TfidfVectorizer(**options)
+    X = vectorizer.fit_transform(messages)
+    model = LogisticRegression(max_iter=1000).fit(X, labels)
+    assert_parity(vectorizer, model, messages)
+
+def test_configuration_non_supportee():
+    """Un vectoriseur personnalisé est refusé explicitement"""
+    vectorizer = TfidfVectorizer(stop_words=["le", "la"]).fit(["le chat", "la souris"])
+    model = LogisticRegression().fit(vectorizer.transform(["le chat", "la souris"]), ["x", "y"])
+    with pytest.raises(ValueError):
+        NativeScorer.from_sklearn(vectorizer, model)
+
+def test_artefact_mappe_en_memoire(workspace):
+    """L'artefact .npy rechargé en mmap donne les mêmes probabilités que le pickle"""
+    vectorizer, model = joblib.load("nlp/model.pkl")
+    content_hash = save_artifact(vectorizer, model, "nlp/model_artifact")
+    assert save_artifact(vectorizer, model, "nlp/model_artifact") == content_hash
+
+    mapped_vectorizer, mapped_model, manifest = load_artifact("nlp/model_artifact")
+    assert manifest["content_hash"] == content_hash
+    assert manifest["path"] == current_artifact("nlp/model_artifact")
+    assert isinstance(mapped_vectorizer.idf_, np.memmap)
+    assert isinstance(mapped_model.coef_.base, np.memmap)
+
+    messages = load_messages()
+    np.testing.assert_allclose(
+        mapped_model.predict_proba(mapped_vectorizer.transform(messages)),
+        model.predict_proba(vectorizer.transform(messages))
+    )
+    # Le moteur natif lit les coefficients mappés sans les copier
+    scorer = NativeScorer.from_sklearn(mapped_vectorizer, mapped_model)
+    assert np.shares_memory(scorer.coef_by_feature, mapped_model.coef_)
+    assert_parity(mapped_vectorizer, mapped_model, messages)
+
+def test_vote_plus_proches_voisins():
+    """Vote pondéré par la similarité ; voisins absents (-1) ignorés"""
+    pattern_tags = ["conges", "conges", "salutation", "iso"]
+    neighbours = np.array([[0, 1, 2], [2, 3, -1], [-1, -1, -1]])
+    similarities = np.array([[0.9, 0.8, 0.95], [0.3, 0.6, 0.0], [0.0, 0.0, 0.0]])
+    tags, confidences = vote(pattern_tags, neighbours, similarities, 3)
+    assert tags == ["conges", "iso", None]
+    np.testing.assert_allclose(confidences, [1.7 / 3, 0.2, 0.0])
+
+def test_empreinte_intentions():
+    """L'index est réutilisé tant que patterns, tags et modèle d'embeddings sont identiques"""
+    intents = [{"tag": "a", "patterns": ["x", "y"], "responses": ["r"]}]
+    reference = intents_content_hash(intents, "modele")
+    assert intents_content_hash([{**intents[0], "responses": ["autre"]}], "modele") == reference
+    assert intents_content_hash([{**intents[0], "patterns": ["x"]}], "modele") != reference
+    assert intents_content_hash(intents, "autre_modele") != reference
+
+def test_matcher_semantique_persiste(workspace, tmp_path):
+    """Index encodé une fois puis relu ; patterns d'entraînement reconnus"""
+    pytest.importorskip("faiss")
+    pytest.importorskip("sentence_transformers")
+    with open("nlp/intents.json", "r", encoding="utf-8") as f:
+        intents = json.load(f)["intents"]
+    index_dir = str(tmp_path / "semantic_index")
+
+    matcher = SemanticMatcher.build(intents, index_dir, k=3)
+    tags, confidences = matcher.classify([intent["patterns"][0].lower() for intent in intents])
+    assert tags == [intent["tag"] for intent in intents]
+    assert (confidences > 0).all()
+
+    reloaded = SemanticMatcher.load(matcher.path, encoder=matcher.encoder, k=3)
+    assert reloaded.content_hash == matcher.content_hash
+    np.testing.assert_array_equal(np.asarray(reloaded.vectors), matcher.vectors)
@@ -0,0 +1,82 @@
+import json
+
+import numpy as np
+
+from nlp import train_nlp
+from nlp.incremental import IncrementalTrainer
+
+def load_intents():
+    with open("nlp/intents.json", "r", encoding="utf-8") as f:
+        return json.load(f)["intents"]
+
+CANTINE = {
+    "tag": "cantine",
+    "patterns": ["menu de la cantine", "on mange quoi à midi", "horaires du restaurant d'entreprise"],
+    "responses": ["Le menu est affiché à l'entrée du restaurant."]
+}
+
+def test_incremental_nouvelle_classe(workspace):
+    """Ajouter une intention n'encode que ses patterns et ne réajuste qu'elle"""
+    trainer = IncrementalTrainer()
+    intents = load_intents()
+    assert trainer.update(intents)["mode"] == "full"
+    n_before = len(trainer.keys)
+
+    delta = trainer.update(intents + [CANTINE])
+    assert delta == {"mode": "incremental", "added": 3, "removed": 0, "refit_intents": 1}
+    assert len(trainer.keys) == n_before + 3
+    assert "cantine" in trainer.model.classes_
+    X = trainer.vectorizer.transform(["on mange quoi à midi"])
+    assert trainer.model.predict(X)[0] == "cantine"
+
+    delta = trainer.update(intents)
+    assert delta == {"mode": "incremental", "added": 0, "removed": 3, "refit_intents": 0}
+    assert "cantine" not in trainer.model.classes_
+    assert trainer.update(intents)["mode"] == "noop"
+
+def test_incremental_proche_du_reajustement_complet(workspace):
+    """Le delta donne les mêmes prédictions qu'un réajustement complet"""
+    intents = load_intents() + [CANTINE]
+    incremental = IncrementalTrainer()
+    incremental.update(load_intents())
+    incremental.update(intents)
+
+    full = IncrementalTrainer()
+    full.update(intents)
+
+    texts = [pattern for _, pattern in full.keys]
+    X_incremental = incremental.vectorizer.transform(texts)
+    X_full = full.vectorizer.transform(texts)
+    assert list(incremental.model.predict(X_incremental)) == list(full.model.predict(X_full))
+    # Seules les lignes ajoutées s'écartent : les autres intentions ne les ont
+    # pas encore vues comme négatifs (corrigé au réajustement périodique)
+    unchanged = [i for i, (tag, _) in enumerate(full.keys) if tag != "cantine"]
+    np.testing.assert_allclose(incremental.model.predict_proba(X_incremental)[unchanged],
+                               full.model.predict_proba(X_full)[unchanged], atol=0.05)
+
+def test_reajustement_periodique(workspace):
+    """Après full_refit_every deltas, la mise à jour repart de zéro"""
+    trainer = IncrementalTrainer(full_refit_every=1)
+    intents = load_intents()
+    trainer.update(intents)
+    assert trainer.update(intents + [CANTINE])["mode"] == "incremental"
+    assert trainer.update(intents)["mode"] == "full"
+
+def test_recherche_hyperparametres(workspace, monkeypatch):
+    """La recherche croisée choisit un réglage de la grille et enregistre ses métriques"""
+    monkeypatch.setattr(train_nlp, "SEARCH_GRID", {
+        "vectorizer__ngram_range": [(1, 1), (1, 2)],
+        "classifier__C": [1.0, 10.0],
+    })
+    vectorizer, model = train_nlp.train_nlp_model(search=True, n_jobs=2)
+
+    metrics = train_nlp.load_metrics()
+    tags = sorted(intent["tag"] for intent in load_intents())
+    assert metrics["training_mode"] == "search"
+    assert 0.0 <= metrics["accuracy"] <= 1.0
+    assert 0.0 <= metrics["macro_f1"] <= 1.0
+    assert sorted(metrics["recall_per_intent"]) == tags
+    assert metrics["best_params"]["C"] in (1.0, 10.0)
+    assert tuple(vectorizer.ngram_range) == tuple(metrics["best_params"]["ngram_range"])
+    assert metrics["inference_us_per_message"] > 0
+    assert list(model.classes_) == tags